@@ -62,7 +62,7 @@ try:
     NODE_DISPLAY_NAME_MAPPINGS.update({
         "BrainsXDEV_Florence2Adapter": "Brains-XDEV • Florence2 Adapter (Transformers)",
         "BrainsXDEV_WD14Adapter": "Brains-XDEV • WD14 Adapter (ONNX)",
-        "BrainsXDEV_Tagger": "Brains-XDEV • Tagger (stub)",
+        "BrainsXDEV_Tagger": "Brains-XDEV • Tagger (WD14)",
         "BrainsXDEV_Captioner": "Brains-XDEV • Captioner (stub)",
         "BrainsXDEV_Scorer": "Brains-XDEV • Scorer (manual)",
         "BrainsXDEV_PromptSuggester": "Brains-XDEV • Prompt Suggester",
@@ -71,6 +71,11 @@ try:
     
     print("[Brains-XDEV] PromptBrain AI nodes loaded")
     
+    # Warm configured models in the background and when queued prompts use the adapters
+    from .promptbrain.preloader import preload_configured, install_prompt_hook
+    preload_configured()
+    install_prompt_hook()
+    
 except ImportError as e:
     print(f"[Brains-XDEV] PromptBrain AI nodes not available: {e}")
 
@@ -14,8 +14,13 @@ Example workflow:
 - KSampler → Image → Auto Quality Rater → quality score + report
 - Use the score to filter good vs bad generations
 - Feed scores back to Memory Teacher for automated learning
+- Batch mode: rate a whole batch at once; slices of the batch are scored in
+  parallel on a shared thread pool (the NumPy metric kernels release the GIL)
 """
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Any
+import os
+import threading
 
 # Import the advanced node we're wrapping
 try:
@@ -24,6 +29,38 @@ except ImportError:
     print("[Brains-XDEV] Warning: brain_datatype not found for Auto Quality Rater")
     BrainsXDEV_PromptBrainQualityScore = None
 
+# Batch slices scored concurrently in batch_mode (1 = score the batch in one call)
+SCORING_WORKERS = os.cpu_count() or 1
+
+_SCORING_POOL = None
+_SCORING_POOL_LOCK = threading.Lock()
+
+
+def get_scoring_pool() -> ThreadPoolExecutor:
+    """The shared batch scoring thread pool, created on first use"""
+    global _SCORING_POOL
+    with _SCORING_POOL_LOCK:
+        if _SCORING_POOL is None:
+            _SCORING_POOL = ThreadPoolExecutor(max_workers=max(1, SCORING_WORKERS),
+                                               thread_name_prefix="brains-xdev-quality")
+        return _SCORING_POOL
+
+
+def merge_slice_results(results):
+    """
+    Combine analyze_quality results of consecutive batch slices: the headline
+    outputs come from the slice holding the best image, scores are concatenated
+    and best_index is relative to the whole batch
+    """
+    batch_scores, offsets = [], []
+    for result in results:
+        offsets.append(len(batch_scores))
+        batch_scores.extend(result[7])
+    # First maximum, matching the stable ranking of a single call
+    best_index = max(range(len(batch_scores)), key=lambda i: (batch_scores[i], -i))
+    chunk = max(i for i, offset in enumerate(offsets) if offset <= best_index)
+    return results[chunk], batch_scores, best_index
+
 
 class BrainsXDEV_AutoQualityRater:
     """
@@ -53,19 +90,26 @@ class BrainsXDEV_AutoQualityRater:
                     "default": False,
                     "tooltip": "True = stricter ratings, False = more forgiving"
                 }),
+                "batch_mode": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Rate every image in the batch, slices scored in parallel (off = rate the first image only)"
+                }),
             }
         }
     
-    RETURN_TYPES = ("FLOAT", "STRING", "STRING")
-    RETURN_NAMES = ("quality_score", "rating_report", "quality_grade")
+    RETURN_TYPES = ("FLOAT", "STRING", "STRING", "LIST")
+    RETURN_NAMES = ("quality_score", "rating_report", "quality_grade", "batch_scores")
     FUNCTION = "rate_image"
     CATEGORY = "Brains-XDEV/Beginner"
     NODE_NAME = "BrainsXDEV_AutoQualityRater"
     DESCRIPTION = "Automatically rate image quality with AI (0-10 scale)"
     
+    def __init__(self):
+        self._quality_node = None
+    
     def rate_image(self, generated_image, image_description: str, 
                   rating_focus: str = "overall_quality",
-                  strict_mode: bool = False) -> Tuple:
+                  strict_mode: bool = False, batch_mode: bool = False) -> Tuple:
         """
         Automatically rate image quality
         
@@ -74,31 +118,38 @@ class BrainsXDEV_AutoQualityRater:
             image_description: Prompt that created the image
             rating_focus: What aspect to focus rating on
             strict_mode: Use stricter or more forgiving scoring
+            batch_mode: Score every image of the batch instead of only the first
+                (slices of the batch run in parallel on the shared scoring pool)
             
         Returns:
-            (quality_score, rating_report, quality_grade) tuple
+            (quality_score, rating_report, quality_grade, batch_scores) tuple;
+            the first three describe the best image, batch_scores rates every image 0-10
         """
         
         # Check if advanced node is available
         if BrainsXDEV_PromptBrainQualityScore is None:
             error_msg = "❌ Auto Quality Rater unavailable. Check brain_datatype.py installation."
-            return (0.0, error_msg, "ERROR")
+            return (0.0, error_msg, "ERROR", [])
         
         # Validate inputs
         if generated_image is None:
             error_msg = "❌ No image provided. Connect an image output."
-            return (0.0, error_msg, "ERROR")
+            return (0.0, error_msg, "ERROR", [])
         
         try:
-            # Use the advanced PromptBrainQualityScore node
-            quality_node = BrainsXDEV_PromptBrainQualityScore()
+            # Use the advanced PromptBrainQualityScore node (stateless, so kept across executions)
+            if self._quality_node is None:
+                self._quality_node = BrainsXDEV_PromptBrainQualityScore()
+            quality_node = self._quality_node
+            
+            # Without batch mode only the first image of a [B, H, W, C] batch is rated
+            if not batch_mode and getattr(generated_image, "ndim", 0) == 4:
+                generated_image = generated_image[:1]
             
             # Set scoring model based on strict mode
             scoring_model = "conservative" if strict_mode else "balanced"
             
-            # Call the quality analysis function
-            result = quality_node.analyze_quality(
-                image=generated_image,
+            options = dict(
                 caption=image_description,
                 scoring_criteria=rating_focus,
                 analysis_depth="standard",
@@ -111,8 +162,23 @@ class BrainsXDEV_AutoQualityRater:
                 enable_semantic_analysis=bool(image_description.strip())
             )
             
-            # Unpack result (quality_score, detailed_analysis, quality_grade, technical_score, artistic_score, semantic_score)
-            raw_score, detailed_analysis, grade, tech_score, art_score, sem_score = result
+            # Call the quality analysis function; batches are split into one slice per worker
+            count = generated_image.shape[0] if getattr(generated_image, "ndim", 0) == 4 else 1
+            slices = min(SCORING_WORKERS, count) if batch_mode else 1
+            if slices > 1:
+                bounds = [count * i // slices for i in range(slices + 1)]
+                pool = get_scoring_pool()
+                futures = [pool.submit(quality_node.analyze_quality, image=generated_image[start:stop], **options)
+                           for start, stop in zip(bounds[:-1], bounds[1:])]
+                result, raw_batch_scores, best_index = merge_slice_results([f.result() for f in futures])
+            else:
+                result = quality_node.analyze_quality(image=generated_image, **options)
+                raw_batch_scores = result[7] if len(result) > 7 else [result[0]]
+                best_index = result[9] if len(result) > 9 else 0
+            
+            # Unpack result (quality_score, detailed_analysis, quality_grade, technical_score, artistic_score, semantic_score, ...)
+            raw_score, detailed_analysis, grade, tech_score, art_score, sem_score = result[:6]
+            batch_scores = [score * 10.0 for score in raw_batch_scores]
             
             # Convert 0.0-1.0 score to 0-10 scale for beginners
             score_0_to_10 = raw_score * 10.0
@@ -140,6 +206,7 @@ Grade: {grade}
 
 Rating Focus: {rating_focus.replace('_', ' ').title()}
 Mode: {'Strict' if strict_mode else 'Balanced'}
+Batch: {len(batch_scores)} image(s) rated, best is #{best_index + 1}
 
 {detailed_analysis[:500]}{'...' if len(detailed_analysis) > 500 else ''}
 
@@ -148,14 +215,14 @@ Mode: {'Strict' if strict_mode else 'Balanced'}
             
             print(f"[Brains-XDEV] 🎯 Auto Quality Rater: {score_0_to_10:.1f}/10 ({grade})")
             
-            return (score_0_to_10, report, grade)
+            return (score_0_to_10, report, grade, batch_scores)
             
         except Exception as e:
             error_msg = f"❌ Error during quality rating: {str(e)}"
             print(f"[Brains-XDEV] {error_msg}")
             import traceback
             traceback.print_exc()
-            return (0.0, error_msg, "ERROR")
+            return (0.0, error_msg, "ERROR", [])
 
 
 # Export for registration
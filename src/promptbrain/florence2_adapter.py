@@ -9,9 +9,31 @@ Fixed compatibility issues with newer Transformers versions:
 - Fallback model loading for older Transformers versions
 - Proper pad_token_id handling for generation
 
+backend="onnx" runs an export made by tools/export_florence2_onnx.py on ONNX
+Runtime instead (see florence2_onnx.py); transformers is only imported when a
+transformers-backend model is first loaded.
+
+Models can be loaded and warmed ahead of time on a background thread (see
+preloader.py); the node then only waits for that load to finish.
+
+Models live in a process-wide manager (FLORENCE2_MODELS) that keeps several
+Florence-2 checkpoints loaded under a memory budget, evicts the least recently
+used, and can unload idle models.
+
+KV cache: some Florence-2 remote-code revisions mishandle past_key_values on
+newer Transformers, so caching used to be disabled outright. A one-off probe
+per loaded model now compares cached and uncached greedy decoding and enables
+the cache only where they agree (decoding is then linear in output length).
+
+Batches are captioned together: model.generate runs over micro-batches of the
+IMAGE tensor, returning one caption per image. Images are resized and normalized
+directly in torch with the processor's size/mean/std (on the model's device);
+the float -> uint8 -> PIL -> processor path is only a fallback.
+
 Requirements:
 - torch
-- transformers >= 4.40
+- transformers >= 4.40 (backend="transformers")
+- onnxruntime + tokenizers (backend="onnx")
 - pillow (optional, for robust preprocessing)
 
 References:
@@ -19,30 +41,249 @@ References:
 - https://huggingface.co/microsoft/Florence-2-base
 """
 from typing import Any, Dict, Tuple, List
+import contextlib
+import importlib.util
+import os
+import re
+import time
 import numpy as np
 
+from .florence2_onnx import Florence2OnnxModel
+from .preloader import PRELOADER, register_preload
+from .resource_cache import ResourceCache, user_cache_dir
+
 print("[Brains-XDEV] florence2_adapter import")
 
 try:
     import torch
-    from transformers import AutoProcessor, AutoModelForCausalLM
-    TRANSFORMERS_AVAILABLE = True
 except ImportError:
-    AutoProcessor = None
-    AutoModelForCausalLM = None
     torch = None
-    TRANSFORMERS_AVAILABLE = False
+
+# transformers is imported on first model load, so backend="onnx" never pays for it
+TRANSFORMERS_AVAILABLE = torch is not None and importlib.util.find_spec("transformers") is not None
+AutoConfig = None
+AutoProcessor = None
+AutoModelForCausalLM = None
+
+
+def _import_transformers():
+    global AutoConfig, AutoProcessor, AutoModelForCausalLM
+    if AutoProcessor is None:
+        from transformers import AutoConfig, AutoProcessor, AutoModelForCausalLM
+
+# Cached int8 weights (cpu_precision="int8"), outside the (possibly read-only) package
+QUANTIZED_DIR = os.path.join(user_cache_dir(), "quantized")
+
+
+def _from_pretrained(model_id: str, dtype):
+    """Processor and eval-mode model with eager attention, falling back for older Transformers."""
+    _import_transformers()
+    try:
+        # Load processor
+        processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+        
+        # Load model with explicit SDPA disable to avoid compatibility issues
+        model = AutoModelForCausalLM.from_pretrained(
+            model_id, 
+            trust_remote_code=True,
+            torch_dtype=dtype,
+            attn_implementation="eager",  # Use eager attention instead of SDPA
+            low_cpu_mem_usage=True
+        ).eval()
+        return processor, model, ""
+        
+    except Exception as e:
+        print(f"[Brains-XDEV] Error loading Florence-2 model: {e}")
+        # Fallback: try without attn_implementation parameter
+        try:
+            print("[Brains-XDEV] Trying fallback model loading...")
+            processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+            
+            model = AutoModelForCausalLM.from_pretrained(
+                model_id, 
+                trust_remote_code=True,
+                torch_dtype=dtype,
+                low_cpu_mem_usage=True
+            ).eval()
+            
+            # Disable SDPA if the attribute exists (compatibility fix)
+            if hasattr(model, 'config') and hasattr(model.config, '_attn_implementation'):
+                model.config._attn_implementation = "eager"
+            return processor, model, " (fallback)"
+            
+        except Exception as e2:
+            print(f"[Brains-XDEV] Fallback loading also failed: {e2}")
+            raise e2
+
+
+def int8_cache_path(model_id: str) -> str:
+    """On-disk location of the int8 weights for model_id (per torch version: packed formats differ)."""
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_id)
+    version = torch.__version__.split("+")[0] if TRANSFORMERS_AVAILABLE else "none"
+    return os.path.join(QUANTIZED_DIR, f"{name}-int8-torch{version}.pt")
+
+
+def _quantize_int8(model):
+    """Dynamic int8 quantization of every nn.Linear (weights int8, activations quantized per call)."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_florence2_int8(model_id: str):
+    """
+    Florence-2 with dynamically quantized int8 Linear layers, on CPU.
+    
+    The first load quantizes the float32 checkpoint and saves the int8
+    state dict under QUANTIZED_DIR. Later loads build the model from its
+    config without reading the float32 checkpoint and restore the saved int8
+    weights into it.
+    """
+    _import_transformers()
+    path = int8_cache_path(model_id)
+    if os.path.exists(path):
+        try:
+            processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+            config = AutoConfig.from_pretrained(model_id, trust_remote_code=True)
+            try:
+                from transformers.modeling_utils import no_init_weights
+            except ImportError:
+                no_init_weights = contextlib.nullcontext
+            # Random init would be overwritten by the cached weights anyway
+            with no_init_weights():
+                skeleton = AutoModelForCausalLM.from_config(config, trust_remote_code=True, torch_dtype=torch.float32)
+            if hasattr(skeleton.config, '_attn_implementation'):
+                skeleton.config._attn_implementation = "eager"
+            model = _quantize_int8(skeleton.eval())
+            model.load_state_dict(torch.load(path, map_location="cpu"))
+            print(f"[Brains-XDEV] Florence-2 int8 weights loaded from {path}")
+            return processor, model
+        except Exception as e:
+            print(f"[Brains-XDEV] Cached int8 weights unusable ({e}), quantizing again")
+    
+    processor, model, _ = _from_pretrained(model_id, torch.float32)
+    began = time.perf_counter()
+    model = _quantize_int8(model)
+    print(f"[Brains-XDEV] Florence-2 quantized to int8 in {time.perf_counter() - began:.1f}s")
+    try:
+        os.makedirs(QUANTIZED_DIR, exist_ok=True)
+        partial = path + ".tmp"
+        torch.save(model.state_dict(), partial)
+        os.replace(partial, path)
+    except OSError as e:
+        print(f"[Brains-XDEV] Could not cache int8 weights: {e}")
+    return processor, model
+
+
+def load_florence2(model_id: str, precision: str = "fp32"):
+    """
+    Load a Florence-2 processor and model onto CUDA when available, else CPU.
+    
+    precision="int8" loads the dynamically quantized CPU model instead
+    (quantized kernels are CPU-only, so it stays on CPU even with CUDA present).
+    """
+    print(f"[Brains-XDEV] Loading Florence-2 model: {model_id} ({precision})")
+    if precision == "int8":
+        processor, model = load_florence2_int8(model_id)
+        print("[Brains-XDEV] Florence-2 model loaded on CPU (int8)")
+        return processor, model
+    
+    dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    processor, model, fallback = _from_pretrained(model_id, dtype)
+    
+    # Move to GPU if available
+    if torch.cuda.is_available():
+        model = model.to("cuda")
+        print(f"[Brains-XDEV] Florence-2 model loaded on CUDA{fallback}")
+    else:
+        print(f"[Brains-XDEV] Florence-2 model loaded on CPU{fallback}")
+    
+    return processor, model
+
+
+def model_nbytes(model) -> int:
+    """Resident size of a torch module's tensors in bytes (state dict, so packed int8 weights count)."""
+    seen = set()
+    total = 0
+    pending = list(model.state_dict().values())
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (tuple, list)):
+            pending.extend(value)
+        elif hasattr(value, "element_size"):
+            # Tied weights appear under several names
+            try:
+                key = (value.data_ptr(), value.numel())
+            except Exception:
+                key = id(value)
+            if key not in seen:
+                seen.add(key)
+                total += value.numel() * value.element_size()
+    return total
+
+
+class Florence2ModelManager(ResourceCache):
+    """
+    Process-wide Florence-2 model cache shared by all adapter instances.
+    
+    Holds several models at once (e.g. base and large in one workflow), evicting
+    the least recently used ones when their combined resident size exceeds
+    budget_mb, and unloading models unused for idle_seconds (0 = keep). Each
+    entry records its load time and resident size for node metadata.
+    """
+    
+    def __init__(self, budget_mb: int = 4096, idle_seconds: int = 0,
+                 loader=None, sizer=None):
+        model_sizer = sizer or model_nbytes
+        super().__init__("Florence-2", budget_mb, idle_seconds,
+                         sizer=lambda pair: model_sizer(pair[1]), on_evict=self._on_unload)
+        self._loader = loader or load_florence2
+    
+    def configure(self, budget_mb: int = None, idle_seconds: int = None):
+        """Update the memory budget / idle timeout; enforced on the next get()."""
+        super().configure(budget_mb if budget_mb is None or budget_mb > 0 else None, idle_seconds)
+    
+    @staticmethod
+    def key(model_id: str, precision: str = "fp32") -> str:
+        """Cache key: each precision of a checkpoint is a separate model."""
+        return model_id if precision == "fp32" else f"{model_id}@{precision}"
+    
+    def get(self, model_id: str, precision: str = "fp32"):
+        """(processor, model, info) for model_id at precision, loading it on a miss."""
+        model_key = self.key(model_id, precision)
+        (processor, model), entry = self.get_or_load(model_key, lambda: self._loader(model_id, precision))
+        info = {
+            "precision": precision,
+            "cache_hit": entry["cache_hit"],
+            "load_seconds": entry["load_seconds"],
+            "resident_mb": round(entry["nbytes"] / 2**20, 1),
+            "loaded_models": self.keys()
+        }
+        return processor, model, info
+    
+    @staticmethod
+    def _on_unload(model_key, pair):
+        """Close exported sessions and release cached GPU memory of an unloaded model."""
+        close = getattr(pair[1], "close", None)
+        if close is not None:
+            close()
+        if TRANSFORMERS_AVAILABLE and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def _load_onnx_export(model_dir: str, precision: str = "fp32"):
+    """Manager loader for backend="onnx": no processor, the export handles preprocessing."""
+    return None, Florence2OnnxModel(model_dir)
+
+
+# Shared by every BrainsXDEV_Florence2Adapter instance
+FLORENCE2_MODELS = Florence2ModelManager()
+FLORENCE2_ONNX_MODELS = Florence2ModelManager(loader=_load_onnx_export, sizer=lambda model: model.nbytes)
+
 
 class BrainsXDEV_Florence2Adapter:
     """
     Florence-2 model adapter for image captioning and vision-language tasks.
     Uses Hugging Face transformers to run Florence-2 models.
     """
-    
-    # Class-level model cache for efficiency
-    _processor = None
-    _model = None
-    _current_model_id = None
 
     @classmethod
     def INPUT_TYPES(cls) -> Dict[str, Dict[str, Any]]:
@@ -53,7 +294,44 @@ class BrainsXDEV_Florence2Adapter:
                 "task_prompt": ("STRING", {"default": "<CAPTION>"}),
                 "max_new_tokens": ("INT", {"default": 64, "min": 8, "max": 256, "step": 1}),
             },
-            "optional": {},
+            "optional": {
+                "micro_batch_size": ("INT", {
+                    "default": 8, "min": 1, "max": 64, "step": 1,
+                    "tooltip": "Images per generate call; lower it if a large batch runs out of memory"
+                }),
+                "kv_cache": (["auto", "on", "off"], {
+                    "default": "auto",
+                    "tooltip": "Reuse attention keys/values while decoding (auto = only if this model's remote code passes a probe)"
+                }),
+                "num_beams": ("INT", {
+                    "default": 1, "min": 1, "max": 8, "step": 1,
+                    "tooltip": "Beam search width (1 = greedy decoding)"
+                }),
+                "early_stopping": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Beam search: stop as soon as num_beams finished candidates exist"
+                }),
+                "model_memory_budget_mb": ("INT", {
+                    "default": 4096, "min": 256, "max": 262144, "step": 256,
+                    "tooltip": "Keep several Florence-2 models loaded up to this combined size; least recently used ones are evicted"
+                }),
+                "idle_unload_seconds": ("INT", {
+                    "default": 0, "min": 0, "max": 86400, "step": 10,
+                    "tooltip": "Unload models not used for this long (0 = keep loaded)"
+                }),
+                "backend": (["transformers", "onnx"], {
+                    "default": "transformers",
+                    "tooltip": "onnx = ONNX Runtime on CPU with an export from tools/export_florence2_onnx.py (no transformers needed)"
+                }),
+                "onnx_model_dir": ("STRING", {
+                    "default": "models/florence2-onnx/Florence-2-base",
+                    "tooltip": "Export directory for backend=onnx (model_id and cpu_precision are ignored)"
+                }),
+                "cpu_precision": (["fp32", "int8"], {
+                    "default": "fp32",
+                    "tooltip": "int8 = dynamically quantized Linear layers on CPU (faster, ~4x smaller weights, cached on disk after the first load)"
+                }),
+            },
             "hidden": {
                 "prompt": "PROMPT",
                 "extra_pnginfo": "EXTRA_PNGINFO",
@@ -61,77 +339,20 @@ class BrainsXDEV_Florence2Adapter:
             }
         }
 
-    RETURN_TYPES = ("STRING", "DICT")
-    RETURN_NAMES = ("caption", "metadata")
+    RETURN_TYPES = ("STRING", "DICT", "LIST")
+    RETURN_NAMES = ("caption", "metadata", "captions")
     FUNCTION = "run"
     CATEGORY = "Brains-XDEV/PromptBrain"
     NODE_NAME = "BrainsXDEV_Florence2Adapter"
 
-    def _ensure_model(self, model_id: str):
-        """Load or reuse the Florence-2 model and processor."""
+    def _ensure_model(self, model_id: str, precision: str = "fp32"):
+        """Load or reuse the Florence-2 processor and model (shared by every adapter instance), plus load info."""
         if not TRANSFORMERS_AVAILABLE:
             raise RuntimeError("Install torch and transformers to use Florence-2 adapter: pip install torch transformers")
         
-        # Load model if not cached or if model_id changed
-        if (self._processor is None or self._model is None or 
-            self._current_model_id != model_id):
-            
-            print(f"[Brains-XDEV] Loading Florence-2 model: {model_id}")
-            
-            try:
-                # Load processor
-                self._processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
-                
-                # Load model with explicit SDPA disable to avoid compatibility issues
-                self._model = AutoModelForCausalLM.from_pretrained(
-                    model_id, 
-                    trust_remote_code=True,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                    attn_implementation="eager",  # Use eager attention instead of SDPA
-                    low_cpu_mem_usage=True
-                ).eval()
-                
-                # Move to GPU if available
-                if torch.cuda.is_available():
-                    self._model = self._model.to("cuda")
-                    print("[Brains-XDEV] Florence-2 model loaded on CUDA")
-                else:
-                    print("[Brains-XDEV] Florence-2 model loaded on CPU")
-                
-                self._current_model_id = model_id
-                
-            except Exception as e:
-                print(f"[Brains-XDEV] Error loading Florence-2 model: {e}")
-                # Fallback: try without attn_implementation parameter
-                try:
-                    print("[Brains-XDEV] Trying fallback model loading...")
-                    self._processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
-                    
-                    self._model = AutoModelForCausalLM.from_pretrained(
-                        model_id, 
-                        trust_remote_code=True,
-                        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                        low_cpu_mem_usage=True
-                    ).eval()
-                    
-                    # Disable SDPA if the attribute exists (compatibility fix)
-                    if hasattr(self._model, 'config') and hasattr(self._model.config, '_attn_implementation'):
-                        self._model.config._attn_implementation = "eager"
-                    
-                    # Move to GPU if available
-                    if torch.cuda.is_available():
-                        self._model = self._model.to("cuda")
-                        print("[Brains-XDEV] Florence-2 model loaded on CUDA (fallback)")
-                    else:
-                        print("[Brains-XDEV] Florence-2 model loaded on CPU (fallback)")
-                    
-                    self._current_model_id = model_id
-                    
-                except Exception as e2:
-                    print(f"[Brains-XDEV] Fallback loading also failed: {e2}")
-                    raise e2
-        
-        return self._processor, self._model
+        # Joins a background preload if one is running (loads inline otherwise)
+        PRELOADER.join(_preload_job({"model_id": model_id, "cpu_precision": precision})[0])
+        return FLORENCE2_MODELS.get(model_id, precision)
 
     def _to_pil(self, arr):
         """Convert numpy array or torch tensor to PIL Image for transformers processing."""
@@ -162,73 +383,255 @@ class BrainsXDEV_Florence2Adapter:
                 arr = np.array(arr)
             return (arr * 255.0).clip(0, 255).astype(np.uint8)
 
-    def run(self, image, model_id: str, task_prompt: str, max_new_tokens: int, 
-            prompt=None, extra_pnginfo=None, unique_id=None) -> Tuple[str, Dict]:
+    def _to_pil_batch(self, image) -> List[Any]:
+        """Split an IMAGE input ([B,H,W,C] tensor/array, list of images, or one HxWxC image) into PIL images."""
+        if isinstance(image, (list, tuple)):
+            frames = list(image)
+        else:
+            if hasattr(image, 'cpu'):
+                image = image.cpu().numpy()
+            arr = np.asarray(image)
+            frames = list(arr) if arr.ndim == 4 else [arr]
+        return [self._to_pil(frame) for frame in frames]
+
+    def _tensor_batch(self, image):
+        """IMAGE input as one float [B,H,W,C] torch tensor (no copy for tensors), or None if it cannot be stacked."""
+        if torch is None:
+            return None
+        try:
+            if isinstance(image, (list, tuple)):
+                frames = [frame if isinstance(frame, torch.Tensor) else torch.from_numpy(np.asarray(frame, dtype=np.float32))
+                          for frame in image]
+                batch = torch.stack([frame[0] if frame.ndim == 4 else frame for frame in frames])
+            elif isinstance(image, torch.Tensor):
+                batch = image
+            else:
+                batch = torch.from_numpy(np.asarray(image, dtype=np.float32))
+        except (RuntimeError, TypeError, ValueError):
+            return None
+        if batch.ndim == 3:
+            batch = batch[None]
+        return batch if batch.ndim == 4 else None
+
+    def _tensor_inputs(self, processor, model, frames, task_prompt: str) -> Dict[str, Any]:
+        """
+        Processor-equivalent model inputs straight from a float [B,H,W,C] tensor in [0,1].
+        
+        Resizes (bicubic, antialiased) and normalizes on the model's device with
+        the image processor's size/mean/std, skipping the uint8 -> PIL -> float
+        round trip. [0,1] floats already equal uint8 pixels times rescale_factor.
+        """
+        image_processor = processor.image_processor
+        size = image_processor.size
+        height, width = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+        device = model.device if hasattr(model, "device") else frames.device
+        
+        x = frames.to(device=device, dtype=torch.float32).permute(0, 3, 1, 2)
+        x = x[:, :3] if x.shape[1] >= 3 else x[:, :1].expand(-1, 3, -1, -1)
+        if tuple(x.shape[-2:]) != (height, width):
+            x = torch.nn.functional.interpolate(x, size=(height, width), mode="bicubic",
+                                                align_corners=False, antialias=True).clamp_(0.0, 1.0)
+        if getattr(image_processor, "do_normalize", True):
+            mean = torch.tensor(image_processor.image_mean, dtype=x.dtype, device=device).view(1, -1, 1, 1)
+            std = torch.tensor(image_processor.image_std, dtype=x.dtype, device=device).view(1, -1, 1, 1)
+            x = (x - mean) / std
+        
+        prompts = [task_prompt] * x.shape[0]
+        if hasattr(processor, "_construct_prompts"):
+            prompts = processor._construct_prompts(prompts)
+        text = processor.tokenizer(prompts, return_tensors="pt", padding=True)
+        return {
+            "input_ids": text["input_ids"].to(device),
+            "attention_mask": text["attention_mask"].to(device),
+            "pixel_values": x.to(next(model.parameters()).dtype)
+        }
+
+    def _move_inputs(self, inputs, model):
+        """Move processor outputs to the model's device, casting float tensors to its dtype."""
+        if not hasattr(model, "device"):
+            return inputs
+        device = model.device
+        model_dtype = next(model.parameters()).dtype
+        return {
+            k: v.to(device=device, dtype=model_dtype) if hasattr(v, 'to') and v.dtype.is_floating_point else v.to(device) if hasattr(v, 'to') else v 
+            for k, v in inputs.items()
+        }
+
+    def _supports_kv_cache(self, processor, model) -> bool:
         """
-        Process image with Florence-2 model and return caption.
+        Probe once per loaded model whether cached decoding is safe.
+        
+        Greedy-decodes a small blank image with and without use_cache; the cache
+        is trusted only if that succeeds and both produce identical tokens.
         """
+        supported = getattr(model, "_brainsxdev_kv_cache", None)
+        if supported is not None:
+            return supported
+        
+        supported = False
         try:
-            # Debug: Check input type
-            print(f"[Brains-XDEV] Florence2 input type: {type(image)}")
-            
-            # Handle image input (single image or batch)
-            if isinstance(image, list):
-                img = image[0]  # Use first image from batch
-            else:
-                img = image
-            
-            print(f"[Brains-XDEV] Florence2 processing image type: {type(img)}, shape: {img.shape if hasattr(img, 'shape') else 'N/A'}")
-            
-            # Load model
-            processor, model = self._ensure_model(model_id)
-            
-            # Convert to PIL Image
-            pil_image = self._to_pil(img)
-            print(f"[Brains-XDEV] Florence2 PIL image created: {type(pil_image)}, size: {pil_image.size if hasattr(pil_image, 'size') else 'N/A'}")
+            from PIL import Image
+            probe_inputs = self._move_inputs(
+                processor(text="<CAPTION>", images=Image.new("RGB", (64, 64), (128, 128, 128)), return_tensors="pt"),
+                model
+            )
+            probe_args = {
+                "max_new_tokens": 8,
+                "do_sample": False,
+                "num_beams": 1,
+                "pad_token_id": processor.tokenizer.pad_token_id if hasattr(processor, 'tokenizer') else None
+            }
+            with torch.no_grad():
+                reference = model.generate(**probe_inputs, use_cache=False, **probe_args)
+                cached = model.generate(**probe_inputs, use_cache=True, **probe_args)
+            supported = reference.shape == cached.shape and bool(torch.equal(reference, cached))
+        except Exception as e:
+            print(f"[Brains-XDEV] Florence2 KV cache probe failed, decoding without cache: {e}")
+        
+        print(f"[Brains-XDEV] Florence2 KV cache {'enabled' if supported else 'disabled'} for this model")
+        model._brainsxdev_kv_cache = supported
+        return supported
+
+    def _caption_batch(self, processor, model, images, task_prompt: str,
+                       max_new_tokens: int, micro_batch_size: int, use_cache: bool = False,
+                       num_beams: int = 1, early_stopping: bool = False) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Caption images in micro-batches of one padded generate call each.
+        
+        images is a float [B,H,W,C] tensor (preprocessed in torch) or a list of
+        PIL images (HF processor). Returns captions in input order and decoding stats (new tokens, generate
+        seconds, tokens/sec, whether the KV cache was used).
+        """
+        pad_token_id = processor.tokenizer.pad_token_id if hasattr(processor, 'tokenizer') else None
+        captions = []
+        generated_tokens = 0
+        generate_seconds = 0.0
+        preprocessing = "pil"
+        step = max(1, int(micro_batch_size))
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
             
-            # Prepare inputs
-            inputs = processor(text=task_prompt, images=pil_image, return_tensors="pt")
+            inputs = None
+            if isinstance(chunk, torch.Tensor):
+                try:
+                    inputs = self._tensor_inputs(processor, model, chunk, task_prompt)
+                    preprocessing = "torch"
+                except (AttributeError, KeyError, TypeError) as e:
+                    # Processor without the expected image config: PIL fallback
+                    print(f"[Brains-XDEV] Florence2 tensor preprocessing unavailable ({e}), using PIL")
+                    chunk = self._to_pil_batch(chunk)
+            if inputs is None:
+                # Same task prompt for every image; padding keeps the text batch rectangular
+                inputs = processor(text=[task_prompt] * len(chunk), images=chunk, return_tensors="pt", padding=True)
+                inputs = self._move_inputs(inputs, model)
             
-            # Move inputs to same device and dtype as model
-            if hasattr(model, "device"):
-                device = model.device
-                model_dtype = next(model.parameters()).dtype
-                inputs = {
-                    k: v.to(device=device, dtype=model_dtype) if hasattr(v, 'to') and v.dtype.is_floating_point else v.to(device) if hasattr(v, 'to') else v 
-                    for k, v in inputs.items()
-                }
-                print(f"[Brains-XDEV] Florence2 inputs moved to {device} with dtype {model_dtype}")
+            generate_args = {
+                "max_new_tokens": int(max_new_tokens),
+                "do_sample": False,
+                "num_beams": int(num_beams),
+                "pad_token_id": pad_token_id
+            }
+            if num_beams > 1:
+                generate_args["early_stopping"] = bool(early_stopping)
             
-            # Generate caption with compatible parameters
+            began = time.perf_counter()
             with torch.no_grad():
-                generated_ids = model.generate(
-                    **inputs, 
-                    max_new_tokens=int(max_new_tokens),
-                    do_sample=False,
-                    num_beams=1,
-                    use_cache=False,  # Disable KV cache to avoid past_key_values issues
-                    pad_token_id=processor.tokenizer.pad_token_id if hasattr(processor, 'tokenizer') else None
-                )
+                try:
+                    generated_ids = model.generate(**inputs, use_cache=use_cache, **generate_args)
+                except Exception as e:
+                    if not use_cache:
+                        raise
+                    # The probe passed but this input did not: fall back for good
+                    print(f"[Brains-XDEV] Florence2 cached decoding failed, retrying without KV cache: {e}")
+                    model._brainsxdev_kv_cache = use_cache = False
+                    generated_ids = model.generate(**inputs, use_cache=False, **generate_args)
+            generate_seconds += time.perf_counter() - began
             
-            # Decode output
-            output_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+            # Decoder outputs start with the decoder start token; padding is not generated text
+            new_tokens = generated_ids[:, 1:]
+            if pad_token_id is not None:
+                generated_tokens += int((new_tokens != pad_token_id).sum())
+            else:
+                generated_tokens += int(new_tokens.numel())
             
-            # Clean up output (Florence-2 sometimes includes the task prompt)
-            if task_prompt in output_text:
-                output_text = output_text.replace(task_prompt, "").strip()
+            # Decode output (Florence-2 sometimes includes the task prompt)
+            for output_text in processor.batch_decode(generated_ids, skip_special_tokens=True):
+                if task_prompt in output_text:
+                    output_text = output_text.replace(task_prompt, "")
+                captions.append(output_text.strip())
+        
+        stats = {
+            "preprocessing": preprocessing,
+            "kv_cache": use_cache,
+            "generated_tokens": generated_tokens,
+            "generate_seconds": round(generate_seconds, 4),
+            "tokens_per_sec": round(generated_tokens / generate_seconds, 2) if generate_seconds > 0 else 0.0
+        }
+        return captions, stats
+
+    def run(self, image, model_id: str, task_prompt: str, max_new_tokens: int, 
+            micro_batch_size: int = 8, kv_cache: str = "auto", num_beams: int = 1,
+            early_stopping: bool = False, model_memory_budget_mb: int = 4096,
+            idle_unload_seconds: int = 0, backend: str = "transformers",
+            onnx_model_dir: str = "models/florence2-onnx/Florence-2-base", cpu_precision: str = "fp32",
+            prompt=None, extra_pnginfo=None, unique_id=None) -> Tuple[str, Dict, List[str]]:
+        """
+        Caption every image of the batch with Florence-2.
+        
+        Returns the first caption (single-image workflows), metadata, and the
+        list of captions aligned to the batch.
+        """
+        try:
+            if backend == "onnx":
+                # Exported graphs on ONNX Runtime (greedy decoding, KV cache always on)
+                model_id = onnx_model_dir
+                FLORENCE2_ONNX_MODELS.configure(model_memory_budget_mb, idle_unload_seconds)
+                PRELOADER.join(_preload_job({"backend": "onnx", "onnx_model_dir": onnx_model_dir})[0])
+                _, model, model_info = FLORENCE2_ONNX_MODELS.get(onnx_model_dir)
+                pil_images = self._to_pil_batch(image)
+                print(f"[Brains-XDEV] Florence2 (onnx) captioning {len(pil_images)} image(s), micro-batch {micro_batch_size}")
+                captions, stats = model.caption(pil_images, task_prompt, max_new_tokens, micro_batch_size)
+            else:
+                # Load model (or reuse it from the shared manager)
+                FLORENCE2_MODELS.configure(model_memory_budget_mb, idle_unload_seconds)
+                processor, model, model_info = self._ensure_model(model_id, cpu_precision)
+                
+                # Preprocess the IMAGE tensor directly; PIL only if it cannot be stacked
+                images = self._tensor_batch(image)
+                if images is None:
+                    images = self._to_pil_batch(image)
+                print(f"[Brains-XDEV] Florence2 captioning {len(images)} image(s), micro-batch {micro_batch_size}")
+                
+                if kv_cache == "auto":
+                    use_cache = self._supports_kv_cache(processor, model)
+                else:
+                    use_cache = kv_cache == "on"
+                
+                captions, stats = self._caption_batch(
+                    processor, model, images, task_prompt, max_new_tokens, micro_batch_size,
+                    use_cache=use_cache, num_beams=num_beams, early_stopping=early_stopping
+                )
+            output_text = captions[0] if captions else ""
             
-            print(f"[Brains-XDEV] Florence2 caption generated: {output_text[:100]}...")
+            print(f"[Brains-XDEV] Florence2 caption generated: {output_text[:100]}... "
+                  f"({stats['tokens_per_sec']} tokens/sec, kv_cache={stats['kv_cache']})")
             
             # Prepare metadata
             metadata = {
                 "model_id": model_id,
+                "backend": backend,
                 "task": task_prompt,
                 "max_tokens": max_new_tokens,
+                "batch_size": len(captions),
+                "micro_batch_size": int(micro_batch_size),
+                "num_beams": int(num_beams),
+                **stats,
+                **model_info,
                 "device": str(model.device) if hasattr(model, "device") else "unknown",
                 "status": "success"
             }
             
-            return (output_text, metadata)
+            return (output_text, metadata, captions)
             
         except Exception as e:
             import traceback
@@ -244,4 +647,83 @@ class BrainsXDEV_Florence2Adapter:
                 "traceback": traceback.format_exc()
             }
             
-            return (error_msg, metadata)
\ No newline at end of file
+            return (error_msg, metadata, [])
+
+
+def compare_int8_to_fp32(model_id: str, pil_images: List[Any], task_prompt: str = "<CAPTION>",
+                         max_new_tokens: int = 64) -> Dict[str, Any]:
+    """
+    Accuracy/latency comparison of cpu_precision="int8" against the float32 CPU path.
+    
+    Captions the same images with both (greedy, KV cache per probe) and reports
+    caption time, speedup, resident size, the share of identical captions and
+    the mean word-level similarity of the int8 captions to the fp32 ones.
+    """
+    import difflib
+    adapter = BrainsXDEV_Florence2Adapter()
+    report = {"model_id": model_id, "images": len(pil_images)}
+    captions = {}
+    for precision, loader in (("fp32", lambda: _from_pretrained(model_id, torch.float32)[:2]),
+                              ("int8", lambda: load_florence2_int8(model_id))):
+        began = time.perf_counter()
+        processor, model = loader()
+        load_seconds = time.perf_counter() - began
+        use_cache = adapter._supports_kv_cache(processor, model)
+        began = time.perf_counter()
+        captions[precision], stats = adapter._caption_batch(
+            processor, model, pil_images, task_prompt, max_new_tokens, 1, use_cache=use_cache
+        )
+        report[precision] = {
+            "load_seconds": round(load_seconds, 2),
+            "caption_seconds": round(time.perf_counter() - began, 3),
+            "tokens_per_sec": stats["tokens_per_sec"],
+            "resident_mb": round(model_nbytes(model) / 2**20, 1)
+        }
+        del processor, model
+    
+    pairs = list(zip(captions["fp32"], captions["int8"]))
+    report["speedup"] = round(report["fp32"]["caption_seconds"] / max(report["int8"]["caption_seconds"], 1e-9), 2)
+    report["exact_match"] = round(sum(a == b for a, b in pairs) / max(len(pairs), 1), 3)
+    report["word_similarity"] = round(
+        sum(difflib.SequenceMatcher(None, a.split(), b.split()).ratio() for a, b in pairs) / max(len(pairs), 1), 3
+    )
+    report["captions"] = [{"fp32": a, "int8": b} for a, b in pairs]
+    return report
+
+def warm_florence2(model_id: str, precision: str = "fp32") -> Dict[str, Any]:
+    """Load model_id into the shared manager and run a tiny caption so the first real one is fast."""
+    if not TRANSFORMERS_AVAILABLE:
+        raise RuntimeError("Install torch and transformers to use Florence-2 adapter: pip install torch transformers")
+    processor, model, info = FLORENCE2_MODELS.get(model_id, precision)
+    
+    from PIL import Image
+    adapter = BrainsXDEV_Florence2Adapter()
+    use_cache = adapter._supports_kv_cache(processor, model)
+    adapter._caption_batch(processor, model, [Image.new("RGB", (64, 64))], "<CAPTION>", 4, 1, use_cache=use_cache)
+    print(f"[Brains-XDEV] Florence-2 {model_id} ({precision}) warmed up")
+    return info
+
+
+def warm_florence2_onnx(model_dir: str) -> Dict[str, Any]:
+    """Create the ONNX sessions for an export and run a tiny caption through them."""
+    from PIL import Image
+    _, model, info = FLORENCE2_ONNX_MODELS.get(model_dir)
+    model.caption([Image.new("RGB", (64, 64))], "<CAPTION>", 4, 1)
+    print(f"[Brains-XDEV] Florence-2 ONNX export {model_dir} warmed up")
+    return info
+
+
+def _preload_job(inputs: Dict[str, Any]):
+    if inputs.get("backend") == "onnx":
+        model_dir = str(inputs.get("onnx_model_dir") or "models/florence2-onnx/Florence-2-base")
+        return (("florence2-onnx", model_dir), lambda: warm_florence2_onnx(model_dir),
+                lambda: model_dir in FLORENCE2_ONNX_MODELS)
+    model_id = str(inputs.get("model_id") or "microsoft/Florence-2-base")
+    precision = inputs.get("cpu_precision") if inputs.get("cpu_precision") in ("fp32", "int8") else "fp32"
+    key = FLORENCE2_MODELS.key(model_id, precision)
+    return (("florence2", key), lambda: warm_florence2(model_id, precision), lambda: key in FLORENCE2_MODELS)
+
+
+register_preload("BrainsXDEV_Florence2Adapter", "florence2", ("model_id", "cpu_precision"), _preload_job)
+register_preload("BrainsXDEV_Florence2Adapter.onnx", "florence2-onnx", ("onnx_model_dir", "backend"),
+                 lambda inputs: _preload_job({**inputs, "backend": "onnx"}))
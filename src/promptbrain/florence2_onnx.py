@@ -0,0 +1,246 @@
+"""
+Brains-XDEV PromptBrain — Florence-2 ONNX Runtime Backend
+
+Runs a Florence-2 model exported by tools/export_florence2_onnx.py with ONNX
+Runtime on CPU: vision encoder, token embedding, text encoder and a two-graph
+decoder (first step + cached steps). Needs neither torch nor transformers:
+the tokenizer is the exported tokenizer.json (tokenizers library) and image
+preprocessing is PIL + NumPy.
+
+Decoding is greedy with the model's forced BOS / no-repeat-ngram settings.
+The decoder's key/value cache stays in ONNX Runtime memory between steps via
+IO binding, so each step only copies the [B, V] logits back to NumPy.
+
+Export directory layout:
+- florence2_onnx.json (preprocessing, special tokens, task prompts, graph files)
+- tokenizer.json
+- vision_encoder.onnx, embed_tokens.onnx, encoder.onnx, decoder.onnx, decoder_with_past.onnx
+
+Requirements:
+- onnxruntime
+- tokenizers
+- numpy, pillow
+"""
+from typing import Any, Dict, List, Tuple
+import json, os, time
+import numpy as np
+
+from .resource_cache import ResourceCache
+
+print("[Brains-XDEV] florence2_onnx import")
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+try:
+    from tokenizers import Tokenizer
+    TOKENIZERS_AVAILABLE = True
+except ImportError:
+    Tokenizer = None
+    TOKENIZERS_AVAILABLE = False
+
+CONFIG_NAME = "florence2_onnx.json"
+
+# (path, providers) -> InferenceSession, shared by every loaded export. Unbounded:
+# graphs are released with their model (Florence2OnnxModel.close) by the adapter's
+# budgeted model manager.
+SESSIONS = ResourceCache("Florence-2 ONNX graph")
+
+
+def _open_session(path: str, providers: Tuple[str, ...]):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=options, providers=list(providers))
+
+
+def session_key(path: str, providers: Tuple[str, ...] = ("CPUExecutionProvider",)):
+    return (os.path.abspath(path), tuple(providers))
+
+
+def get_session(path: str, providers: Tuple[str, ...] = ("CPUExecutionProvider",)):
+    """Cached InferenceSession with all graph optimizations enabled."""
+    sess, _ = SESSIONS.get_or_load(session_key(path, providers), lambda: _open_session(path, providers))
+    return sess
+
+
+def construct_prompt(task_prompt: str, config: Dict[str, Any]) -> str:
+    """Expand a Florence-2 task token into its text prompt (mirrors Florence2Processor)."""
+    for token, text in config.get("task_prompts_without_inputs", {}).items():
+        if token in task_prompt:
+            return text
+    for token, template in config.get("task_prompts_with_input", {}).items():
+        if token in task_prompt:
+            return template.format(input=task_prompt.replace(token, ""))
+    return task_prompt
+
+
+def banned_ngram_tokens(tokens: List[int], size: int) -> List[int]:
+    """Tokens that would repeat an already generated n-gram of the given size."""
+    if size <= 0 or len(tokens) < size:
+        return []
+    prefix = tuple(tokens[len(tokens) - size + 1:])
+    return [tokens[i + size - 1] for i in range(len(tokens) - size + 1)
+            if tuple(tokens[i:i + size - 1]) == prefix]
+
+
+class Florence2OnnxModel:
+    """One exported Florence-2 model: sessions, tokenizer and decoding loop."""
+
+    def __init__(self, model_dir: str, providers: Tuple[str, ...] = ("CPUExecutionProvider",)):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime not installed. Install with: pip install onnxruntime")
+        if not TOKENIZERS_AVAILABLE:
+            raise RuntimeError("tokenizers not installed. Install with: pip install tokenizers")
+        config_path = os.path.join(model_dir, CONFIG_NAME)
+        if not os.path.exists(config_path):
+            raise FileNotFoundError(f"No Florence-2 ONNX export in {model_dir} (run tools/export_florence2_onnx.py)")
+
+        with open(config_path, "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_dir = model_dir
+        self._session_keys = [session_key(os.path.join(model_dir, filename), providers)
+                              for filename in self.config["files"].values()]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.sessions = {
+            name: get_session(os.path.join(model_dir, filename), providers)
+            for name, filename in self.config["files"].items()
+        }
+        self.nbytes = sum(os.path.getsize(os.path.join(model_dir, filename))
+                          for filename in self.config["files"].values())
+        self.device = "cpu (onnxruntime)"
+
+    def close(self):
+        """Release this export's sessions from the shared session cache."""
+        for key in self._session_keys:
+            SESSIONS.unload(key)
+
+    def preprocess(self, pil_images: List[Any]) -> np.ndarray:
+        """[B, 3, H, W] float32 pixel_values: bicubic resize, rescale, normalize (as the HF processor)."""
+        from PIL import Image
+        height, width = self.config["image_size"]
+        mean = np.asarray(self.config["image_mean"], dtype=np.float32)
+        std = np.asarray(self.config["image_std"], dtype=np.float32)
+        scale = np.float32(self.config.get("rescale_factor", 1.0 / 255.0))
+        batch = np.empty((len(pil_images), height, width, 3), dtype=np.float32)
+        for index, image in enumerate(pil_images):
+            batch[index] = np.asarray(image.convert("RGB").resize((width, height), Image.BICUBIC), dtype=np.float32)
+        batch *= scale / std
+        batch -= mean / std
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+    def _run(self, name: str, inputs: Dict[str, Any]):
+        """Run a graph with IO binding; returns its outputs as OrtValues (kept in ORT memory)."""
+        sess = self.sessions[name]
+        binding = sess.io_binding()
+        for spec in sess.get_inputs():
+            value = inputs[spec.name]
+            if isinstance(value, np.ndarray):
+                binding.bind_cpu_input(spec.name, value)
+            else:
+                binding.bind_ortvalue_input(spec.name, value)
+        names = [spec.name for spec in sess.get_outputs()]
+        for name_out in names:
+            binding.bind_output(name_out)
+        sess.run_with_iobinding(binding)
+        return dict(zip(names, binding.get_outputs()))
+
+    def encode(self, pil_images: List[Any], task_prompt: str):
+        """Encoder hidden states and attention mask for the image batch + prompt."""
+        pixel_values = self.preprocess(pil_images)
+        image_features = self._run("vision_encoder", {"pixel_values": pixel_values})["image_features"].numpy()
+
+        prompt = construct_prompt(task_prompt, self.config)
+        ids = np.asarray(self.tokenizer.encode(prompt).ids, dtype=np.int64)
+        input_ids = np.repeat(ids[None], len(pil_images), axis=0)
+        text_embeds = self._run("embed_tokens", {"input_ids": input_ids})["inputs_embeds"].numpy()
+
+        # Image tokens first, then the prompt (Florence2 _merge_input_ids_with_image_features)
+        inputs_embeds = np.concatenate([image_features, text_embeds.astype(image_features.dtype)], axis=1)
+        attention_mask = np.ones(inputs_embeds.shape[:2], dtype=np.int64)
+        hidden = self._run("encoder", {"inputs_embeds": inputs_embeds, "attention_mask": attention_mask})
+        return hidden["last_hidden_state"], attention_mask
+
+    def generate(self, pil_images: List[Any], task_prompt: str, max_new_tokens: int) -> Tuple[List[List[int]], int]:
+        """Greedy decode; returns generated token ids per image and the number of decoding steps."""
+        encoder_hidden, encoder_mask = self.encode(pil_images, task_prompt)
+        config = self.config
+        batch = len(pil_images)
+        eos = config["eos_token_id"]
+        pad = config.get("pad_token_id", eos)
+        forced_bos = config.get("forced_bos_token_id")
+        ngram = int(config.get("no_repeat_ngram_size", 0) or 0)
+        layers = int(config["num_decoder_layers"])
+
+        tokens = [[] for _ in range(batch)]
+        finished = np.zeros(batch, dtype=bool)
+        start_id = int(config["decoder_start_token_id"])
+        step_ids = np.full((batch, 1), start_id, dtype=np.int64)
+        past = None
+        steps = 0
+        for step in range(int(max_new_tokens)):
+            if past is None:
+                outputs = self._run("decoder", {
+                    "input_ids": step_ids,
+                    "encoder_hidden_states": encoder_hidden,
+                    "encoder_attention_mask": encoder_mask
+                })
+                # Cross-attention keys/values are computed once and reused for every step
+                cross = {f"past_key_values.{i}.encoder.{kv}": outputs[f"present.{i}.encoder.{kv}"]
+                         for i in range(layers) for kv in ("key", "value")}
+            else:
+                outputs = self._run("decoder_with_past", {
+                    "input_ids": step_ids,
+                    "encoder_hidden_states": encoder_hidden,
+                    "encoder_attention_mask": encoder_mask,
+                    **past
+                })
+            past = {f"past_key_values.{i}.decoder.{kv}": outputs[f"present.{i}.decoder.{kv}"]
+                    for i in range(layers) for kv in ("key", "value")}
+            past.update(cross)
+            steps += 1
+
+            logits = outputs["logits"].numpy()[:, -1, :].astype(np.float32)
+            if step == 0 and forced_bos is not None:
+                next_ids = np.full(batch, forced_bos, dtype=np.int64)
+            else:
+                for row in range(batch):
+                    banned = banned_ngram_tokens([start_id] + tokens[row], ngram)
+                    if banned:
+                        logits[row, banned] = -np.inf
+                next_ids = logits.argmax(axis=1)
+            next_ids = np.where(finished, pad, next_ids)
+            for row in np.flatnonzero(~finished):
+                tokens[row].append(int(next_ids[row]))
+            finished |= next_ids == eos
+            if finished.all():
+                break
+            step_ids = next_ids[:, None].astype(np.int64)
+        return tokens, steps
+
+    def caption(self, pil_images: List[Any], task_prompt: str, max_new_tokens: int,
+                micro_batch_size: int = 8) -> Tuple[List[str], Dict[str, Any]]:
+        """Captions in input order plus decoding stats (same keys as the transformers path)."""
+        captions = []
+        generated_tokens = 0
+        began = time.perf_counter()
+        step = max(1, int(micro_batch_size))
+        for start in range(0, len(pil_images), step):
+            token_lists, _ = self.generate(pil_images[start:start + step], task_prompt, max_new_tokens)
+            for ids in token_lists:
+                generated_tokens += len(ids)
+                text = self.tokenizer.decode(ids, skip_special_tokens=True)
+                if task_prompt in text:
+                    text = text.replace(task_prompt, "")
+                captions.append(text.strip())
+        seconds = time.perf_counter() - began
+        stats = {
+            "kv_cache": True,
+            "generated_tokens": generated_tokens,
+            "generate_seconds": round(seconds, 4),
+            "tokens_per_sec": round(generated_tokens / seconds, 2) if seconds > 0 else 0.0
+        }
+        return captions, stats
@@ -0,0 +1,185 @@
+"""
+Brains-XDEV PromptBrain — ONNX Runtime Session Factory
+
+One place that builds tuned InferenceSessions for the WD14 adapter and
+tools/enhanced_wd14_tagger.py:
+
+- graph optimization level ALL; the optimized graph is written once to
+  OPTIMIZED_DIR under the user cache directory (optimized_model_filepath) and
+  later sessions load it with optimizations off, skipping the optimizer at startup
+- intra/inter-op thread counts, sequential/parallel execution mode,
+  CPU memory arena / memory pattern and the CUDA arena extend strategy
+- optional ORT profiling to a JSON trace (end_profiling returns the file)
+- provider preference (CUDA, DirectML, CPU) with per-provider fallback
+
+The optimized graph is specific to the ORT version and provider list, both of
+which are part of its cache file name.
+"""
+from typing import Any, List, Optional, Sequence, Tuple
+import hashlib, os
+
+from .resource_cache import user_cache_dir
+
+print("[Brains-XDEV] ort_session import")
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+OPTIMIZED_DIR = os.path.join(user_cache_dir(), "ort_optimized")
+PROFILE_DIR = os.path.join(user_cache_dir(), "ort_profiles")
+
+PREFERRED_PROVIDERS = ("CUDAExecutionProvider", "DmlExecutionProvider", "CPUExecutionProvider")
+EXECUTION_MODES = ["sequential", "parallel"]
+ARENA_STRATEGIES = ["kNextPowerOfTwo", "kSameAsRequested"]
+
+
+class SessionSettings:
+    """Tuning knobs for one InferenceSession (0 threads = ORT default)."""
+
+    __slots__ = ("intra_op_threads", "inter_op_threads", "execution_mode", "memory_arena",
+                 "memory_pattern", "arena_extend_strategy", "optimized_cache", "profiling")
+
+    def __init__(self, intra_op_threads: int = 0, inter_op_threads: int = 0, execution_mode: str = "sequential",
+                 memory_arena: bool = True, memory_pattern: bool = True,
+                 arena_extend_strategy: str = "kNextPowerOfTwo", optimized_cache: bool = True,
+                 profiling: bool = False):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"execution_mode must be one of {EXECUTION_MODES}, got {execution_mode!r}")
+        if arena_extend_strategy not in ARENA_STRATEGIES:
+            raise ValueError(f"arena_extend_strategy must be one of {ARENA_STRATEGIES}, got {arena_extend_strategy!r}")
+        self.intra_op_threads = max(0, int(intra_op_threads))
+        self.inter_op_threads = max(0, int(inter_op_threads))
+        self.execution_mode = execution_mode
+        self.memory_arena = bool(memory_arena)
+        self.memory_pattern = bool(memory_pattern)
+        self.arena_extend_strategy = arena_extend_strategy
+        self.optimized_cache = bool(optimized_cache)
+        self.profiling = bool(profiling)
+
+    @classmethod
+    def from_inputs(cls, inputs: dict) -> "SessionSettings":
+        """Settings from node inputs of the same names (missing ones keep their defaults)."""
+        return cls(**{name: inputs[name] for name in cls.__slots__ if name in inputs})
+
+    def key(self) -> Tuple:
+        """Hashable identity for session caches."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return "SessionSettings(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__) + ")"
+
+
+def resolve_providers(override: Optional[Sequence[str]] = None) -> List[str]:
+    """Providers to try, in order: the override (or PREFERRED_PROVIDERS) filtered to what this ORT build has."""
+    available = ort.get_available_providers()
+    wanted = [p for p in (override or PREFERRED_PROVIDERS) if p in available]
+    return wanted or ["CPUExecutionProvider"]
+
+
+def optimized_model_path(model_path: str, providers: Sequence[str]) -> str:
+    """Cache file for the optimized graph of model_path, keyed by file identity, ORT version and providers."""
+    stat = os.stat(model_path)
+    identity = f"{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{ort.__version__}|{','.join(providers)}"
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(OPTIMIZED_DIR, f"{name}.{digest}.onnx")
+
+
+def session_options(settings: SessionSettings, optimized_path: str = None, cached: bool = False,
+                    profile_prefix: str = None):
+    """SessionOptions for settings; writes the optimized graph to optimized_path unless it is already cached."""
+    options = ort.SessionOptions()
+    if cached:
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    else:
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if optimized_path:
+            options.optimized_model_filepath = optimized_path
+    options.intra_op_num_threads = settings.intra_op_threads
+    options.inter_op_num_threads = settings.inter_op_threads
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if settings.execution_mode == "parallel"
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    options.enable_cpu_mem_arena = settings.memory_arena
+    options.enable_mem_pattern = settings.memory_pattern
+    if profile_prefix:
+        options.enable_profiling = True
+        options.profile_file_prefix = profile_prefix
+    return options
+
+
+def _provider_entries(providers: Sequence[str], settings: SessionSettings) -> List[Any]:
+    """providers= argument with per-provider options (CUDA arena strategy)."""
+    return [(p, {"arena_extend_strategy": settings.arena_extend_strategy}) if p == "CUDAExecutionProvider" else p
+            for p in providers]
+
+
+def _build(model_path: str, providers: Sequence[str], settings: SessionSettings):
+    """Session on exactly these providers, through the optimized-graph cache when enabled."""
+    profile_prefix = None
+    if settings.profiling:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_prefix = os.path.join(PROFILE_DIR, os.path.splitext(os.path.basename(model_path))[0])
+    entries = _provider_entries(providers, settings)
+
+    if not settings.optimized_cache:
+        return ort.InferenceSession(model_path, sess_options=session_options(settings, profile_prefix=profile_prefix),
+                                    providers=entries)
+
+    cache_path = optimized_model_path(model_path, providers)
+    if os.path.exists(cache_path):
+        try:
+            options = session_options(settings, cached=True, profile_prefix=profile_prefix)
+            return ort.InferenceSession(cache_path, sess_options=options, providers=entries)
+        except Exception as e:
+            print(f"[Brains-XDEV] Discarding optimized ONNX graph {os.path.basename(cache_path)}: {e}")
+            os.remove(cache_path)
+
+    os.makedirs(OPTIMIZED_DIR, exist_ok=True)
+    try:
+        options = session_options(settings, optimized_path=cache_path, profile_prefix=profile_prefix)
+        sess = ort.InferenceSession(model_path, sess_options=options, providers=entries)
+        print(f"[Brains-XDEV] Saved optimized ONNX graph: {os.path.basename(cache_path)}")
+        return sess
+    except Exception as e:
+        # Some providers (compiled / DirectML graphs) cannot serialize the optimized model
+        print(f"[Brains-XDEV] Optimized graph not cached for {os.path.basename(model_path)}: {e}")
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        options = session_options(settings, profile_prefix=profile_prefix)
+        return ort.InferenceSession(model_path, sess_options=options, providers=entries)
+
+
+def create_session(model_path: str, settings: SessionSettings = None,
+                   providers: Optional[Sequence[str]] = None) -> Tuple[Any, str]:
+    """
+    (InferenceSession, active provider) for model_path.
+
+    All resolved providers are tried together first, then one at a time,
+    ending on CPU.
+    """
+    if not ONNX_AVAILABLE:
+        raise RuntimeError("onnxruntime not installed. Install with: pip install onnxruntime")
+    settings = settings or SessionSettings()
+    resolved = resolve_providers(providers)
+    attempts = [resolved] + [[p] for p in resolved if len(resolved) > 1]
+    if "CPUExecutionProvider" not in resolved:
+        attempts.append(["CPUExecutionProvider"])
+
+    error = None
+    for attempt in attempts:
+        try:
+            sess = _build(model_path, attempt, settings)
+            return sess, sess.get_providers()[0]
+        except Exception as e:
+            print(f"[Brains-XDEV] ONNX session on {attempt} failed: {e}")
+            error = e
+    raise error
+
+
+def end_profiling(sess) -> str:
+    """Stop profiling sess and return the written trace (chrome://tracing / Perfetto JSON)."""
+    return sess.end_profiling()
@@ -0,0 +1,169 @@
+"""
+Brains-XDEV PromptBrain — Background Model Preloader
+
+Loads and warms AI adapter models (Florence-2, WD14) on a background thread so
+the first node execution does not stall the queue on from_pretrained /
+InferenceSession creation. Adapters register a warm function per node class.
+A node joins a preload that is already running for its model; otherwise it
+loads inline in its own thread (no warm-up inference, no queueing behind
+preloads of other models).
+
+Preloads are triggered:
+- at server start, from the BRAINSXDEV_PRELOAD environment variable, e.g.
+  BRAINSXDEV_PRELOAD="florence2:microsoft/Florence-2-base;wd14:models/wd14/model.onnx|models/wd14/selected_tags.csv"
+- when a queued prompt contains a registered node (ComfyUI on-prompt handler)
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import os, threading
+
+print("[Brains-XDEV] preloader import")
+
+ENV_VAR = "BRAINSXDEV_PRELOAD"
+
+
+class ModelPreloader:
+    """
+    One background thread running keyed warm-up jobs, at most one per key.
+
+    A key whose job finished is not resubmitted unless its is_loaded check
+    reports the model was evicted since; failed jobs are retried on the next
+    request (the node sees the original exception when it waits).
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._futures: Dict[Any, Tuple[Future, Optional[Callable[[], bool]]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, warm: Callable[[], Any], is_loaded: Callable[[], bool] = None) -> Future:
+        """Future for key, starting warm() on the background thread if needed."""
+        with self._lock:
+            current = self._futures.get(key)
+            if current is not None:
+                future, loaded = current
+                if not future.done():
+                    return future
+                if future.exception() is None and (loaded is None or loaded()):
+                    return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="brainsxdev-preload")
+            future = self._executor.submit(warm)
+            self._futures[key] = (future, is_loaded)
+            return future
+
+    def join(self, key, timeout: float = None) -> bool:
+        """
+        Wait for a preload of key that is already running; True when it succeeded.
+
+        A preload still queued behind another model is cancelled, and without
+        a preload there is nothing to wait for: in both cases the caller
+        loads the model inline. A failed preload also returns False, so the
+        caller's own load reports the error.
+        """
+        with self._lock:
+            current = self._futures.get(key)
+            if current is None:
+                return False
+            future = current[0]
+            if future.cancel():
+                del self._futures[key]
+                return False
+        try:
+            future.result(timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def wait(self, key, warm: Callable[[], Any], is_loaded: Callable[[], bool] = None,
+             timeout: float = None):
+        """Block until key is warm (joining an in-flight preload) and return its result."""
+        return self.submit(key, warm, is_loaded).result(timeout=timeout)
+
+    def status(self) -> Dict[str, str]:
+        """Per-key state: pending, ready or failed."""
+        with self._lock:
+            states = {}
+            for key, (future, _) in self._futures.items():
+                if not future.done():
+                    states[str(key)] = "pending"
+                else:
+                    states[str(key)] = "failed" if future.exception() is not None else "ready"
+            return states
+
+
+# Shared by all adapters
+PRELOADER = ModelPreloader()
+
+# node class_type -> (short name, env field names, job builder)
+_REGISTRY: Dict[str, Tuple[str, Tuple[str, ...], Callable[[Dict[str, Any]], Optional[Tuple]]]] = {}
+
+
+def register_preload(class_type: str, name: str, fields: Tuple[str, ...],
+                     job: Callable[[Dict[str, Any]], Optional[Tuple]]):
+    """
+    Register a preloadable node class.
+
+    job(inputs) receives the node's literal inputs and returns
+    (key, warm, is_loaded) or None when the inputs do not name a model.
+    fields maps the values of a BRAINSXDEV_PRELOAD entry ("name:a|b") to inputs.
+    """
+    _REGISTRY[class_type] = (name, tuple(fields), job)
+
+
+def preload(class_type: str, inputs: Dict[str, Any]) -> Optional[Future]:
+    """Start warming the model a node of class_type would load with these inputs."""
+    entry = _REGISTRY.get(class_type)
+    if entry is None:
+        return None
+    # Linked inputs arrive as [node_id, slot]; only literal values name a model
+    literal = {k: v for k, v in inputs.items() if isinstance(v, (str, int, float, bool))}
+    try:
+        job = entry[2](literal)
+    except Exception as e:
+        print(f"[Brains-XDEV] Preload skipped for {class_type}: {e}")
+        return None
+    if job is None:
+        return None
+    key, warm, is_loaded = job
+    return PRELOADER.submit(key, warm, is_loaded)
+
+
+def preload_configured(spec: str = None) -> int:
+    """Preload every model listed in BRAINSXDEV_PRELOAD (or spec); returns the number started."""
+    spec = os.environ.get(ENV_VAR, "") if spec is None else spec
+    by_name = {name: (class_type, fields) for class_type, (name, fields, _) in _REGISTRY.items()}
+    started = 0
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        name, _, values = item.partition(":")
+        if name.strip() not in by_name:
+            print(f"[Brains-XDEV] Unknown preload entry: {item}")
+            continue
+        class_type, fields = by_name[name.strip()]
+        inputs = dict(zip(fields, (value.strip() for value in values.split("|") if value.strip())))
+        if preload(class_type, inputs) is not None:
+            started += 1
+    if started:
+        print(f"[Brains-XDEV] Preloading {started} model(s) in the background")
+    return started
+
+
+def _on_prompt(json_data):
+    """ComfyUI on-prompt handler: warm models for registered nodes in the queued prompt."""
+    try:
+        for node in (json_data.get("prompt") or {}).values():
+            if isinstance(node, dict) and node.get("class_type") in _REGISTRY:
+                preload(node["class_type"], node.get("inputs") or {})
+    except Exception as e:
+        print(f"[Brains-XDEV] Preload on prompt failed: {e}")
+    return json_data
+
+
+def install_prompt_hook() -> bool:
+    """Hook into ComfyUI's prompt queue; False outside a running ComfyUI server."""
+    try:
+        from server import PromptServer
+        PromptServer.instance.add_on_prompt_handler(_on_prompt)
+        return True
+    except Exception:
+        return False
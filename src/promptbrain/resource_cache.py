@@ -0,0 +1,231 @@
+"""
+Brains-XDEV PromptBrain — Shared Resource Cache
+
+Bounded, thread-safe cache for loaded models, ONNX sessions and label tables,
+used by every AI adapter (Florence-2, Florence-2 ONNX graphs, WD14 and the
+enhanced WD14 tagger tool):
+
+- least-recently-used eviction once the combined size exceeds budget_mb
+  (0 = unbounded); the entry being returned is never evicted
+- one load per key: concurrent callers of a missing key wait for the first
+  caller's load instead of loading the model twice, while other keys load
+  in parallel
+- entries unused for idle_seconds are released by a daemon timer (0 = keep)
+- hit / miss / eviction counters and load times in stats()
+
+user_cache_dir() is where every persistent cache file goes (quality metrics
+DB, int8 weights, optimized ONNX graphs).
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+import os, threading, time
+
+print("[Brains-XDEV] resource_cache import")
+
+
+def user_cache_dir() -> str:
+    """Per-user cache directory for Brains-XDEV files (outside the package, which may be read-only)"""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "brains-xdev")
+
+
+def file_nbytes(path: str) -> int:
+    """Size of a model file, the resident-size estimate for ONNX sessions."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ResourceCache:
+    """
+    Keyed cache of loaded resources with a memory budget and idle release.
+
+    sizer(value) gives an entry's resident bytes; on_evict(key, value) runs
+    after an entry is dropped (e.g. to release GPU memory or close sessions).
+    verbose=False silences the per-entry load / unload log lines.
+    """
+
+    def __init__(self, name: str, budget_mb: int = 0, idle_seconds: int = 0,
+                 sizer: Callable[[Any], int] = None, on_evict: Callable[[Any, Any], None] = None,
+                 verbose: bool = True):
+        self.name = name
+        self.verbose = verbose
+        self.budget_mb = budget_mb
+        self.idle_seconds = idle_seconds
+        self._sizer = sizer or (lambda value: 0)
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._load_locks: Dict[Any, threading.Lock] = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "idle_releases": 0, "load_seconds": 0.0}
+
+    def configure(self, budget_mb: int = None, idle_seconds: int = None):
+        """Update the memory budget / idle timeout; enforced on the next get_or_load()."""
+        with self._lock:
+            if budget_mb is not None and budget_mb >= 0:
+                self.budget_mb = budget_mb
+            if idle_seconds is not None and idle_seconds >= 0:
+                self.idle_seconds = idle_seconds
+
+    def get_or_load(self, key, loader: Callable[[], Any], nbytes: int = None) -> Tuple[Any, Dict[str, Any]]:
+        """
+        (value, info) for key, calling loader() once on a miss; info has cache_hit,
+        load_seconds and nbytes (given, e.g. a model file size, or from sizer).
+        """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    return self._hit(key)
+                load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+            with load_lock:
+                with self._lock:
+                    # Loaded by a concurrent caller while this one waited
+                    if key in self._entries:
+                        return self._hit(key)
+                    # That caller's load failed and released its lock: register again
+                    if self._load_locks.get(key) is not load_lock:
+                        continue
+                try:
+                    began = time.perf_counter()
+                    value = loader()
+                    size = int(self._sizer(value) if nbytes is None else nbytes)
+                    seconds = round(time.perf_counter() - began, 3)
+                except BaseException:
+                    with self._lock:
+                        self._load_locks.pop(key, None)
+                    raise
+
+                # Publish the entry and release the load lock together, so no caller
+                # can find neither of them and load the key a second time
+                with self._lock:
+                    self._entries[key] = {"value": value, "nbytes": size, "load_seconds": seconds,
+                                          "last_used": time.monotonic()}
+                    self._load_locks.pop(key, None)
+                    self._counters["misses"] += 1
+                    self._counters["load_seconds"] += seconds
+                    if self.verbose:
+                        print(f"[Brains-XDEV] {self.name} {key}: loaded in {seconds}s, {size / 2**20:.0f} MB resident")
+                    evicted = self._evict_over_budget(keep=key)
+                    self._schedule_idle_check()
+            self._evicted(evicted)
+            return value, {"cache_hit": False, "load_seconds": seconds, "nbytes": size}
+
+    def _hit(self, key) -> Tuple[Any, Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            entry["last_used"] = time.monotonic()
+            self._counters["hits"] += 1
+            evicted = self._evict_over_budget(keep=key)
+            self._schedule_idle_check()
+        self._evicted(evicted)
+        return entry["value"], {"cache_hit": True, "load_seconds": entry["load_seconds"], "nbytes": entry["nbytes"]}
+
+    def peek(self, key, default=None):
+        """Cached value without loading or touching its recency."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["value"] if entry is not None else default
+
+    def unload(self, key=None) -> List[Any]:
+        """Drop one entry (or all of them); returns the dropped keys."""
+        with self._lock:
+            dropped = self._pop([key] if key is not None else list(self._entries))
+        self._evicted(dropped)
+        return [k for k, _ in dropped]
+
+    def _pop(self, keys) -> List[Tuple[Any, Any]]:
+        """Remove entries (cache lock held); their on_evict runs later via _evicted."""
+        dropped = []
+        for k in keys:
+            entry = self._entries.pop(k, None)
+            if entry is not None:
+                dropped.append((k, entry["value"]))
+                if self.verbose:
+                    print(f"[Brains-XDEV] {self.name} {k} unloaded")
+        return dropped
+
+    def _evicted(self, dropped: List[Tuple[Any, Any]]):
+        """on_evict callbacks, run after the cache lock is released."""
+        if self._on_evict is not None:
+            for k, value in dropped:
+                self._on_evict(k, value)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def keys(self) -> List[Any]:
+        """Cached keys, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Budget, counters and the cached entries with their resident size and load time."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "budget_mb": self.budget_mb,
+                "idle_seconds": self.idle_seconds,
+                "resident_mb": round(sum(e["nbytes"] for e in self._entries.values()) / 2**20, 1),
+                "hits": self._counters["hits"],
+                "misses": self._counters["misses"],
+                "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+                "evictions": self._counters["evictions"],
+                "idle_releases": self._counters["idle_releases"],
+                "load_seconds": round(self._counters["load_seconds"], 3),
+                "models": {
+                    key: {"resident_mb": round(e["nbytes"] / 2**20, 1), "load_seconds": e["load_seconds"]}
+                    for key, e in self._entries.items()
+                }
+            }
+
+    def _evict_over_budget(self, keep) -> List[Tuple[Any, Any]]:
+        """Drop least recently used entries past the budget (cache lock held); returns them."""
+        dropped = []
+        if self.budget_mb <= 0:
+            return dropped
+        budget = self.budget_mb * 2**20
+        while sum(e["nbytes"] for e in self._entries.values()) > budget:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._counters["evictions"] += 1
+            dropped += self._pop([oldest])
+        return dropped
+
+    def _schedule_idle_check(self):
+        if self.idle_seconds <= 0 or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.idle_seconds, self._release_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def release_idle(self, now: float = None) -> List[Any]:
+        """Unload every entry unused for idle_seconds; returns the unloaded keys."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [key for key, e in self._entries.items()
+                    if self.idle_seconds > 0 and now - e["last_used"] >= self.idle_seconds]
+            self._counters["idle_releases"] += len(idle)
+            dropped = self._pop(idle)
+        self._evicted(dropped)
+        return idle
+
+    def _release_idle(self):
+        with self._lock:
+            self._timer = None
+        self.release_idle()
+        with self._lock:
+            if self._entries:
+                self._schedule_idle_check()
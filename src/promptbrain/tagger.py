@@ -1,8 +1,19 @@
 """
-Brains-XDEV PromptBrain — WD14 Tagger (stub)
+Brains-XDEV PromptBrain — WD14 Tagger
 
-Stub implementation for WD14 image tagging. This version provides the interface
-but returns empty results for testing and workflow design purposes.
+Image tagging backed by the ONNX WD14 engine of BrainsXDEV_WD14Adapter (same
+sessions, preprocessing, label categories and vectorized tag selection).
+Workflows wired to the former stub keep their inputs and outputs and get real
+tags once a model is available.
+
+- allow / deny lists are compiled once into frozensets of normalized names and
+  applied as part of tag selection
+- scores are cached by image content hash, so re-running a workflow, or only
+  changing min_conf / allow / deny, does not run the model again
+- batch_mode tags every image of the batch in memory-bounded ONNX calls
+
+Without onnxruntime or the model files the node falls back to the stub
+behaviour (mock tags with allow_list="mock"), flagged with "stub": True.
 
 Migrated from BRAIN project with Brains-XDEV naming conventions.
 
@@ -11,17 +22,42 @@ References:
 - Hidden inputs & server props: https://docs.comfy.org/custom-nodes/backend/more_on_inputs
 """
 from typing import Any, Dict, Tuple, List
+import hashlib, os
 import numpy as np
 
-print("[Brains-XDEV] tagger stub import")
+from .preloader import PRELOADER, register_preload
+from .resource_cache import ResourceCache
+from .wd14_adapter import ONNX_AVAILABLE, BrainsXDEV_WD14Adapter, _preload_job
+from .wd14_postprocess import compile_tag_set, normalize_tag, rating_scores, select_tags
+from .wd14_preprocess import as_batch
+
+print("[Brains-XDEV] tagger import")
+
+MOCK_TAGS = {
+    "1girl": 0.95,
+    "solo": 0.89,
+    "simple_background": 0.75,
+}
+
+# (image hash, model, labels) -> raw score vector, shared by all Tagger instances
+SCORE_CACHE = ResourceCache("Tagger scores", budget_mb=64, sizer=lambda row: row.nbytes, verbose=False)
+
+
+def image_hash(frame: np.ndarray) -> str:
+    """Content hash of one HxWxC float32 image."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(frame.shape).encode("ascii"))
+    digest.update(np.ascontiguousarray(frame).data)
+    return digest.hexdigest()
+
 
 class BrainsXDEV_Tagger:
     """
     Emits a dict of tags -> scores (float 0..1) and a filtered, comma-joined string.
-    This stub does not run a model; it passes through supplied tags (for unit tests & wiring).
-    Replace with calls to ComfyUI-WD14-Tagger node or integrate ONNX runtime.
+    Runs the WD14 ONNX model through the WD14 adapter's engine; without a model it
+    passes through mock tags (for unit tests & wiring).
     """
-    
+
     @classmethod
     def INPUT_TYPES(cls) -> Dict[str, Dict[str, Any]]:
         return {
@@ -31,7 +67,19 @@ class BrainsXDEV_Tagger:
                 "allow_list": ("STRING", {"default": ""}),  # optional whitelist (comma sep)
                 "deny_list": ("STRING", {"default": ""}),   # optional blacklist (comma sep)
             },
-            "optional": {},
+            "optional": {
+                "onnx_model_path": ("STRING", {"default": "models/wd14/wd-v1-4-swinv2-tagger-v2.onnx"}),
+                "labels_csv_path": ("STRING", {"default": "models/wd14/selected_tags.csv"}),
+                "character_threshold": ("FLOAT", {
+                    "default": 0.85, "min": 0.0, "max": 1.0, "step": 0.01,
+                    "tooltip": "Threshold for character tags; min_conf applies to general tags"
+                }),
+                "max_tags": ("INT", {"default": 50, "min": 1, "max": 200, "step": 1}),
+                "batch_mode": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Tag every image of the batch (one line per image, per-image dicts under 'batch'); off tags the first image"
+                }),
+            },
             "hidden": {
                 "prompt": "PROMPT",
                 "extra_pnginfo": "EXTRA_PNGINFO",
@@ -45,41 +93,92 @@ class BrainsXDEV_Tagger:
     CATEGORY = "Brains-XDEV/PromptBrain"
     NODE_NAME = "BrainsXDEV_Tagger"
 
-    def run(self, image, min_conf: float, allow_list: str, deny_list: str, 
+    def __init__(self):
+        self._engine = BrainsXDEV_WD14Adapter()
+
+    def _mock(self, min_conf: float, allow: frozenset, deny: frozenset, allow_list: str) -> Dict[str, float]:
+        """Stub tags: the mock set with allow_list="mock", otherwise none."""
+        if allow_list != "mock":
+            return {}
+        return {tag: score for tag, score in MOCK_TAGS.items()
+                if score >= min_conf and normalize_tag(tag) not in deny}
+
+    def _scores(self, frames: np.ndarray, model_path: str, labels_path: str) -> Tuple[np.ndarray, int]:
+        """[B, N] scores for frames, running the model only on images not seen before; returns misses too."""
+        keys = [(image_hash(frame), model_path, labels_path) for frame in frames]
+        rows = [SCORE_CACHE.peek(key) for key in keys]
+        # First occurrence of each unseen image (duplicates in a batch run once)
+        missing = list({keys[i]: i for i in reversed(range(len(keys))) if rows[i] is None}.values())
+        if missing:
+            PRELOADER.join(_preload_job({"onnx_model_path": model_path, "labels_csv_path": labels_path})[0])
+            sess = self._engine._get_session(model_path)
+            fresh, _ = self._engine._infer_scores(sess, model_path, frames[missing])
+            computed = {keys[i]: row for i, row in zip(missing, fresh)}
+            for key, row in computed.items():
+                SCORE_CACHE.get_or_load(key, lambda row=row: row)
+            rows = [computed[key] if row is None else row for key, row in zip(keys, rows)]
+        return np.stack(rows), len(missing)
+
+    def run(self, image, min_conf: float, allow_list: str, deny_list: str,
+            onnx_model_path: str = "models/wd14/wd-v1-4-swinv2-tagger-v2.onnx",
+            labels_csv_path: str = "models/wd14/selected_tags.csv", character_threshold: float = 0.85,
+            max_tags: int = 50, batch_mode: bool = False,
             prompt=None, extra_pnginfo=None, unique_id=None) -> Tuple[str, Dict]:
         """
-        Stub implementation: return empty tags to keep workflow valid.
-        Replace this with actual WD14 model inference.
+        Tag the first image (or every image with batch_mode) with the WD14 model,
+        falling back to stub output when the model cannot run.
         """
-        
-        # For debugging/testing, we can return some mock tags
-        mock_tags = {
-            "1girl": 0.95,
-            "solo": 0.89,
-            "simple_background": 0.75,
-        } if allow_list == "mock" else {}
-        
-        # Filter tags based on confidence and allow/deny lists
-        filtered_tags = {}
-        for tag, score in mock_tags.items():
-            if score < min_conf:
-                continue
-            if deny_list and tag in deny_list.split(","):
-                continue
-            if allow_list and allow_list != "mock" and tag not in allow_list.split(","):
-                continue
-            filtered_tags[tag] = score
-        
-        # Create comma-separated string
-        tags_text = ", ".join(filtered_tags.keys())
-        
-        # Create result dict with metadata
+        allow = frozenset() if allow_list == "mock" else compile_tag_set(allow_list)
+        deny = compile_tag_set(deny_list)
         tags_dict = {
-            "tags": filtered_tags,
             "min_conf": float(min_conf),
             "allow": allow_list,
             "deny": deny_list,
             "stub": True
         }
-        
-        return (tags_text, tags_dict)
\ No newline at end of file
+
+        reason = None
+        if allow_list == "mock":
+            reason = "mock"
+        elif not ONNX_AVAILABLE:
+            reason = "onnxruntime not installed"
+        elif not os.path.exists(onnx_model_path) or not os.path.exists(labels_csv_path):
+            reason = f"WD14 model or labels not found: {onnx_model_path}, {labels_csv_path}"
+
+        if reason is None:
+            try:
+                frames = as_batch(image)
+                if not batch_mode:
+                    frames = frames[:1]
+                labels = self._engine._load_labels(labels_csv_path)
+                if not len(labels):
+                    raise ValueError(f"no labels loaded from {labels_csv_path}")
+                scores, computed = self._scores(frames, onnx_model_path, labels_csv_path)
+                selected = select_tags(scores, labels, min_conf, character_threshold, max_tags, allow, deny)
+                per_image = [{"tags": dict(tags), "rating": rating, "total_tags": total}
+                             for (tags, total), rating in zip(selected, rating_scores(scores, labels))]
+                tags_dict.update(per_image[0])
+                tags_dict.update({
+                    "stub": False,
+                    "character_threshold": float(character_threshold),
+                    "model": os.path.basename(onnx_model_path),
+                    "cached_images": len(frames) - computed,
+                    "uid": unique_id
+                })
+                if batch_mode:
+                    tags_dict["batch"] = per_image
+                tags_text = "\n".join(", ".join(entry["tags"]) for entry in per_image)
+                return (tags_text, tags_dict)
+            except Exception as e:
+                reason = f"WD14 tagging failed: {e}"
+                print(f"[Brains-XDEV] Tagger: {reason}")
+
+        # Stub output keeps the workflow valid
+        filtered_tags = self._mock(min_conf, allow, deny, allow_list)
+        tags_dict["tags"] = filtered_tags
+        if reason != "mock":
+            tags_dict["reason"] = reason
+        return (", ".join(filtered_tags), tags_dict)
+
+
+register_preload("BrainsXDEV_Tagger", "tagger", ("onnx_model_path", "labels_csv_path"), _preload_job)
@@ -9,15 +9,33 @@ Migrated from BRAIN project with Brains-XDEV naming conventions.
 Requirements:
 - onnxruntime (or onnxruntime-gpu)
 - numpy
-- Models: e.g. wd-v1-4-swinv2-tagger-v2.onnx and its labels.csv
+- Models: e.g. wd-v1-4-swinv2-tagger-v2.onnx and its selected_tags.csv
 
 References:
 - SmilingWolf WD14 models: https://huggingface.co/SmilingWolf
+
+Input layout (NHWC/NCHW), size and pixel convention are read from the model;
+images are padded to a white square and area-resized (wd14_preprocess.py).
+
+Whole IMAGE batches are tagged with a few memory-bounded sess.run calls,
+returning per-image tags plus tags averaged over the batch.
+
+Sessions come from the shared tuned factory in ort_session.py (optimization
+level ALL with an on-disk optimized graph, thread / arena settings, profiling).
+
+Sessions can be created and warmed ahead of time on a background thread
+(see preloader.py), so the first tagging run does not pay the model load.
 """
 from typing import Any, Dict, Tuple, List
-import os, csv
+import os
 import numpy as np
 
+from .preloader import PRELOADER, register_preload
+from .resource_cache import ResourceCache, file_nbytes
+from .ort_session import EXECUTION_MODES, SessionSettings, create_session, end_profiling
+from .wd14_postprocess import WD14Labels, rating_scores, select_tags
+from .wd14_preprocess import WD14InputSpec, get_input_spec, preprocess_batch
+
 print("[Brains-XDEV] wd14_adapter import")
 
 try:
@@ -27,15 +45,21 @@ except ImportError:
     ort = None
     ONNX_AVAILABLE = False
 
+# Combined size of cached WD14 sessions (model files) before the least recently used is dropped
+WD14_SESSION_BUDGET_MB = 2048
+
+# Peak activation memory per image as a multiple of its input tensor (micro-batch sizing)
+WD14_ACTIVATION_FACTOR = 32
+
 class BrainsXDEV_WD14Adapter:
     """
     WD14 ONNX model adapter for high-quality image tagging.
     Uses SmilingWolf's WD14 models for anime/general image classification.
     """
     
-    # Class-level session cache for efficiency
-    _session_cache = {}
-    _labels_cache = {}
+    # Process-wide caches shared by all instances (bounded, one load per key)
+    _session_cache = ResourceCache("WD14 session", budget_mb=WD14_SESSION_BUDGET_MB)
+    _labels_cache = ResourceCache("WD14 labels", budget_mb=64, sizer=lambda labels: labels.nbytes)
 
     @classmethod
     def INPUT_TYPES(cls) -> Dict[str, Dict[str, Any]]:
@@ -48,6 +72,34 @@ class BrainsXDEV_WD14Adapter:
             },
             "optional": {
                 "max_tags": ("INT", {"default": 50, "min": 1, "max": 200, "step": 1}),
+                "character_threshold": ("FLOAT", {
+                    "default": 0.85, "min": 0.0, "max": 1.0, "step": 0.01,
+                    "tooltip": "Threshold for character tags (category 4 in selected_tags.csv); min_conf applies to general tags"
+                }),
+                "batch_memory_mb": ("INT", {
+                    "default": 1024, "min": 64, "max": 65536, "step": 64,
+                    "tooltip": "Memory budget per ONNX call; sets how many images are tagged per run"
+                }),
+                "intra_op_threads": ("INT", {
+                    "default": 0, "min": 0, "max": 256, "step": 1,
+                    "tooltip": "Threads inside one ONNX operator (0 = ONNX Runtime default: all physical cores)"
+                }),
+                "inter_op_threads": ("INT", {
+                    "default": 0, "min": 0, "max": 256, "step": 1,
+                    "tooltip": "Threads running independent operators (parallel execution mode only; 0 = default)"
+                }),
+                "execution_mode": (EXECUTION_MODES, {
+                    "default": "sequential",
+                    "tooltip": "parallel runs independent graph branches concurrently; sequential is usually faster for WD14"
+                }),
+                "memory_arena": ("BOOLEAN", {
+                    "default": True,
+                    "tooltip": "Reuse CPU memory between runs (off lowers idle memory, costs allocation time)"
+                }),
+                "ort_profiling": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Write an ONNX Runtime profile (JSON trace) of this run; its path is added to tags_dict"
+                }),
             },
             "hidden": {
                 "prompt": "PROMPT",
@@ -56,69 +108,78 @@ class BrainsXDEV_WD14Adapter:
             }
         }
     
-    RETURN_TYPES = ("STRING", "DICT")
-    RETURN_NAMES = ("tags_text", "tags_dict")
+    RETURN_TYPES = ("STRING", "DICT", "LIST", "DICT", "STRING")
+    RETURN_NAMES = ("tags_text", "tags_dict", "batch_tags", "merged_tags", "rating")
     FUNCTION = "run"
     CATEGORY = "Brains-XDEV/PromptBrain"
     NODE_NAME = "BrainsXDEV_WD14Adapter"
 
-    def _preprocess(self, img: np.ndarray) -> np.ndarray:
+    def _preprocess_batch(self, image, spec: WD14InputSpec) -> np.ndarray:
         """
-        Preprocess image for WD14 model inference.
-        Expects float32 [0,1], converts to NCHW 224x224.
+        Preprocess a whole IMAGE batch ([B,H,W,C] tensor/array, list, or one HxWxC image)
+        into one contiguous float32 array in the model's layout (see wd14_preprocess.py).
         """
-        h, w, c = img.shape
-        target = 224
-        
-        # Simple nearest-neighbor resize (can be improved with Pillow)
-        y_idx = (np.linspace(0, h-1, target)).astype(np.int32)
-        x_idx = (np.linspace(0, w-1, target)).astype(np.int32)
-        
-        # Create mesh grid and resize
-        resized = img[y_idx][:, x_idx]
+        return preprocess_batch(image, spec)
+
+    def _micro_batch_size(self, sess, inp: np.ndarray, batch_memory_mb: int) -> int:
+        """Images per sess.run: fixed-batch models take 1, otherwise sized to the memory budget."""
+        batch_dim = sess.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim > 0:
+            return batch_dim
+        # Peak activations of the WD14 ViT/ConvNeXt/SwinV2 graphs are a few dozen times the input
+        per_image = inp[0].nbytes * WD14_ACTIVATION_FACTOR
+        return int(max(1, min(len(inp), batch_memory_mb * 2**20 // per_image)))
+
+    def _infer_scores(self, sess, model_path: str, image, batch_memory_mb: int = 1024):
+        """([B, N] scores, number of sess.run calls) for an IMAGE batch."""
+        spec = get_input_spec(sess, model_path)
         
-        # Convert to NCHW format (batch, channels, height, width)
-        chw = np.transpose(resized, (2, 0, 1))[None, ...].astype(np.float32)
+        # Preprocess the whole batch into one contiguous array in the model's input layout
+        inp = self._preprocess_batch(image, spec)
         
-        return chw
+        # Run inference in memory-bounded micro-batches
+        step = self._micro_batch_size(sess, inp, batch_memory_mb)
+        chunks = []
+        for start in range(0, len(inp), step):
+            chunk = inp[start:start + step]
+            chunks.append(sess.run(None, {spec.name: chunk})[0].reshape(len(chunk), -1))
+        return np.concatenate(chunks), len(chunks)
 
-    def _load_labels(self, path: str) -> List[str]:
-        """Load labels from CSV file, with caching."""
-        if path in self._labels_cache:
-            return self._labels_cache[path]
-        
-        labels = []
+    def _build_tags(self, scores: np.ndarray, labels: WD14Labels, min_conf: float, max_tags: int,
+                    character_threshold: float = None):
+        """(top tags sorted by score, number of tags passing) per score row; see wd14_postprocess.py."""
+        character_threshold = min_conf if character_threshold is None else character_threshold
+        return select_tags(scores, labels, min_conf, character_threshold, max_tags)
+
+    def _load_labels(self, path: str) -> WD14Labels:
+        """Load label names and categories from selected_tags.csv, with caching."""
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    # Skip comments and empty rows
-                    if not row or row[0].startswith("#"):
-                        continue
-                    labels.append(row[0].strip())
-            
-            self._labels_cache[path] = labels
-            print(f"[Brains-XDEV] Loaded {len(labels)} WD14 labels from {path}")
+            labels, info = self._labels_cache.get_or_load(path, lambda: WD14Labels.from_csv(path))
+            if not info["cache_hit"]:
+                print(f"[Brains-XDEV] Loaded {len(labels)} WD14 labels from {path} "
+                      f"({len(labels.rating_index)} ratings)")
             
         except Exception as e:
             print(f"[Brains-XDEV] Error loading labels from {path}: {e}")
-            labels = []
+            labels = WD14Labels([], [])
         
         return labels
 
-    def _get_session(self, model_path: str):
-        """Get or create ONNX runtime session with caching."""
-        if model_path in self._session_cache:
-            return self._session_cache[model_path]
+    def _get_session(self, model_path: str, settings: SessionSettings = None):
+        """Get or create a tuned ONNX runtime session, cached per model and settings."""
+        settings = settings or SessionSettings()
+        
+        def load():
+            sess, provider = create_session(model_path, settings)
+            print(f"[Brains-XDEV] Loaded WD14 ONNX model: {os.path.basename(model_path)} ({provider})")
+            return sess
         
         try:
-            # Prefer CUDA if available, fallback to CPU
-            providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
-            sess = ort.InferenceSession(model_path, providers=providers)
-            
-            self._session_cache[model_path] = sess
-            print(f"[Brains-XDEV] Loaded WD14 ONNX model: {os.path.basename(model_path)}")
-            
+            # Profiling stops at end_profiling, so profiled sessions are used for one run only
+            if settings.profiling:
+                return load()
+            sess, _ = self._session_cache.get_or_load((model_path, settings.key()), load,
+                                                      nbytes=file_nbytes(model_path))
             return sess
             
         except Exception as e:
@@ -126,70 +187,121 @@ class BrainsXDEV_WD14Adapter:
             raise
 
     def run(self, image, onnx_model_path: str, labels_csv_path: str, min_conf: float, 
-            max_tags: int = 50, prompt=None, extra_pnginfo=None, unique_id=None) -> Tuple[str, Dict]:
+            max_tags: int = 50, batch_memory_mb: int = 1024, character_threshold: float = 0.85, intra_op_threads: int = 0,
+            inter_op_threads: int = 0, execution_mode: str = "sequential", memory_arena: bool = True,
+            ort_profiling: bool = False, prompt=None, extra_pnginfo=None, unique_id=None) -> Tuple[str, Dict, List[Dict], Dict, str]:
         """
-        Run WD14 inference on the input image.
+        Run WD14 inference on every image of the batch.
+        
+        tags_text/tags_dict describe the first image (single-image workflows),
+        batch_tags holds one tags dict per image and merged_tags thresholds the
+        scores averaged over the batch. Rating labels are not tags: each dict
+        carries the rating head under "rating", and the rating output is the
+        first image's most likely rating.
         """
         try:
             if not ONNX_AVAILABLE:
                 error_msg = "onnxruntime not installed. Install with: pip install onnxruntime"
-                return ("", {"error": error_msg, "tags": {}})
-            
-            # Handle image input
-            if isinstance(image, list):
-                img = image[0]  # Use first image from batch
-            else:
-                img = image
+                return ("", {"error": error_msg, "tags": {}}, [], {"tags": {}}, "")
             
             # Check if model files exist
             if not os.path.exists(onnx_model_path):
                 error_msg = f"ONNX model not found: {onnx_model_path}"
-                return ("", {"error": error_msg, "tags": {}})
+                return ("", {"error": error_msg, "tags": {}}, [], {"tags": {}}, "")
             
             if not os.path.exists(labels_csv_path):
                 error_msg = f"Labels file not found: {labels_csv_path}"
-                return ("", {"error": error_msg, "tags": {}})
-            
-            # Preprocess image
-            inp = self._preprocess(img)
-            
-            # Get ONNX session and run inference
-            sess = self._get_session(onnx_model_path)
-            input_name = sess.get_inputs()[0].name
+                return ("", {"error": error_msg, "tags": {}}, [], {"tags": {}}, "")
             
-            # Run inference
-            scores = sess.run(None, {input_name: inp})[0].reshape(-1)
+            # Get ONNX session (joining a background preload if one is running)
+            settings = SessionSettings(intra_op_threads, inter_op_threads, execution_mode, memory_arena,
+                                       profiling=ort_profiling)
+            if not ort_profiling:
+                PRELOADER.join(_preload_job({"onnx_model_path": onnx_model_path, "labels_csv_path": labels_csv_path,
+                                             "intra_op_threads": intra_op_threads,
+                                             "inter_op_threads": inter_op_threads,
+                                             "execution_mode": execution_mode, "memory_arena": memory_arena})[0])
+            sess = self._get_session(onnx_model_path, settings)
+            scores, calls = self._infer_scores(sess, onnx_model_path, image, batch_memory_mb)
             
             # Load labels
             labels = self._load_labels(labels_csv_path)
             
-            if not labels:
-                return ("", {"error": "no_labels_loaded", "tags": {}})
+            if not len(labels):
+                return ("", {"error": "no_labels_loaded", "tags": {}}, [], {"tags": {}}, "")
             
-            # Build tags dictionary
-            tags = {}
-            for i, score in enumerate(scores[:len(labels)]):
-                if score >= float(min_conf):
-                    tags[labels[i]] = float(score)
+            model_name = os.path.basename(onnx_model_path)
+            batch_tags = []
+            selected = self._build_tags(scores, labels, min_conf, max_tags, character_threshold)
+            for (sorted_tags, total), rating in zip(selected, rating_scores(scores, labels)):
+                batch_tags.append({
+                    "tags": dict(sorted_tags),
+                    "rating": rating,
+                    "min_conf": float(min_conf),
+                    "character_threshold": float(character_threshold),
+                    "max_tags": max_tags,
+                    "model": model_name,
+                    "total_tags": total,
+                    "uid": unique_id
+                })
             
-            # Sort tags by score and limit count
-            sorted_tags = sorted(tags.items(), key=lambda x: x[1], reverse=True)[:max_tags]
-            
-            # Create output
-            tags_text = ", ".join([tag for tag, _ in sorted_tags])
-            
-            tags_dict = {
-                "tags": dict(sorted_tags),
+            # Batch-level tags from the mean score per label
+            mean_scores = scores.mean(axis=0)
+            (merged_sorted, merged_total), = self._build_tags(mean_scores, labels, min_conf, max_tags,
+                                                              character_threshold)
+            merged_tags = {
+                "tags": dict(merged_sorted),
+                "rating": rating_scores(mean_scores, labels)[0],
+                "images": len(batch_tags),
                 "min_conf": float(min_conf),
-                "max_tags": max_tags,
-                "model": os.path.basename(onnx_model_path),
-                "total_tags": len(tags),
-                "uid": unique_id
+                "character_threshold": float(character_threshold),
+                "model": model_name,
+                "total_tags": merged_total
             }
             
-            return (tags_text, tags_dict)
+            if ort_profiling:
+                profile = end_profiling(sess)
+                merged_tags["profile"] = profile
+                batch_tags[0]["profile"] = profile
+                print(f"[Brains-XDEV] WD14 ONNX profile written to {profile}")
+            
+            # Create output
+            tags_dict = batch_tags[0]
+            tags_text = ", ".join(tags_dict["tags"])
+            rating = max(tags_dict["rating"], key=tags_dict["rating"].get) if tags_dict["rating"] else ""
+            print(f"[Brains-XDEV] WD14 tagged {len(batch_tags)} image(s) in {calls} ONNX call(s)")
+            
+            return (tags_text, tags_dict, batch_tags, merged_tags, rating)
             
         except Exception as e:
             error_msg = f"WD14 adapter error: {str(e)}"
             print(f"[Brains-XDEV] {error_msg}")
-            return ("", {"error": error_msg, "tags": {}})
\ No newline at end of file
+            return ("", {"error": error_msg, "tags": {}}, [], {"tags": {}}, "")
+
+def warm_wd14(model_path: str, labels_path: str, settings: SessionSettings = None) -> int:
+    """Create the WD14 session, load its labels and run one white image through it."""
+    if not ONNX_AVAILABLE:
+        raise RuntimeError("onnxruntime not installed. Install with: pip install onnxruntime")
+    adapter = BrainsXDEV_WD14Adapter()
+    sess = adapter._get_session(model_path, settings)
+    labels = adapter._load_labels(labels_path)
+    
+    # One white image through the real preprocessing (also caches the input spec)
+    spec = get_input_spec(sess, model_path)
+    white = np.ones((1, spec.height, spec.width, 3), dtype=np.float32)
+    sess.run(None, {spec.name: adapter._preprocess_batch(white, spec)})
+    print(f"[Brains-XDEV] WD14 {os.path.basename(model_path)} warmed up")
+    return len(labels)
+
+
+def _preload_job(inputs: Dict[str, Any]):
+    model_path = inputs.get("onnx_model_path")
+    if not model_path:
+        return None
+    labels_path = inputs.get("labels_csv_path") or os.path.join(os.path.dirname(model_path), "selected_tags.csv")
+    settings = SessionSettings.from_inputs(inputs)
+    return (("wd14", model_path, labels_path, settings.key()), lambda: warm_wd14(model_path, labels_path, settings),
+            lambda: (model_path, settings.key()) in BrainsXDEV_WD14Adapter._session_cache)
+
+
+register_preload("BrainsXDEV_WD14Adapter", "wd14", ("onnx_model_path", "labels_csv_path"), _preload_job)
@@ -0,0 +1,135 @@
+"""
+Brains-XDEV PromptBrain — WD14 Post-processing
+
+Labels and score → tag selection shared by the WD14 adapter and
+tools/enhanced_wd14_tagger.py.
+
+selected_tags.csv (tag_id,name,category,count) is read once into NumPy arrays.
+Categories: 9 = rating, 0 = general, 4 = character. Rating labels form their
+own head (a distribution over general/sensitive/questionable/explicit) and are
+reported separately, never as tags. Character tags use their own, usually
+higher, threshold.
+
+Selection is vectorized: one comparison against a per-label threshold vector,
+np.nonzero for the passing labels, np.argpartition for the top-k.
+"""
+from typing import Dict, FrozenSet, List, Tuple
+import csv
+import numpy as np
+
+print("[Brains-XDEV] wd14_postprocess import")
+
+CATEGORY_GENERAL = 0
+CATEGORY_CHARACTER = 4
+CATEGORY_RATING = 9
+
+
+class WD14Labels:
+    """Label names and categories of a WD14 model, aligned with its score vector."""
+
+    def __init__(self, names: List[str], categories: List[int]):
+        self.names = np.asarray(names, dtype=object)
+        self.categories = np.asarray(categories, dtype=np.int16)
+        self.rating_index = np.flatnonzero(self.categories == CATEGORY_RATING)
+        self._thresholds = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate resident size (names as Python strings)."""
+        return sum(len(name) + 49 for name in self.names) + self.names.nbytes + self.categories.nbytes
+
+    @classmethod
+    def from_csv(cls, path: str) -> "WD14Labels":
+        """
+        Labels from selected_tags.csv. Files without a header are read as one
+        label per row (first column, all general); '#' rows are comments.
+        """
+        names, categories = [], []
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [row for row in csv.reader(f) if row and not row[0].startswith("#")]
+        if not rows:
+            return cls(names, categories)
+
+        header = [cell.strip().lower() for cell in rows[0]]
+        if "name" in header:
+            name_col = header.index("name")
+            category_col = header.index("category") if "category" in header else None
+            rows = rows[1:]
+        else:
+            name_col, category_col = 0, None
+        for row in rows:
+            names.append(row[name_col].strip())
+            category = row[category_col].strip() if category_col is not None and len(row) > category_col else ""
+            categories.append(int(category) if category.lstrip("-").isdigit() else CATEGORY_GENERAL)
+        return cls(names, categories)
+
+    def thresholds(self, general_threshold: float, character_threshold: float,
+                   allow: FrozenSet[str] = frozenset(), deny: FrozenSet[str] = frozenset()) -> np.ndarray:
+        """
+        Per-label threshold vector (rating labels never pass). Labels outside a
+        non-empty allow set or inside the deny set never pass either; both sets
+        hold normalized names (see normalize_tag).
+        """
+        key = (float(general_threshold), float(character_threshold), allow, deny)
+        vector = self._thresholds.get(key)
+        if vector is None:
+            vector = np.full(len(self.names), key[0], dtype=np.float32)
+            vector[self.categories == CATEGORY_CHARACTER] = key[1]
+            vector[self.rating_index] = np.inf
+            if allow or deny:
+                normalized = [normalize_tag(name) for name in self.names]
+                blocked = [(bool(allow) and name not in allow) or name in deny for name in normalized]
+                vector[np.asarray(blocked, dtype=bool)] = np.inf
+            if len(self._thresholds) >= 32:
+                self._thresholds.clear()
+            self._thresholds[key] = vector
+        return vector
+
+
+def normalize_tag(tag: str) -> str:
+    """Comparable tag name: lower case, underscores for spaces ("Long Hair" -> "long_hair")."""
+    return "_".join(tag.strip().lower().split())
+
+
+def compile_tag_set(text: str) -> FrozenSet[str]:
+    """Comma-separated tag list as a frozenset of normalized names."""
+    return frozenset(filter(None, (normalize_tag(tag) for tag in text.split(","))))
+
+
+def select_tags(scores: np.ndarray, labels: WD14Labels, general_threshold: float,
+                character_threshold: float, max_tags: int, allow: FrozenSet[str] = frozenset(),
+                deny: FrozenSet[str] = frozenset()) -> List[Tuple[List[Tuple[str, float]], int]]:
+    """
+    Per score row: (top max_tags (name, score) pairs sorted by score, number of labels that passed).
+
+    scores is [N] or [B, N]; extra model outputs beyond the labels are ignored.
+    allow / deny filter labels before the top-k (see WD14Labels.thresholds).
+    """
+    scores = np.atleast_2d(scores)[:, :len(labels)]
+    thresholds = labels.thresholds(general_threshold, character_threshold, allow, deny)[:scores.shape[1]]
+    rows, cols = np.nonzero(scores >= thresholds)
+    counts = np.bincount(rows, minlength=len(scores))
+    max_tags = max(1, int(max_tags))
+
+    selected = []
+    for row, index in enumerate(np.split(cols, np.cumsum(counts)[:-1])):
+        values = scores[row, index]
+        if len(index) > max_tags:
+            top = np.argpartition(-values, max_tags - 1)[:max_tags]
+            index, values = index[top], values[top]
+        # Stable on label order for equal scores
+        order = np.argsort(-values, kind="stable") if len(index) else index
+        selected.append(([(labels.names[i], float(v)) for i, v in zip(index[order], values[order])],
+                         int(counts[row])))
+    return selected
+
+
+def rating_scores(scores: np.ndarray, labels: WD14Labels) -> List[Dict[str, float]]:
+    """Rating head per score row: {rating label: score}, empty when the labels have no ratings."""
+    scores = np.atleast_2d(scores)
+    index = labels.rating_index[labels.rating_index < scores.shape[1]]
+    names = labels.names[index]
+    return [dict(zip(names, map(float, row))) for row in scores[:, index]]
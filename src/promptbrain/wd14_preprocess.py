@@ -0,0 +1,151 @@
+"""
+Brains-XDEV PromptBrain — WD14 Preprocessing
+
+Shared image preprocessing for WD14 ONNX taggers (BrainsXDEV_WD14Adapter and
+tools/enhanced_wd14_tagger.py). The expected input is read from the model
+itself (sess.get_inputs()) and cached per model:
+
+- NHWC models (SmilingWolf wd-v1-4 / wd-v3: swinv2, convnext, vit, moat) take
+  BGR float32 pixels in 0-255, padded to a white square
+- NCHW models take RGB float32 in 0-1 (same padding)
+
+Pad-to-square and area resize are fused: each output pixel is an exact area
+average, computed for the whole batch with two matrix products (or OpenCV
+INTER_AREA when cv2 is installed), so the padded full-size image is never built.
+"""
+from typing import Any, Dict
+import threading
+import numpy as np
+
+print("[Brains-XDEV] wd14_preprocess import")
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    CV2_AVAILABLE = False
+
+# Side used when the model leaves its spatial dims dynamic
+DEFAULT_SIZE = 448
+PAD_VALUE = 1.0  # white, in [0,1] units
+
+
+class WD14InputSpec:
+    """Layout, size and pixel convention of a WD14 model input."""
+
+    __slots__ = ("name", "layout", "height", "width", "bgr", "scale", "batch")
+
+    def __init__(self, name: str, layout: str, height: int, width: int, bgr: bool, scale: float, batch=None):
+        self.name = name
+        self.layout = layout
+        self.height = height
+        self.width = width
+        self.bgr = bgr
+        self.scale = scale
+        self.batch = batch
+
+    def __repr__(self):
+        order = "BGR" if self.bgr else "RGB"
+        return f"WD14InputSpec({self.name}, {self.layout} {self.height}x{self.width} {order} x{self.scale:g})"
+
+    @classmethod
+    def from_shape(cls, name: str, shape) -> "WD14InputSpec":
+        """Spec from an ONNX input shape (dynamic dims are strings or None)."""
+        dims = [d if isinstance(d, int) and d > 0 else None for d in shape]
+        if len(dims) != 4:
+            raise ValueError(f"Unsupported WD14 input shape: {shape}")
+        if dims[3] == 3 or (dims[1] != 3 and dims[3] in (None, 3)):
+            # SmilingWolf convention: NHWC, BGR, 0-255
+            return cls(name, "NHWC", dims[1] or DEFAULT_SIZE, dims[2] or DEFAULT_SIZE, True, 255.0, dims[0])
+        return cls(name, "NCHW", dims[2] or DEFAULT_SIZE, dims[3] or DEFAULT_SIZE, False, 1.0, dims[0])
+
+
+_SPECS: Dict[Any, WD14InputSpec] = {}
+_SPECS_LOCK = threading.Lock()
+
+
+def get_input_spec(sess, key=None) -> WD14InputSpec:
+    """Input spec of an InferenceSession, cached per key (e.g. the model path)."""
+    key = key if key is not None else id(sess)
+    with _SPECS_LOCK:
+        spec = _SPECS.get(key)
+        if spec is None:
+            model_input = sess.get_inputs()[0]
+            spec = WD14InputSpec.from_shape(model_input.name, model_input.shape)
+            _SPECS[key] = spec
+            print(f"[Brains-XDEV] WD14 input spec: {spec}")
+        return spec
+
+
+def area_weights(size: int, target: int, offset: int, length: int) -> np.ndarray:
+    """
+    [target, length] area-resampling weights from a padded axis of `size` samples
+    to `target`, restricted to the image samples [offset, offset + length).
+
+    Row t averages padded samples [t*size/target, (t+1)*size/target) by overlap.
+    """
+    edges = np.arange(target + 1, dtype=np.float64) * (size / target)
+    lo, hi = edges[:-1, None], edges[1:, None]
+    pos = np.arange(offset, offset + length, dtype=np.float64)[None, :]
+    overlap = np.clip(np.minimum(hi, pos + 1) - np.maximum(lo, pos), 0.0, None)
+    return (overlap / (hi - lo)).astype(np.float32)
+
+
+def as_batch(image) -> np.ndarray:
+    """IMAGE input ([B,H,W,C] tensor/array, list of images, or one HxWxC image) as a float32 array."""
+    if isinstance(image, (list, tuple)):
+        frames = [f.cpu().numpy() if hasattr(f, 'cpu') else np.asarray(f) for f in image]
+        batch = np.stack([f[0] if f.ndim == 4 else f for f in frames])
+    else:
+        batch = image.cpu().numpy() if hasattr(image, 'cpu') else np.asarray(image)
+        if batch.ndim == 3:
+            batch = batch[None]
+    batch = np.asarray(batch, dtype=np.float32)
+    if batch.shape[-1] == 1:
+        batch = np.repeat(batch, 3, axis=-1)
+    return batch[..., :3]
+
+
+def pad_resize(batch: np.ndarray, height: int, width: int, pad_value: float = PAD_VALUE) -> np.ndarray:
+    """
+    Center-pad [B,H,W,3] images to a square and area-resize to height x width.
+
+    Separable: with R_h, R_w restricted to the image region and a, b their row
+    sums, output = R_h img R_w^T + pad * (1 - a b^T); rows of the full weights sum to 1.
+    """
+    count, h, w, channels = batch.shape
+    side = max(h, w)
+    top, left = (side - h) // 2, (side - w) // 2
+
+    if CV2_AVAILABLE:
+        out = np.empty((count, height, width, channels), dtype=np.float32)
+        for index in range(count):
+            padded = cv2.copyMakeBorder(batch[index], top, side - h - top, left, side - w - left,
+                                        cv2.BORDER_CONSTANT, value=(pad_value,) * channels)
+            out[index] = cv2.resize(padded, (width, height), interpolation=cv2.INTER_AREA)
+        return out
+
+    rows = area_weights(side, height, top, h)
+    cols = area_weights(side, width, left, w)
+    # Rows first: [T, H] @ [B, H, W*C] -> [B, T, W*C]
+    tmp = np.matmul(rows, batch.reshape(count, h, w * channels))
+    # Then columns as one GEMM: [B*T*C, W] @ [W, T] -> [B, T, C, T], viewed back as NHWC
+    tmp = np.ascontiguousarray(tmp.reshape(count, height, w, channels).transpose(0, 1, 3, 2))
+    out = (tmp.reshape(-1, w) @ cols.T).reshape(count, height, channels, width).transpose(0, 1, 3, 2)
+    if h != w:
+        coverage = np.outer(rows.sum(axis=1), cols.sum(axis=1))
+        out += (pad_value * (1.0 - coverage))[None, :, :, None]
+    return out
+
+
+def preprocess_batch(image, spec: WD14InputSpec) -> np.ndarray:
+    """Model-ready contiguous float32 batch for spec from an IMAGE input in [0,1]."""
+    batch = pad_resize(as_batch(image), spec.height, spec.width)
+    if spec.bgr:
+        batch = batch[..., ::-1]
+    if spec.scale != 1.0:
+        batch = batch * np.float32(spec.scale)
+    if spec.layout == "NCHW":
+        batch = batch.transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32)
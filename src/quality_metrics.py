@@ -0,0 +1,842 @@
+"""
+Quality Metrics Kernel — Fused single-pass image metrics for PromptBrain quality scoring.
+
+Computes the luminance plane, gradients, second derivatives, luminance histogram
+and 3x3 grid statistics once per image and derives every sharpness, color,
+composition and noise metric used by BrainsXDEV_PromptBrainQualityScore from them.
+Block statistics use reshape-based reductions instead of Python loops.
+
+An optional torch backend computes the same metrics for a whole [B, H, W, C]
+tensor on its own device (conv2d difference/Laplacian kernels, batched
+reductions), so GPU images never round-trip through NumPy.
+
+Dependencies: numpy, torch (optional)
+"""
+from typing import Any, Dict, List, Optional
+import hashlib
+import threading
+import numpy as np
+
+try:
+    import torch
+    import torch.nn.functional as F
+    TORCH_AVAILABLE = True
+except ImportError:
+    torch = None
+    F = None
+    TORCH_AVAILABLE = False
+
+# Bump when a metric formula changes so persisted cache entries are not reused
+METRICS_VERSION = 1
+
+
+class ImageFeatures:
+    """
+    Shared intermediate arrays for one HxWxC (or HxW) float image.
+
+    Everything is float32 and computed lazily at most once, so each metric
+    family only pays for the planes it actually needs.
+    """
+
+    __slots__ = ("img", "height", "width", "channels", "_planes", "_gray", "_dx", "_dy",
+                 "_d2x", "_d2y", "_gray_var", "_histogram", "_extrema")
+
+    def __init__(self, img_array):
+        img = np.asarray(img_array, dtype=np.float32)
+        self.img = img
+        self.height, self.width = img.shape[:2]
+        self.channels = img.shape[2] if img.ndim == 3 else 1
+        self._planes = None
+        self._gray = None
+        self._dx = None
+        self._dy = None
+        self._d2x = None
+        self._d2y = None
+        self._gray_var = None
+        self._histogram = None
+        self._extrema = None
+
+    @property
+    def planes(self) -> np.ndarray:
+        """Contiguous (C, H, W) channel planes so per-channel ops stream memory"""
+        if self._planes is None:
+            img = self.img if self.img.ndim == 3 else self.img[:, :, None]
+            self._planes = np.ascontiguousarray(img.transpose(2, 0, 1))
+        return self._planes
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Equal-weight channel mean (same luminance the scorer always used)"""
+        if self._gray is None:
+            if self.img.ndim == 2:
+                self._gray = self.img
+            else:
+                planes = self.planes
+                gray = planes[0].copy()
+                for plane in planes[1:]:
+                    gray += plane
+                gray *= np.float32(1.0 / self.channels)
+                self._gray = gray
+        return self._gray
+
+    @property
+    def dx(self) -> np.ndarray:
+        """Signed horizontal first difference, shape (H, W-1)"""
+        if self._dx is None:
+            self._dx = np.diff(self.gray, axis=1)
+        return self._dx
+
+    @property
+    def dy(self) -> np.ndarray:
+        """Signed vertical first difference, shape (H-1, W)"""
+        if self._dy is None:
+            self._dy = np.diff(self.gray, axis=0)
+        return self._dy
+
+    @property
+    def d2x(self) -> np.ndarray:
+        """Horizontal second difference, shape (H, W-2)"""
+        if self._d2x is None:
+            self._d2x = np.diff(self.dx, axis=1)
+        return self._d2x
+
+    @property
+    def d2y(self) -> np.ndarray:
+        """Vertical second difference, shape (H-2, W)"""
+        if self._d2y is None:
+            self._d2y = np.diff(self.dy, axis=0)
+        return self._d2y
+
+    @property
+    def gray_var(self) -> float:
+        if self._gray_var is None:
+            self._gray_var = float(np.var(self.gray))
+        return self._gray_var
+
+    @property
+    def channel_extrema(self):
+        """Per-channel (mins, maxs) as float arrays"""
+        if self._extrema is None:
+            planes = self.planes
+            mins = np.array([plane.min() for plane in planes], dtype=np.float64)
+            maxs = np.array([plane.max() for plane in planes], dtype=np.float64)
+            self._extrema = (mins, maxs)
+        return self._extrema
+
+    @property
+    def dynamic_range(self) -> float:
+        mins, maxs = self.channel_extrema
+        return float(maxs.max() - mins.min())
+
+    @property
+    def histogram(self) -> np.ndarray:
+        """256-bin luminance histogram"""
+        if self._histogram is None:
+            levels = self.gray * np.float32(255.0)
+            np.clip(levels, 0, 255, out=levels)
+            self._histogram = np.bincount(levels.astype(np.uint8).ravel(), minlength=256)
+        return self._histogram
+
+
+def _mean_abs(arr: np.ndarray) -> float:
+    return float(np.abs(arr).mean())
+
+
+def block_reduce_view(plane: np.ndarray, block_h: int, block_w: int,
+                      rows: Optional[int] = None, cols: Optional[int] = None) -> np.ndarray:
+    """
+    View a 2D plane as (rows, block_h, cols, block_w) tiles without copying.
+
+    Reduce over axes (1, 3) to get per-block statistics. Partial edge tiles
+    are dropped; rows/cols default to the number of complete tiles.
+    """
+    if rows is None:
+        rows = plane.shape[0] // block_h
+    if cols is None:
+        cols = plane.shape[1] // block_w
+    tiles = plane[:rows * block_h, :cols * block_w]
+    return tiles.reshape(rows, block_h, cols, block_w)
+
+
+def sharpness_metrics(features: ImageFeatures) -> Dict[str, float]:
+    """Gradient, Laplacian, variance and edge-density sharpness"""
+    height, width = features.height, features.width
+    if not (height > 2 and width > 2):
+        return {
+            "gradient_sharpness": 0.5,
+            "laplacian_sharpness": 0.5,
+            "variance_sharpness": 0.5,
+            "edge_density": 0.5
+        }
+
+    abs_dx = np.abs(features.dx)
+    abs_dy = np.abs(features.dy)
+    metrics = {"gradient_sharpness": (float(abs_dx.mean()) + float(abs_dy.mean())) / 2}
+
+    if height > 3 and width > 3:
+        # 4-neighbour Laplacian is the sum of both second differences
+        laplacian = features.d2x[1:-1, :] + features.d2y[:, 1:-1]
+        metrics["laplacian_sharpness"] = _mean_abs(laplacian)
+    else:
+        metrics["laplacian_sharpness"] = metrics["gradient_sharpness"]
+
+    metrics["variance_sharpness"] = features.gray_var
+
+    edge_threshold = np.float32(np.sqrt(features.gray_var) * 0.5)
+    edges = np.count_nonzero(abs_dx > edge_threshold) + np.count_nonzero(abs_dy > edge_threshold)
+    total_pixels = features.gray.size
+    metrics["edge_density"] = edges / total_pixels if total_pixels > 0 else 0
+    return metrics
+
+
+def color_metrics(features: ImageFeatures, enable_histogram: bool = True) -> Dict[str, float]:
+    """Balance, saturation, hue harmony, temperature and per-channel range"""
+    img = features.img
+    if not (img.ndim == 3 and features.channels >= 3):
+        return {
+            "color_balance": 0.5,
+            "color_saturation": 0.0,
+            "color_harmony": 0.5,
+            "color_temperature": 0.5,
+            "avg_dynamic_range": features.dynamic_range if img.size > 0 else 0
+        }
+
+    r, g, b = features.planes[:3]
+    mean_r, mean_g, mean_b = float(r.mean()), float(g.mean()), float(b.mean())
+
+    metrics = {}
+    color_variance = np.var([mean_r, mean_g, mean_b])
+    metrics["color_balance"] = 1.0 - min(1.0, color_variance * 10)
+
+    max_rgb = np.maximum(r, g)
+    np.maximum(max_rgb, b, out=max_rgb)
+    min_rgb = np.minimum(r, g)
+    np.minimum(min_rgb, b, out=min_rgb)
+    chroma = max_rgb - min_rgb
+    max_rgb += np.float32(1e-8)
+    chroma /= max_rgb
+    metrics["color_saturation"] = float(chroma.mean())
+
+    if enable_histogram:
+        # arctan2 is in [-pi, pi], so "% 2pi" only shifts the negative half
+        # (much cheaper than np.mod)
+        hue_approx = np.arctan2(g - b, r - g)
+        hue_approx += (hue_approx < 0) * np.float32(2 * np.pi)
+        metrics["color_harmony"] = 1.0 - min(1.0, float(np.var(hue_approx)) / np.pi)
+        metrics["color_temperature"] = 0.5 + (mean_b - mean_r)
+    else:
+        metrics["color_harmony"] = 0.7
+        metrics["color_temperature"] = 0.5
+
+    mins, maxs = features.channel_extrema
+    metrics["red_range"] = float(maxs[0] - mins[0])
+    metrics["green_range"] = float(maxs[1] - mins[1])
+    metrics["blue_range"] = float(maxs[2] - mins[2])
+    metrics["avg_dynamic_range"] = (metrics["red_range"] + metrics["green_range"] + metrics["blue_range"]) / 3
+    return metrics
+
+
+def composition_metrics(features: ImageFeatures) -> Dict[str, float]:
+    """Rule of thirds, left/right and top/bottom balance, center focus"""
+    height, width = features.height, features.width
+    if not (height > 6 and width > 6):
+        return {
+            "rule_of_thirds": 0.7,
+            "horizontal_balance": 0.8,
+            "vertical_balance": 0.8,
+            "center_focus": 0.6
+        }
+
+    gray = features.gray
+
+    # 3x3 grid variances in one strided reduction
+    section_variances = block_reduce_view(gray, height // 3, width // 3, 3, 3).var(axis=(1, 3)).ravel()
+    intersection_interest = section_variances[[1, 3, 5, 7]].mean()
+    total_interest = section_variances.mean()
+
+    metrics = {"rule_of_thirds": float(intersection_interest / (total_interest + 1e-8))}
+
+    # Halves from row/column means (equal-size rows/cols, so means compose exactly)
+    col_means = gray.mean(axis=0, dtype=np.float64)
+    row_means = gray.mean(axis=1, dtype=np.float64)
+    left_half = col_means[:width // 2].mean()
+    right_half = col_means[width // 2:].mean()
+    top_half = row_means[:height // 2].mean()
+    bottom_half = row_means[height // 2:].mean()
+    metrics["horizontal_balance"] = 1.0 - abs(left_half - right_half)
+    metrics["vertical_balance"] = 1.0 - abs(top_half - bottom_half)
+
+    center_interest = np.var(gray[height // 4:3 * height // 4, width // 4:3 * width // 4])
+    edge_interest = (np.var(gray[:height // 4, :]) + np.var(gray[3 * height // 4:, :]) +
+                     np.var(gray[:, :width // 4]) + np.var(gray[:, 3 * width // 4:])) / 4
+    metrics["center_focus"] = float(center_interest / (center_interest + edge_interest + 1e-8))
+    return metrics
+
+
+def _grid_discontinuity(abs_diff: np.ndarray, axis: int, block_size: int) -> float:
+    """
+    Ratio of mean |difference| across block_size grid lines to the mean across
+    all other positions along one axis (1.0 = no grid structure).
+    """
+    energy = abs_diff.mean(axis=1 - axis, dtype=np.float64)
+    phases = len(energy) // block_size
+    if phases < 2:
+        return 1.0
+    # Difference index k spans pixels (k, k+1); grid lines sit at k = n*block_size - 1
+    phase_energy = energy[:phases * block_size].reshape(phases, block_size).mean(axis=0)
+    boundary = phase_energy[block_size - 1]
+    interior = np.delete(phase_energy, block_size - 1).mean()
+    if interior <= 1e-12:
+        return 1.0 if boundary <= 1e-12 else float("inf")
+    return float(boundary / interior)
+
+
+def block_artifact_metrics(gray: np.ndarray, block_size: int = 8,
+                           dx: Optional[np.ndarray] = None,
+                           dy: Optional[np.ndarray] = None,
+                           uniformity: bool = False) -> Dict[str, float]:
+    """
+    Detect DCT-style blocking artifacts in a 2D luminance plane.
+
+    Two vectorized signals:
+    - grid_discontinuity: how much stronger luminance steps are across the
+      block grid lines than inside blocks, averaged over both axes
+      (1.0 = no grid structure)
+    - block_variance_uniformity: 1 - var/mean of the per-block variances over
+      all complete block_size x block_size tiles (reshape reduction); a
+      diagnostic only, since flat or noisy images are uniform too, so it is
+      computed only with uniformity=True
+
+    dx/dy are optional signed first differences of gray to reuse.
+
+    Returns blocking_artifacts in [0, 1] (from the grid signal) plus the raw signals.
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    if gray.ndim != 2 or gray.shape[0] < block_size or gray.shape[1] < block_size:
+        result = {"blocking_artifacts": 0.0, "grid_discontinuity": 1.0}
+        if uniformity:
+            result["block_variance_uniformity"] = 0.0
+        return result
+
+    if dx is None:
+        dx = np.diff(gray, axis=1)
+    if dy is None:
+        dy = np.diff(gray, axis=0)
+    grid_ratio = (_grid_discontinuity(np.abs(dx), 1, block_size) +
+                  _grid_discontinuity(np.abs(dy), 0, block_size)) / 2
+
+    # Steps twice as strong on the grid as inside blocks count as fully blocky
+    result = {
+        "blocking_artifacts": min(1.0, max(0.0, grid_ratio - 1.0)),
+        "grid_discontinuity": grid_ratio
+    }
+    if uniformity:
+        block_variances = block_reduce_view(gray, block_size, block_size).var(axis=(1, 3))
+        result["block_variance_uniformity"] = 1.0 - float(np.var(block_variances)) / (float(block_variances.mean()) + 1e-8)
+    return result
+
+
+def noise_metrics(features: ImageFeatures) -> Dict[str, float]:
+    """High-frequency noise level, clarity and blocking artifacts"""
+    if features.img.size <= 100:
+        return {"noise_level": 0.3, "clarity": 0.7, "blocking_artifacts": 0.0}
+
+    gray = features.gray
+    if not (gray.shape[0] > 2 and gray.shape[1] > 2):
+        return {"noise_level": 0.5, "clarity": 0.5, "blocking_artifacts": 0.0}
+
+    high_freq = (_mean_abs(features.d2y) + _mean_abs(features.d2x)) / 2
+    metrics = {"noise_level": min(1.0, high_freq * 20)}
+    metrics["clarity"] = 1.0 - metrics["noise_level"]
+
+    artifacts = block_artifact_metrics(gray, 8, features.dx, features.dy)
+    metrics["blocking_artifacts"] = artifacts["blocking_artifacts"]
+    metrics["grid_discontinuity"] = artifacts["grid_discontinuity"]
+    return metrics
+
+
+def exposure_metrics(features: ImageFeatures) -> Dict[str, float]:
+    """Shadow/highlight clipping fractions from the luminance histogram"""
+    histogram = features.histogram
+    total = max(1, int(histogram.sum()))
+    return {
+        "shadow_clipping": float(histogram[:3].sum()) / total,
+        "highlight_clipping": float(histogram[-3:].sum()) / total
+    }
+
+
+def compute_image_metrics(img_array, enable_histogram: bool = True,
+                          enable_composition: bool = True,
+                          enable_noise: bool = True) -> Dict[str, Any]:
+    """
+    Run every quality metric over one HxWxC image from a single set of features.
+
+    Returns a dict with "technical", "sharpness", "color", "composition",
+    "noise" and "exposure" sections; disabled sections are empty dicts.
+    """
+    features = ImageFeatures(img_array)
+    img = features.img
+
+    technical = {
+        "brightness": float(img.mean()),
+        "contrast": float(img.std()),
+        "resolution": {"width": features.width, "height": features.height, "channels": features.channels},
+        "dynamic_range": features.dynamic_range
+    }
+
+    return {
+        "technical": technical,
+        "sharpness": sharpness_metrics(features),
+        "color": color_metrics(features, enable_histogram),
+        "composition": composition_metrics(features) if enable_composition else {},
+        "noise": noise_metrics(features) if enable_noise else {},
+        "exposure": exposure_metrics(features) if enable_histogram else {}
+    }
+
+
+def area_downsample(img: np.ndarray) -> np.ndarray:
+    """Halve an HxW(xC) image by 2x2 area averaging (odd edge row/column dropped)"""
+    h, w = img.shape[0] // 2, img.shape[1] // 2
+    # Add row pairs first (contiguous rows), then neighbouring pixels
+    row_pairs = img[:2 * h, :2 * w].reshape((h, 2, 2 * w) + img.shape[2:])
+    rows = row_pairs[:, 0] + row_pairs[:, 1]
+    col_pairs = rows.reshape((h, w, 2) + img.shape[2:])
+    out = col_pairs[:, :, 0] + col_pairs[:, :, 1]
+    out *= np.float32(0.25)
+    return out
+
+
+def build_pyramid(img: np.ndarray, pixel_budget: int, min_side: int = 32) -> List[np.ndarray]:
+    """
+    Area-averaged pyramid from full resolution down to the first level whose
+    pixel count fits pixel_budget (or until a side would drop below min_side).
+    """
+    levels = [img]
+    while (levels[-1].shape[0] * levels[-1].shape[1] > pixel_budget and
+           min(levels[-1].shape[:2]) >= 2 * min_side):
+        levels.append(area_downsample(levels[-1]))
+    return levels
+
+
+def sample_detail_tiles(img: np.ndarray, pixel_budget: int, tile_size: int = 64) -> Optional[np.ndarray]:
+    """
+    Evenly spaced full-resolution luminance tiles, stacked as (N, tile, tile).
+
+    Tiles start on multiples of tile_size, so they stay aligned to the 8x8
+    codec grid. Returns None when the image has no complete tile.
+    """
+    rows, cols = img.shape[0] // tile_size, img.shape[1] // tile_size
+    if rows == 0 or cols == 0:
+        return None
+    count = max(1, pixel_budget // (tile_size * tile_size))
+    pick_rows = max(1, min(rows, int(round(np.sqrt(count * rows / cols)))))
+    pick_cols = max(1, min(cols, count // pick_rows))
+    row_index = np.linspace(0, rows - 1, pick_rows).round().astype(int)
+    col_index = np.linspace(0, cols - 1, pick_cols).round().astype(int)
+
+    tiles = img[:rows * tile_size, :cols * tile_size]
+    tiles = tiles.reshape((rows, tile_size, cols, tile_size) + img.shape[2:])
+    tiles = tiles[row_index][:, :, col_index]
+    if tiles.ndim == 5:
+        # Same equal-weight luminance as ImageFeatures.gray
+        gray = tiles[..., 0].copy()
+        for channel in range(1, tiles.shape[4]):
+            gray += tiles[..., channel]
+        gray *= np.float32(1.0 / tiles.shape[4])
+        tiles = gray
+    return np.ascontiguousarray(tiles.transpose(0, 2, 1, 3)).reshape(-1, tile_size, tile_size)
+
+
+def tile_detail_metrics(tiles: np.ndarray, enable_noise: bool = True):
+    """
+    Sharpness and noise metrics over a (N, t, t) stack of full-resolution tiles.
+
+    Same formulas as sharpness_metrics/noise_metrics; differences never cross
+    tile borders, and variance is pooled over every sampled pixel.
+    Returns (sharpness, noise) dicts; noise is empty when disabled.
+    """
+    dx = np.diff(tiles, axis=2)
+    dy = np.diff(tiles, axis=1)
+    abs_dx = np.abs(dx)
+    abs_dy = np.abs(dy)
+    d2x = np.diff(dx, axis=2)
+    d2y = np.diff(dy, axis=1)
+
+    gray_var = float(tiles.var())
+    edge_threshold = np.float32(np.sqrt(gray_var) * 0.5)
+    edges = np.count_nonzero(abs_dx > edge_threshold) + np.count_nonzero(abs_dy > edge_threshold)
+    sharpness = {
+        "gradient_sharpness": (float(abs_dx.mean()) + float(abs_dy.mean())) / 2,
+        "laplacian_sharpness": _mean_abs(d2x[:, 1:-1, :] + d2y[:, :, 1:-1]),
+        "variance_sharpness": gray_var,
+        "edge_density": edges / tiles.size
+    }
+
+    noise = {}
+    if enable_noise:
+        high_freq = (_mean_abs(d2y) + _mean_abs(d2x)) / 2
+        noise["noise_level"] = min(1.0, high_freq * 20)
+        noise["clarity"] = 1.0 - noise["noise_level"]
+        tile_size = tiles.shape[1]
+        # Tiles are grid-aligned, so phase energies pool across the whole stack
+        grid_ratio = (_grid_discontinuity(abs_dx.reshape(-1, tile_size - 1), 1, 8) +
+                      _grid_discontinuity(abs_dy.transpose(1, 0, 2).reshape(tile_size - 1, -1), 0, 8)) / 2
+        noise["blocking_artifacts"] = min(1.0, max(0.0, grid_ratio - 1.0))
+        noise["grid_discontinuity"] = grid_ratio
+    return sharpness, noise
+
+
+def compute_pyramid_metrics(img_array, pixel_budget: int = 1 << 20,
+                            enable_histogram: bool = True,
+                            enable_composition: bool = True,
+                            enable_noise: bool = True,
+                            tile_size: int = 64) -> Dict[str, Any]:
+    """
+    compute_image_metrics on a multi-resolution budget.
+
+    - brightness, contrast, dynamic range: full resolution (cheap reductions)
+    - color, composition, exposure: the pyramid level that fits pixel_budget
+      (area averaging preserves the global statistics they measure)
+    - sharpness, noise, blocking: full-resolution tiles totalling at most
+      pixel_budget pixels (per-pixel differences and the 8x8 grid do not
+      survive downsampling)
+
+    Images already within the budget get the exact full-resolution pass.
+    The extra "pyramid" section records which levels were used.
+    """
+    img = np.asarray(img_array, dtype=np.float32)
+    height, width = img.shape[:2]
+    if height * width <= pixel_budget:
+        metrics = compute_image_metrics(img, enable_histogram, enable_composition, enable_noise)
+        metrics["pyramid"] = {
+            "pixel_budget": pixel_budget, "levels": 1, "global_level": 0,
+            "global_resolution": {"width": width, "height": height},
+            "detail_tiles": 0, "tile_size": 0, "analyzed_fraction": 1.0
+        }
+        return metrics
+
+    levels = build_pyramid(img, pixel_budget)
+    coarse = ImageFeatures(levels[-1])
+    tiles = sample_detail_tiles(img, pixel_budget, tile_size)
+    if tiles is not None:
+        sharpness, noise = tile_detail_metrics(tiles, enable_noise)
+        detail_pixels = tiles.size
+    else:
+        full = ImageFeatures(img)
+        sharpness = sharpness_metrics(full)
+        noise = noise_metrics(full) if enable_noise else {}
+        detail_pixels = height * width
+
+    # Extrema shrink under area averaging, so ranges come from full resolution
+    channels = img.shape[2] if img.ndim == 3 else 1
+    # (reducing rows first keeps the inner loop contiguous; axis=(0, 1) is ~30x slower)
+    mins = img.min(axis=0).min(axis=0) if img.ndim == 3 else np.array([img.min()])
+    maxs = img.max(axis=0).max(axis=0) if img.ndim == 3 else np.array([img.max()])
+    color = color_metrics(coarse, enable_histogram)
+    if "red_range" in color:
+        color["red_range"] = float(maxs[0] - mins[0])
+        color["green_range"] = float(maxs[1] - mins[1])
+        color["blue_range"] = float(maxs[2] - mins[2])
+        color["avg_dynamic_range"] = (color["red_range"] + color["green_range"] + color["blue_range"]) / 3
+    else:
+        color["avg_dynamic_range"] = float(maxs.max() - mins.min())
+
+    # Single-pass moments (no full-size temporary like img.std())
+    flat = img.reshape(-1)
+    brightness = float(flat.mean())
+    contrast = float(np.sqrt(max(0.0, float(np.dot(flat, flat)) / flat.size - brightness * brightness)))
+
+    return {
+        "technical": {
+            "brightness": brightness,
+            "contrast": contrast,
+            "resolution": {"width": width, "height": height, "channels": channels},
+            "dynamic_range": float(maxs.max() - mins.min())
+        },
+        "sharpness": sharpness,
+        "color": color,
+        "composition": composition_metrics(coarse) if enable_composition else {},
+        "noise": noise,
+        "exposure": exposure_metrics(coarse) if enable_histogram else {},
+        "pyramid": {
+            "pixel_budget": pixel_budget,
+            "levels": len(levels),
+            "global_level": len(levels) - 1,
+            "global_resolution": {"width": coarse.width, "height": coarse.height},
+            "detail_tiles": 0 if tiles is None else len(tiles),
+            "tile_size": 0 if tiles is None else tile_size,
+            "analyzed_fraction": (coarse.width * coarse.height + detail_pixels) / float(height * width)
+        }
+    }
+
+
+def compute_batch_metrics(batch, enable_histogram: bool = True,
+                          enable_composition: bool = True,
+                          enable_noise: bool = True,
+                          backend: str = "numpy",
+                          num_threads: int = 0,
+                          pixel_budget: int = 0) -> List[Dict[str, Any]]:
+    """
+    Run compute_image_metrics over every image of a [B, H, W, C] batch.
+
+    A single HxWxC image is treated as a batch of one. backend selects the
+    implementation: "numpy", "torch", or "auto" (torch when the batch is
+    already a torch tensor). num_threads > 0 sets torch's CPU thread count
+    for the torch backend. pixel_budget > 0 switches the NumPy backend to
+    compute_pyramid_metrics (auto then resolves to NumPy; the torch backend
+    always analyzes full resolution).
+
+    The NumPy path runs the kernel per image on contiguous slices of the
+    batch (no float64 copy of the batch).
+    """
+    is_tensor = TORCH_AVAILABLE and isinstance(batch, torch.Tensor)
+    if backend == "torch" and not TORCH_AVAILABLE:
+        print("Warning: torch metrics backend requested but torch is not installed, using numpy")
+    elif backend == "torch" or (backend == "auto" and is_tensor and pixel_budget <= 0):
+        return torch_batch_metrics(batch, enable_histogram, enable_composition, enable_noise, num_threads)
+
+    return _numpy_batch_metrics(_as_numpy_batch(batch), enable_histogram, enable_composition,
+                                enable_noise, pixel_budget)
+
+
+def _as_numpy_batch(batch) -> np.ndarray:
+    """[B, H, W, C] float32 array from a tensor, array or single image"""
+    if TORCH_AVAILABLE and isinstance(batch, torch.Tensor):
+        batch = batch.detach().cpu().numpy()
+    batch = np.asarray(batch, dtype=np.float32)
+    if batch.ndim < 4:
+        batch = batch[None]
+    return batch
+
+
+def _numpy_batch_metrics(batch: np.ndarray, enable_histogram: bool, enable_composition: bool,
+                         enable_noise: bool, pixel_budget: int) -> List[Dict[str, Any]]:
+    """NumPy backend of compute_batch_metrics over a [B, H, W, C] float32 array"""
+    if pixel_budget > 0:
+        return [compute_pyramid_metrics(image, pixel_budget, enable_histogram, enable_composition, enable_noise)
+                for image in batch]
+
+    return [compute_image_metrics(image, enable_histogram, enable_composition, enable_noise)
+            for image in batch]
+
+
+def _torch_kernel(rows, like):
+    """2D correlation kernel shaped (1, 1, kh, kw) for F.conv2d"""
+    return torch.tensor(rows, dtype=like.dtype, device=like.device)[None, None]
+
+
+def _torch_grid_discontinuity(abs_diff, axis: int, block_size: int):
+    """Batched _grid_discontinuity over a [B, H, W] |difference| stack"""
+    energy = abs_diff.mean(dim=2 - axis)
+    phases = energy.shape[1] // block_size
+    if phases < 2:
+        return torch.ones(energy.shape[0], dtype=energy.dtype, device=energy.device)
+    phase_energy = energy[:, :phases * block_size].reshape(-1, phases, block_size).mean(dim=1)
+    boundary = phase_energy[:, block_size - 1]
+    interior = torch.cat([phase_energy[:, :block_size - 1], phase_energy[:, block_size:]], dim=1).mean(dim=1)
+    ratio = boundary / interior.clamp(min=1e-12)
+    flat = interior <= 1e-12
+    ratio = torch.where(flat & (boundary <= 1e-12), torch.ones_like(ratio), ratio)
+    return torch.where(flat & (boundary > 1e-12), torch.full_like(ratio, float("inf")), ratio)
+
+
+def _torch_metric_columns(x, enable_histogram: bool, enable_composition: bool, enable_noise: bool):
+    """
+    Every scalar metric for a float [B, H, W, C] tensor as {(section, name): [B] tensor}.
+
+    Mirrors the NumPy families exactly (same difference kernels, population
+    variances and thresholds) so both backends rank images the same way.
+    """
+    batch_size, height, width, _ = x.shape
+    planes = x.permute(0, 3, 1, 2)
+    gray = planes.mean(dim=1)
+    gray4 = gray.unsqueeze(1)
+    columns = {}
+
+    flat = x.reshape(batch_size, -1)
+    chan_min = planes.amin(dim=(2, 3))
+    chan_max = planes.amax(dim=(2, 3))
+    columns[("technical", "brightness")] = flat.mean(dim=1)
+    columns[("technical", "contrast")] = flat.std(dim=1, unbiased=False)
+    columns[("technical", "dynamic_range")] = chan_max.amax(dim=1) - chan_min.amin(dim=1)
+
+    # Sharpness: forward differences and the 4-neighbour Laplacian as conv2d
+    dx = F.conv2d(gray4, _torch_kernel([[-1.0, 1.0]], gray))[:, 0]
+    dy = F.conv2d(gray4, _torch_kernel([[-1.0], [1.0]], gray))[:, 0]
+    laplacian = F.conv2d(gray4, _torch_kernel([[0.0, 1.0, 0.0], [1.0, -4.0, 1.0], [0.0, 1.0, 0.0]], gray))[:, 0]
+    abs_dx, abs_dy = dx.abs(), dy.abs()
+    gray_var = gray.var(dim=(1, 2), unbiased=False)
+    edge_threshold = (gray_var.sqrt() * 0.5)[:, None, None]
+    edges = (abs_dx > edge_threshold).sum(dim=(1, 2)) + (abs_dy > edge_threshold).sum(dim=(1, 2))
+    columns[("sharpness", "gradient_sharpness")] = (abs_dx.mean(dim=(1, 2)) + abs_dy.mean(dim=(1, 2))) / 2
+    columns[("sharpness", "laplacian_sharpness")] = laplacian.abs().mean(dim=(1, 2))
+    columns[("sharpness", "variance_sharpness")] = gray_var
+    columns[("sharpness", "edge_density")] = edges.to(gray.dtype) / (height * width)
+
+    # Color
+    r, g, b = planes[:, 0], planes[:, 1], planes[:, 2]
+    channel_means = planes[:, :3].mean(dim=(2, 3))
+    columns[("color", "color_balance")] = 1.0 - (channel_means.var(dim=1, unbiased=False) * 10).clamp(max=1.0)
+    max_rgb = torch.maximum(torch.maximum(r, g), b)
+    min_rgb = torch.minimum(torch.minimum(r, g), b)
+    columns[("color", "color_saturation")] = ((max_rgb - min_rgb) / (max_rgb + 1e-8)).mean(dim=(1, 2))
+    if enable_histogram:
+        hue_approx = torch.atan2(g - b, r - g)
+        hue_approx = hue_approx + (hue_approx < 0) * (2 * np.pi)
+        columns[("color", "color_harmony")] = 1.0 - (hue_approx.var(dim=(1, 2), unbiased=False) / np.pi).clamp(max=1.0)
+        columns[("color", "color_temperature")] = 0.5 + (channel_means[:, 2] - channel_means[:, 0])
+    else:
+        columns[("color", "color_harmony")] = torch.full_like(gray_var, 0.7)
+        columns[("color", "color_temperature")] = torch.full_like(gray_var, 0.5)
+    ranges = chan_max[:, :3] - chan_min[:, :3]
+    columns[("color", "red_range")] = ranges[:, 0]
+    columns[("color", "green_range")] = ranges[:, 1]
+    columns[("color", "blue_range")] = ranges[:, 2]
+    columns[("color", "avg_dynamic_range")] = ranges.mean(dim=1)
+
+    if enable_composition:
+        section_h, section_w = height // 3, width // 3
+        section_variances = gray[:, :3 * section_h, :3 * section_w].reshape(
+            batch_size, 3, section_h, 3, section_w).var(dim=(2, 4), unbiased=False).reshape(batch_size, 9)
+        columns[("composition", "rule_of_thirds")] = (
+            section_variances[:, [1, 3, 5, 7]].mean(dim=1) / (section_variances.mean(dim=1) + 1e-8))
+        col_means = gray.mean(dim=1)
+        row_means = gray.mean(dim=2)
+        columns[("composition", "horizontal_balance")] = 1.0 - (
+            col_means[:, :width // 2].mean(dim=1) - col_means[:, width // 2:].mean(dim=1)).abs()
+        columns[("composition", "vertical_balance")] = 1.0 - (
+            row_means[:, :height // 2].mean(dim=1) - row_means[:, height // 2:].mean(dim=1)).abs()
+        center_interest = gray[:, height // 4:3 * height // 4, width // 4:3 * width // 4].var(dim=(1, 2), unbiased=False)
+        edge_interest = (gray[:, :height // 4, :].var(dim=(1, 2), unbiased=False) +
+                         gray[:, 3 * height // 4:, :].var(dim=(1, 2), unbiased=False) +
+                         gray[:, :, :width // 4].var(dim=(1, 2), unbiased=False) +
+                         gray[:, :, 3 * width // 4:].var(dim=(1, 2), unbiased=False)) / 4
+        columns[("composition", "center_focus")] = center_interest / (center_interest + edge_interest + 1e-8)
+
+    if enable_noise:
+        d2x = F.conv2d(gray4, _torch_kernel([[1.0, -2.0, 1.0]], gray))[:, 0]
+        d2y = F.conv2d(gray4, _torch_kernel([[1.0], [-2.0], [1.0]], gray))[:, 0]
+        high_freq = (d2y.abs().mean(dim=(1, 2)) + d2x.abs().mean(dim=(1, 2))) / 2
+        noise_level = (high_freq * 20).clamp(max=1.0)
+        grid_ratio = (_torch_grid_discontinuity(abs_dx, 1, 8) + _torch_grid_discontinuity(abs_dy, 0, 8)) / 2
+        columns[("noise", "noise_level")] = noise_level
+        columns[("noise", "clarity")] = 1.0 - noise_level
+        columns[("noise", "blocking_artifacts")] = (grid_ratio - 1.0).clamp(min=0.0, max=1.0)
+        columns[("noise", "grid_discontinuity")] = grid_ratio
+
+    if enable_histogram:
+        # One bincount for the whole batch: offset each image into its own 256 bins
+        levels = (gray * 255.0).clamp(0, 255).long()
+        levels = levels + torch.arange(batch_size, device=gray.device)[:, None, None] * 256
+        histogram = torch.bincount(levels.reshape(-1), minlength=256 * batch_size).reshape(batch_size, 256)
+        total = histogram.sum(dim=1).clamp(min=1).to(gray.dtype)
+        columns[("exposure", "shadow_clipping")] = histogram[:, :3].sum(dim=1).to(gray.dtype) / total
+        columns[("exposure", "highlight_clipping")] = histogram[:, -3:].sum(dim=1).to(gray.dtype) / total
+
+    return columns
+
+
+# torch's intra-op thread count is process-wide: calls that change it run one at a time
+_TORCH_THREADS_LOCK = threading.Lock()
+
+
+def torch_batch_metrics(batch, enable_histogram: bool = True,
+                        enable_composition: bool = True,
+                        enable_noise: bool = True,
+                        num_threads: int = 0) -> List[Dict[str, Any]]:
+    """
+    Torch implementation of compute_batch_metrics.
+
+    Works on the tensor's own device; only the final per-image scalars are
+    copied to the host (one transfer for the whole batch). Tiny or non-RGB
+    images fall back to the NumPy kernel, which handles their edge cases.
+
+    num_threads > 0 (CPU tensors only) changes torch's process-wide thread
+    count for this call only: the previous value is restored afterwards, and
+    such calls are serialized so concurrent ones cannot leave it changed.
+    """
+    if not TORCH_AVAILABLE:
+        raise ImportError("torch is required for the torch metrics backend")
+
+    x = batch if isinstance(batch, torch.Tensor) else torch.as_tensor(np.asarray(batch, dtype=np.float32))
+    if x.dim() < 4:
+        x = x.unsqueeze(0)
+    batch_size, height, width, channels = x.shape
+    if channels < 3 or height < 8 or width < 8:
+        return compute_batch_metrics(x.detach().cpu().numpy(), enable_histogram, enable_composition, enable_noise)
+
+    def run():
+        with torch.no_grad():
+            columns = _torch_metric_columns(x.float(), enable_histogram, enable_composition, enable_noise)
+            names = list(columns)
+            return names, torch.stack([columns[name].float() for name in names], dim=1).cpu().tolist()
+
+    if num_threads > 0 and x.device.type == "cpu":
+        with _TORCH_THREADS_LOCK:
+            previous_threads = torch.get_num_threads()
+            torch.set_num_threads(num_threads)
+            try:
+                names, values = run()
+            finally:
+                torch.set_num_threads(previous_threads)
+    else:
+        names, values = run()
+
+    results = []
+    for row in values:
+        metrics = {
+            "technical": {"resolution": {"width": width, "height": height, "channels": channels}},
+            "sharpness": {}, "color": {}, "composition": {}, "noise": {}, "exposure": {}
+        }
+        for (section, name), value in zip(names, row):
+            metrics[section][name] = value
+        results.append(metrics)
+    return results
+
+
+def image_fingerprint(image) -> str:
+    """
+    Content hash of one HxW(xC) image (NumPy array or torch tensor).
+
+    SHA-256 over the shape and every float32 pixel of the contiguous buffer,
+    so any edit, including pixels swapped within a row, changes the key.
+    SHA-256 is hardware-accelerated on current CPUs (about 12 ms for a
+    1024x1024 RGB image vs about 31 ms for blake2b). Torch tensors are copied
+    to the host.
+    """
+    if TORCH_AVAILABLE and isinstance(image, torch.Tensor):
+        image = image.detach().float().cpu().numpy()
+    image = np.ascontiguousarray(image, dtype=np.float32)
+
+    digest = hashlib.sha256(repr(tuple(image.shape)).encode())
+    digest.update(image.data)
+    return digest.hexdigest()[:32]
+
+
+def rank_scores(scores) -> List[int]:
+    """Batch indices ordered best-first (stable, so ties keep batch order)"""
+    return [int(i) for i in np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")]
+
+
+__all__ = [
+    "ImageFeatures",
+    "block_reduce_view",
+    "sharpness_metrics",
+    "color_metrics",
+    "composition_metrics",
+    "block_artifact_metrics",
+    "noise_metrics",
+    "exposure_metrics",
+    "compute_image_metrics",
+    "area_downsample",
+    "build_pyramid",
+    "sample_detail_tiles",
+    "tile_detail_metrics",
+    "compute_pyramid_metrics",
+    "compute_batch_metrics",
+    "torch_batch_metrics",
+    "image_fingerprint",
+    "rank_scores",
+    "METRICS_VERSION",
+    "TORCH_AVAILABLE",
+]
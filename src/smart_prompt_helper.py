@@ -95,8 +95,8 @@ class BrainsXDEV_SmartPromptHelper:
                 quality_threshold=0.3,
             )
             
-            # Unpack result (brain_data, suggestion_1, suggestion_2, suggestion_3)
-            _, s1, s2, s3 = result
+            # Unpack result (brain_data, suggestion_1, suggestion_2, suggestion_3, all_suggestions)
+            _, s1, s2, s3, _ = result
             
             # Generate explanation
             explanation = self._generate_explanation(
@@ -19,6 +19,21 @@ from promptbrain.scorer import BrainsXDEV_Scorer
 from promptbrain.tagger import BrainsXDEV_Tagger
 from promptbrain.captioner import BrainsXDEV_Captioner
 from promptbrain.suggester import BrainsXDEV_PromptSuggester
+from promptbrain.florence2_adapter import BrainsXDEV_Florence2Adapter, Florence2ModelManager
+from promptbrain import preloader, florence2_onnx
+from promptbrain.florence2_adapter import torch as florence2_adapter_torch
+from promptbrain.wd14_adapter import BrainsXDEV_WD14Adapter
+from promptbrain import wd14_preprocess, wd14_postprocess
+from promptbrain.wd14_preprocess import WD14InputSpec
+from promptbrain.ort_session import SessionSettings
+from promptbrain.resource_cache import ResourceCache
+import quality_metrics
+from brain_datatype import (
+    BrainData, BRAIN_RESULT_CACHE, QualityMetrics, QualityMetricsCache, BrainsXDEV_PromptBrainSuggestDirect, BrainsXDEV_PromptBrainSuggestBatch,
+    BrainsXDEV_PromptBrainQualityScore, BrainsXDEV_PromptBrainKSamplerDirect,
+    BrainsXDEV_PromptBrainParameterOptimizer, QUALITY_VOCABULARY, STYLE_INDICATORS, TECHNICAL_TERMS,
+    get_semantic_matcher
+)
 
 
 class TestNodeRegistration:
@@ -114,6 +129,44 @@ class TestStubNodes:
         assert "tags" in tags_dict
         assert "stub" in tags_dict
     
+    def test_tagger_wd14_filters_and_caches_by_image(self, tmp_path, monkeypatch):
+        from promptbrain import tagger
+        model = tmp_path / "model.onnx"
+        model.write_bytes(b"onnx")
+        labels = tmp_path / "selected_tags.csv"
+        labels.write_text("tag_id,name,category,count\n1,general,9,1\n2,explicit,9,1\n3,long_hair,0,1\n"
+                          "4,smile,0,1\n5,solo,0,1\n", encoding="utf-8")
+        inferred = []
+        
+        def infer(sess, model_path, frames, batch_memory_mb=1024):
+            inferred.append(len(frames))
+            return np.stack([[0.8, 0.2, 0.9, f[0, 0, 0], 0.6] for f in frames]).astype(np.float32), 1
+        
+        node = BrainsXDEV_Tagger()
+        monkeypatch.setattr(tagger, "ONNX_AVAILABLE", True)
+        monkeypatch.setattr(tagger, "_preload_job", lambda inputs: ("test-tagger", lambda: None, None))
+        monkeypatch.setattr(node._engine, "_get_session", lambda path, settings=None: "session")
+        monkeypatch.setattr(node._engine, "_infer_scores", infer)
+        images = np.stack([np.full((8, 8, 3), v, dtype=np.float32) for v in (0.7, 0.1, 0.7)])
+        kwargs = dict(onnx_model_path=str(model), labels_csv_path=str(labels))
+        
+        text, tags_dict = node.run(images, 0.5, allow_list="", deny_list=" Solo ", **kwargs)
+        assert text == "long_hair, smile" and tags_dict["stub"] is False
+        assert tags_dict["rating"] == {"general": pytest.approx(0.8), "explicit": pytest.approx(0.2)}
+        
+        # Same image again: no inference; filters apply to the cached scores
+        text, tags_dict = node.run(images[:1], 0.5, allow_list="Long Hair,solo", deny_list="", **kwargs)
+        assert text == "long_hair, solo" and tags_dict["cached_images"] == 1 and inferred == [1]
+        
+        text, tags_dict = node.run(images, 0.5, allow_list="", deny_list="", batch_mode=True, **kwargs)
+        assert text.split("\n") == ["long_hair, smile, solo", "long_hair, solo", "long_hair, smile, solo"]
+        assert len(tags_dict["batch"]) == 3 and inferred == [1, 1]
+        
+        # Duplicates within a new batch are inferred once
+        fresh = np.stack([np.full((8, 8, 3), 0.3, dtype=np.float32)] * 2)
+        node.run(fresh, 0.5, allow_list="", deny_list="", batch_mode=True, **kwargs)
+        assert inferred == [1, 1, 1]
+    
     def test_captioner_stub(self):
         node = BrainsXDEV_Captioner()
         img = np.zeros((32, 32, 3), dtype=np.float32)
@@ -161,5 +214,734 @@ class TestPromptSuggester:
         assert isinstance(metadata, dict)
 
 
+
+class TestFlorence2Adapter:
+    """Batch handling of the Florence-2 adapter (model inference needs transformers)."""
+    
+    def test_batch_is_split_per_image(self):
+        node = BrainsXDEV_Florence2Adapter()
+        batch = np.zeros((3, 16, 24, 3), dtype=np.float32)
+        batch[1] += 1.0
+        
+        frames = node._to_pil_batch(batch)
+        assert [frame.size for frame in frames] == [(24, 16)] * 3
+        assert np.asarray(frames[1]).min() == 255
+        assert len(node._to_pil_batch(batch[0])) == 1
+        assert len(node._to_pil_batch([batch[0], batch[2]])) == 2
+    
+    def test_outputs_caption_list(self):
+        node = BrainsXDEV_Florence2Adapter()
+        assert node.RETURN_TYPES[:2] == ("STRING", "DICT")
+        assert node.RETURN_NAMES[2] == "captions"
+    
+    def test_int8_cache_lives_in_user_cache_dir(self):
+        from promptbrain import florence2_adapter
+        from promptbrain.resource_cache import user_cache_dir
+        assert florence2_adapter.QUANTIZED_DIR.startswith(user_cache_dir())
+        assert not florence2_adapter.QUANTIZED_DIR.startswith(os.path.dirname(florence2_adapter.__file__))
+
+    
+    @pytest.mark.skipif(florence2_adapter_torch is None, reason="torch not installed")
+    def test_tensor_preprocessing_matches_processor_config(self):
+        """Direct tensor path resizes to the processor size and normalizes with its mean/std"""
+        from types import SimpleNamespace
+        torch = florence2_adapter_torch
+        processor = SimpleNamespace(
+            image_processor=SimpleNamespace(size={"height": 8, "width": 8}, image_mean=[0.5] * 3,
+                                            image_std=[0.25] * 3, do_normalize=True),
+            tokenizer=lambda prompts, **kwargs: {"input_ids": torch.ones(len(prompts), 4, dtype=torch.long),
+                                                 "attention_mask": torch.ones(len(prompts), 4, dtype=torch.long)},
+        )
+        model = torch.nn.Linear(2, 2)
+        node = BrainsXDEV_Florence2Adapter()
+        batch = node._tensor_batch(np.full((2, 16, 12, 3), 0.75, dtype=np.float32))
+        inputs = node._tensor_inputs(processor, model, batch, "<CAPTION>")
+        
+        assert inputs["pixel_values"].shape == (2, 3, 8, 8)
+        assert torch.allclose(inputs["pixel_values"], torch.ones(1))
+        assert inputs["input_ids"].shape == (2, 4)
+    
+    def test_onnx_decoding_helpers_mirror_processor(self):
+        config = {
+            "task_prompts_without_inputs": {"<CAPTION>": "What does the image describe?"},
+            "task_prompts_with_input": {"<CAPTION_TO_PHRASE_GROUNDING>": "Locate the phrases in the caption: {input}"},
+        }
+        assert florence2_onnx.construct_prompt("<CAPTION>", config) == "What does the image describe?"
+        assert florence2_onnx.construct_prompt("<CAPTION_TO_PHRASE_GROUNDING>a cat", config) == \
+            "Locate the phrases in the caption: a cat"
+        assert florence2_onnx.construct_prompt("free text", config) == "free text"
+        
+        # "5 6" was followed by 7 and 9: both would repeat a 3-gram
+        assert sorted(florence2_onnx.banned_ngram_tokens([5, 6, 7, 5, 6, 9, 5, 6], 3)) == [7, 9]
+        assert florence2_onnx.banned_ngram_tokens([5, 6], 3) == []
+        assert florence2_onnx.banned_ngram_tokens([5, 6, 7], 0) == []
+    
+    def test_model_manager_keeps_models_within_budget(self):
+        """Several models stay loaded; the least recently used is evicted past the budget"""
+        loads = []
+        
+        def loader(model_id, precision):
+            loads.append(Florence2ModelManager.key(model_id, precision))
+            return f"processor:{model_id}", f"model:{model_id}"
+        
+        sizes = {"base": 300, "large": 900, "ft": 400}
+        manager = Florence2ModelManager(budget_mb=1400, loader=loader,
+                                        sizer=lambda model: sizes[model.split(":")[1]] * 2**20)
+        assert manager.get("base")[1] == "model:base"
+        manager.get("large")
+        processor, model, info = manager.get("base")
+        assert (processor, info["cache_hit"], info["resident_mb"]) == ("processor:base", True, 300)
+        assert loads == ["base", "large"]
+        
+        # 300 + 900 + 400 > 1400: "large" is least recently used
+        manager.get("ft")
+        assert list(manager.stats()["models"]) == ["base", "ft"]
+        
+        # Each precision is its own entry
+        assert manager.get("base", "int8")[2]["cache_hit"] is False
+        assert loads[-1] == "base@int8"
+        
+        manager.configure(idle_seconds=60)
+        assert manager.release_idle() == []
+        assert manager.release_idle(now=manager._entries["base@int8"]["last_used"] + 60) == ["base", "ft", "base@int8"]
+        assert manager.stats()["resident_mb"] == 0
+
+
+class TestWD14Adapter:
+    """Batch handling of the WD14 adapter (inference needs onnxruntime)."""
+    
+    def test_batch_preprocessing_and_micro_batches(self):
+        from types import SimpleNamespace
+        node = BrainsXDEV_WD14Adapter()
+        batch = np.random.default_rng(0).random((5, 40, 30, 3), dtype=np.float32)
+        
+        spec = WD14InputSpec.from_shape("input", ["batch", 3, 224, 224])
+        inp = node._preprocess_batch(batch, spec)
+        assert inp.shape == (5, 3, 224, 224) and inp.flags["C_CONTIGUOUS"]
+        assert np.array_equal(node._preprocess_batch(list(batch), spec)[2], inp[2])
+        
+        dynamic = SimpleNamespace(get_inputs=lambda: [SimpleNamespace(shape=["batch", 3, 224, 224])])
+        fixed = SimpleNamespace(get_inputs=lambda: [SimpleNamespace(shape=[1, 3, 224, 224])])
+        per_image_mb = inp[0].nbytes * 32 / 2**20
+        assert node._micro_batch_size(dynamic, inp, int(per_image_mb * 2) + 1) == 2
+        assert node._micro_batch_size(dynamic, inp, 65536) == 5
+        assert node._micro_batch_size(fixed, inp, 65536) == 1
+    
+    def test_input_spec_padding_and_area_resize(self):
+        from types import SimpleNamespace
+        sess = SimpleNamespace(get_inputs=lambda: [SimpleNamespace(name="input_1:0", shape=["N", 448, 448, 3])])
+        spec = wd14_preprocess.get_input_spec(sess, "test-swinv2.onnx")
+        assert (spec.layout, spec.height, spec.width, spec.bgr, spec.scale) == ("NHWC", 448, 448, True, 255.0)
+        assert wd14_preprocess.get_input_spec(None, "test-swinv2.onnx") is spec
+        
+        # 2:1 image: centred on a white square, area averaged (2x2 blocks here)
+        rng = np.random.default_rng(0)
+        image = rng.random((1, 448, 896, 3), dtype=np.float32)
+        out = wd14_preprocess.preprocess_batch(image, spec)
+        assert out.shape == (1, 448, 448, 3) and out.flags["C_CONTIGUOUS"]
+        assert np.allclose(out[0, :112], 255.0) and np.allclose(out[0, 336:], 255.0)
+        blocks = image[0].reshape(224, 2, 448, 2, 3).mean(axis=(1, 3))
+        assert np.allclose(out[0, 112:336], blocks[..., ::-1] * 255.0, atol=1e-3)
+        
+        # Non-integer factors keep the mean of a flat image
+        flat = np.full((2, 333, 333, 3), 0.25, dtype=np.float32)
+        assert np.allclose(wd14_preprocess.pad_resize(flat, 224, 224), 0.25, atol=1e-5)
+    
+    def test_labels_categories_and_vectorized_selection(self, tmp_path):
+        csv_path = tmp_path / "selected_tags.csv"
+        csv_path.write_text("tag_id,name,category,count\n9999999,general,9,1\n9999998,explicit,9,1\n"
+                            "1,1girl,0,10\n2,solo,0,9\n3,smile,0,8\n4,hatsune_miku,4,7\n", encoding="utf-8")
+        node = BrainsXDEV_WD14Adapter()
+        labels = node._load_labels(str(csv_path))
+        assert list(labels.names) == ["general", "explicit", "1girl", "solo", "smile", "hatsune_miku"]
+        assert list(labels.rating_index) == [0, 1]
+        
+        scores = np.array([[0.9, 0.1, 0.95, 0.5, 0.2, 0.6, 0.99],
+                           [0.2, 0.7, 0.1, 0.4, 0.4, 0.9, 0.0]], dtype=np.float32)
+        (first, first_total), (second, second_total) = node._build_tags(scores, labels, 0.35, 50, 0.85)
+        # Ratings never become tags; characters need character_threshold; extra outputs are ignored
+        assert first == [("1girl", pytest.approx(0.95)), ("solo", pytest.approx(0.5))] and first_total == 2
+        assert second == [("hatsune_miku", pytest.approx(0.9)), ("solo", pytest.approx(0.4)),
+                          ("smile", pytest.approx(0.4))] and second_total == 3
+        assert [name for name, _ in node._build_tags(scores, labels, 0.35, 2, 0.85)[1][0]] == ["hatsune_miku", "solo"]
+        assert wd14_postprocess.rating_scores(scores, labels)[1] == {"general": pytest.approx(0.2),
+                                                                      "explicit": pytest.approx(0.7)}
+        
+        # Matches the per-label loop on a full-size label set
+        rng = np.random.default_rng(0)
+        big = wd14_postprocess.WD14Labels([f"t{i}" for i in range(9000)], rng.choice([0, 4, 9], 9000))
+        row = rng.random(9000, dtype=np.float32)
+        limits = np.where(big.categories == 4, 0.8, 0.35)
+        expected = sorted(((big.names[i], float(row[i])) for i in range(9000)
+                           if big.categories[i] != 9 and row[i] >= limits[i]), key=lambda x: x[1], reverse=True)
+        (tags, total), = node._build_tags(row, big, 0.35, 30, 0.8)
+        assert tags == expected[:30] and total == len(expected)
+    
+    def test_session_settings_key_preloads(self):
+        from promptbrain import wd14_adapter
+        settings = SessionSettings.from_inputs({"intra_op_threads": 4, "execution_mode": "parallel", "min_conf": 0.3})
+        assert (settings.intra_op_threads, settings.inter_op_threads, settings.execution_mode) == (4, 0, "parallel")
+        assert settings.key() == SessionSettings(4, 0, "parallel").key() != SessionSettings().key()
+        with pytest.raises(ValueError):
+            SessionSettings(execution_mode="fastest")
+        
+        # Optimized graphs and profiles are written to the user cache, not the package
+        from promptbrain import ort_session
+        from promptbrain.resource_cache import user_cache_dir
+        for directory in (ort_session.OPTIMIZED_DIR, ort_session.PROFILE_DIR):
+            assert directory.startswith(user_cache_dir())
+        
+        # Tuned sessions are warmed and cached under their own key
+        key, _, is_loaded = wd14_adapter._preload_job({"onnx_model_path": "m.onnx", "intra_op_threads": 4,
+                                                       "execution_mode": "parallel"})
+        assert key == ("wd14", "m.onnx", "selected_tags.csv", settings.key())
+        assert not is_loaded()
+        BrainsXDEV_WD14Adapter._session_cache.get_or_load(("m.onnx", settings.key()), object)
+        try:
+            assert is_loaded()
+        finally:
+            BrainsXDEV_WD14Adapter._session_cache.unload(("m.onnx", settings.key()))
+
+class TestResourceCache:
+    """Bounded model/session cache shared by the AI adapters."""
+    
+    def test_concurrent_misses_load_once(self):
+        import threading, time
+        cache = ResourceCache("test")
+        loads = []
+        
+        def loader():
+            loads.append(1)
+            time.sleep(0.05)
+            return "session"
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("m", loader)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(loads) == 1 and [value for value, _ in results] == ["session"] * 4
+        assert sorted(info["cache_hit"] for _, info in results) == [False, True, True, True]
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (3, 1, 0.75)
+    
+    def test_on_evict_runs_outside_the_cache_lock(self):
+        import threading
+        seen = []
+        
+        def on_evict(key, value):
+            # Another thread must be able to use the cache while the callback runs
+            probe = threading.Thread(target=lambda: seen.append((key, cache.keys())))
+            probe.start()
+            probe.join(timeout=2)
+            assert not probe.is_alive()
+        
+        cache = ResourceCache("test", budget_mb=1, sizer=lambda value: 2**20, on_evict=on_evict)
+        cache.get_or_load("a", lambda: 1)
+        cache.get_or_load("b", lambda: 1)
+        assert seen == [("a", ["b"])]
+        cache.configure(idle_seconds=5)
+        cache.release_idle(now=cache._entries["b"]["last_used"] + 5)
+        assert seen[-1] == ("b", [])
+    
+    def test_lru_by_bytes_and_idle_release(self):
+        evicted = []
+        cache = ResourceCache("test", budget_mb=3, sizer=lambda value: value * 2**20,
+                              on_evict=lambda key, value: evicted.append(key))
+        cache.get_or_load("a", lambda: 1)
+        cache.get_or_load("b", lambda: 1)
+        cache.get_or_load("a", lambda: 1)
+        cache.get_or_load("c", lambda: 2)
+        assert cache.keys() == ["a", "c"] and evicted == ["b"]
+        assert cache.stats()["evictions"] == 1
+        
+        # An entry larger than the budget is still returned
+        assert cache.get_or_load("big", lambda: 5)[0] == 5 and cache.keys() == ["big"]
+        
+        # Failed loads are not cached and do not block the key
+        with pytest.raises(OSError):
+            cache.get_or_load("bad", lambda: (_ for _ in ()).throw(OSError("missing")))
+        assert "bad" not in cache and cache.get_or_load("bad", lambda: 0)[1]["cache_hit"] is False
+        assert cache.keys() == ["bad"] and evicted == ["b", "a", "c", "big"]
+        
+        cache.configure(idle_seconds=30)
+        cache.get_or_load("d", lambda: 1)
+        assert cache.release_idle() == []
+        assert cache.release_idle(now=cache._entries["d"]["last_used"] + 30) == ["bad", "d"]
+        assert len(cache) == 0 and cache.stats()["idle_releases"] == 2
+
+class TestModelPreloader:
+    """Background warm-up jobs shared by the AI adapters."""
+    
+    def test_jobs_run_once_per_key(self):
+        runs = []
+        loaded = {"value": True}
+        pool = preloader.ModelPreloader()
+        
+        def warm():
+            runs.append(1)
+            return len(runs)
+        
+        first = pool.submit("m", warm, lambda: loaded["value"])
+        assert pool.wait("m", warm) == 1
+        assert pool.submit("m", warm) is first
+        assert pool.status() == {"m": "ready"}
+        
+        # Evicted since the preload: warm again
+        loaded["value"] = False
+        assert pool.wait("m", warm, lambda: True) == 2
+        
+        def broken():
+            raise RuntimeError("missing weights")
+        
+        with pytest.raises(RuntimeError):
+            pool.wait("bad", broken)
+        assert pool.wait("bad", warm) == 3
+    
+    def test_nodes_do_not_queue_behind_other_preloads(self):
+        import threading
+        started, release = threading.Event(), threading.Event()
+        runs = []
+        pool = preloader.ModelPreloader()
+        
+        def slow_load():
+            started.set()
+            release.wait(5)
+            runs.append("florence2")
+        
+        running = pool.submit("florence2", slow_load)
+        pool.submit("wd14", lambda: runs.append("wd14"))
+        assert started.wait(5)
+        
+        # Queued behind florence2: cancelled, the node loads inline instead
+        assert pool.join("wd14") is False
+        assert pool.join("never-preloaded") is False
+        assert "wd14" not in pool.status()
+        
+        release.set()
+        assert pool.join("florence2") is True
+        assert running.done() and runs == ["florence2"]
+    
+    def test_configured_and_queued_preloads(self):
+        started = []
+        preloader.register_preload(
+            "TestPreloadNode", "testnode", ("model", "labels"),
+            lambda inputs: (("testnode", inputs["model"], inputs.get("labels")),
+                            lambda: started.append((inputs["model"], inputs.get("labels"))), None)
+        )
+        assert preloader.preload_configured("testnode:a.onnx|a.csv; unknown:x") == 1
+        
+        prompt = {"prompt": {
+            "1": {"class_type": "TestPreloadNode", "inputs": {"model": "b.onnx", "labels": ["4", 0]}},
+            "2": {"class_type": "KSampler", "inputs": {}},
+        }}
+        assert preloader._on_prompt(prompt) is prompt
+        preloader.PRELOADER.wait(("testnode", "b.onnx", None), lambda: None)
+        assert sorted(started) == [("a.onnx", "a.csv"), ("b.onnx", None)]
+
+class TestPromptBrainSuggestDirect:
+    """Test BRAIN-based prompt suggestions."""
+    
+    def _brain(self):
+        brain = BrainData()
+        brain.add_learning_event("cat, sunset, bokeh, golden hour", 0.9,
+                                 ["cat", "sunset", "bokeh", "golden hour"])
+        return brain
+    
+    def test_suggestions_are_deterministic_per_seed(self):
+        node = BrainsXDEV_PromptBrainSuggestDirect()
+        first = node.suggest_direct(self._brain(), "cat", 3, creativity=0.6, seed=7)
+        second = node.suggest_direct(self._brain(), "cat", 3, creativity=0.6, seed=7)
+        
+        assert first[1:] == second[1:]
+    
+    def test_suggestions_leave_global_random_untouched(self):
+        import random
+        node = BrainsXDEV_PromptBrainSuggestDirect()
+        random.seed(1234)
+        expected = random.random()
+        random.seed(1234)
+        node.suggest_direct(self._brain(), "cat", 3, creativity=0.6)
+        
+        assert random.random() == expected
+    
+    def test_suggestion_count_beyond_three(self):
+        node = BrainsXDEV_PromptBrainSuggestDirect()
+        result = node.suggest_direct(self._brain(), "cat", 12, creativity=0.6, seed=1)
+        variations = result[4].split("\n")
+        
+        assert len(variations) == 12
+        assert variations[:3] == list(result[1:4])
+        assert all(v.startswith("cat") for v in variations)
+    
+    def test_batch_matches_direct_variations(self):
+        direct = BrainsXDEV_PromptBrainSuggestDirect()
+        batch = BrainsXDEV_PromptBrainSuggestBatch()
+        _, s1, s2, s3, _ = direct.suggest_direct(self._brain(), "cat", 3, creativity=0.6, seed=5)
+        _, prompts, metadata, summary = batch.suggest_batch(self._brain(), "cat", 64, creativity=0.6, seed=5)
+        
+        assert batch.OUTPUT_IS_LIST == (False, True, True, False)
+        assert len(prompts) == 64 and len(metadata) == 64
+        assert prompts[:3] == [s1, s2, s3]
+        assert metadata[10]["variation"] == 10
+        assert isinstance(summary, str)
+    
+    def test_memoized_suggestions_follow_brain_version(self):
+        brain = self._brain()
+        version = brain.version
+        first = brain.get_suggestions(["cat"])
+        
+        # style / feature do not affect suggestions, so they share one cache entry
+        misses = BRAIN_RESULT_CACHE.misses
+        assert brain.get_suggestions(["cat"], style="anime", feature="lighting") == first
+        assert BRAIN_RESULT_CACHE.misses == misses
+        
+        brain.add_learning_event("cat, moonlight", 0.95, ["cat", "moonlight"])
+        
+        assert brain.version == version + 1
+        assert "moonlight" in brain.get_suggestions(["cat"])
+        assert "moonlight" not in first
+
+
+
+def _baseline_family_metrics(img):
+    """
+    The per-family formulas of PromptBrainQualityScore before the fused kernel
+    (sharpness, color, composition, noise level), inlined as the reference.
+    """
+    gray = np.mean(img, axis=2)
+    height, width = gray.shape
+    
+    grad_x = np.abs(np.diff(gray, axis=1))
+    grad_y = np.abs(np.diff(gray, axis=0))
+    laplacian = np.abs(gray[1:-1, 1:-1] * 4 - gray[:-2, 1:-1] - gray[2:, 1:-1] - gray[1:-1, :-2] - gray[1:-1, 2:])
+    edge_threshold = np.std(gray) * 0.5
+    sharpness = {
+        "gradient_sharpness": (np.mean(grad_x) + np.mean(grad_y)) / 2,
+        "laplacian_sharpness": np.mean(laplacian),
+        "variance_sharpness": np.var(gray),
+        "edge_density": ((grad_x > edge_threshold).sum() + (grad_y > edge_threshold).sum()) / gray.size
+    }
+    
+    r, g, b = img[:, :, 0], img[:, :, 1], img[:, :, 2]
+    max_rgb = np.maximum(np.maximum(r, g), b)
+    min_rgb = np.minimum(np.minimum(r, g), b)
+    color = {
+        "color_balance": 1.0 - min(1.0, np.var([np.mean(r), np.mean(g), np.mean(b)]) * 10),
+        "color_saturation": np.mean((max_rgb - min_rgb) / (max_rgb + 1e-8)),
+        "color_harmony": 1.0 - min(1.0, np.var(np.arctan2(g - b, r - g) % (2 * np.pi)) / np.pi),
+        "color_temperature": 0.5 + np.mean(b) - np.mean(r),
+        "red_range": np.max(r) - np.min(r),
+        "green_range": np.max(g) - np.min(g),
+        "blue_range": np.max(b) - np.min(b)
+    }
+    color["avg_dynamic_range"] = (color["red_range"] + color["green_range"] + color["blue_range"]) / 3
+    
+    third_h, third_w = height // 3, width // 3
+    section_variances = [np.var(gray[i * third_h:(i + 1) * third_h, j * third_w:(j + 1) * third_w])
+                         for i in range(3) for j in range(3)]
+    center = np.var(gray[height // 4:3 * height // 4, width // 4:3 * width // 4])
+    edge = (np.var(gray[:height // 4, :]) + np.var(gray[3 * height // 4:, :]) +
+            np.var(gray[:, :width // 4]) + np.var(gray[:, 3 * width // 4:])) / 4
+    composition = {
+        "rule_of_thirds": np.mean([section_variances[i] for i in (1, 3, 5, 7)]) / (np.mean(section_variances) + 1e-8),
+        "horizontal_balance": 1.0 - abs(np.mean(gray[:, :width // 2]) - np.mean(gray[:, width // 2:])),
+        "vertical_balance": 1.0 - abs(np.mean(gray[:height // 2, :]) - np.mean(gray[height // 2:, :])),
+        "center_focus": center / (center + edge + 1e-8)
+    }
+    
+    high_freq = (np.mean(np.abs(np.diff(gray, n=2, axis=0))) + np.mean(np.abs(np.diff(gray, n=2, axis=1)))) / 2
+    noise = {"noise_level": min(1.0, high_freq * 20)}
+    noise["clarity"] = 1.0 - noise["noise_level"]
+    return {"sharpness": sharpness, "color": color, "composition": composition, "noise": noise}
+
+
+class TestQualityMetricsKernel:
+    """Test the fused image metrics kernel behind PromptBrainQualityScore."""
+    
+    def test_kernel_matches_baseline_formulas(self):
+        """The fused kernel reproduces the original per-family formulas"""
+        rng = np.random.default_rng(0)
+        img = rng.random((67, 45, 3), dtype=np.float32)
+        metrics = quality_metrics.compute_image_metrics(img)
+        
+        for section, expected in _baseline_family_metrics(img).items():
+            for name, value in expected.items():
+                assert metrics[section][name] == pytest.approx(float(value), rel=1e-5, abs=1e-6), name
+        assert metrics["technical"]["brightness"] == pytest.approx(float(img.mean()), abs=1e-6)
+    
+    def test_node_methods_use_kernel(self):
+        rng = np.random.default_rng(0)
+        img = rng.random((67, 45, 3), dtype=np.float32)
+        node = BrainsXDEV_PromptBrainQualityScore()
+        metrics = quality_metrics.compute_image_metrics(img)
+        
+        assert metrics["sharpness"] == node.calculate_enhanced_sharpness(img)
+        assert metrics["color"] == node.analyze_color_properties(img)
+        assert metrics["composition"] == node.analyze_composition(img)
+        assert metrics["noise"] == node.detect_noise_and_artifacts(img)
+    
+    def test_kernel_on_flat_image(self):
+        img = np.full((32, 32, 3), 0.5, dtype=np.float32)
+        metrics = quality_metrics.compute_image_metrics(img)
+        
+        assert metrics["sharpness"]["gradient_sharpness"] == 0.0
+        assert metrics["sharpness"]["laplacian_sharpness"] == 0.0
+        assert metrics["noise"]["noise_level"] == 0.0
+        assert metrics["technical"]["dynamic_range"] == 0.0
+    
+    def test_grid_sections_use_block_view(self):
+        plane = np.arange(36, dtype=np.float32).reshape(6, 6)
+        blocks = quality_metrics.block_reduce_view(plane, 2, 3)
+        
+        assert blocks.shape == (3, 2, 2, 3)
+        assert blocks.mean(axis=(1, 3))[0, 0] == plane[:2, :3].mean()
+
+    def test_batch_scoring_ranks_every_image(self):
+        rng = np.random.default_rng(2)
+        y, x = np.mgrid[0:48, 0:48].astype(np.float32) / 48
+        textured = np.stack([x, y, (x + y) / 2], axis=2) * 0.6 + rng.random((48, 48, 3), dtype=np.float32) * 0.4
+        flat = np.full((48, 48, 3), 0.5, dtype=np.float32)
+        batch = np.stack([flat, textured, flat * 0.2])
+        node = BrainsXDEV_PromptBrainQualityScore()
+
+        result = node.analyze_quality(batch, "a detailed cinematic landscape")
+        score, _, _, _, _, _, best_image, batch_scores, ranking, best_index = result[:10]
+
+        assert len(batch_scores) == 3
+        assert sorted(ranking) == [0, 1, 2]
+        assert [batch_scores[i] for i in ranking] == sorted(batch_scores, reverse=True)
+        assert best_index == ranking[0] and score == batch_scores[best_index]
+        assert np.array_equal(best_image, batch[best_index:best_index + 1])
+
+        single = node.analyze_quality(batch[best_index:best_index + 1], "a detailed cinematic landscape")
+        assert single[0] == score and single[8] == [0]
+
+    @pytest.mark.skipif(not quality_metrics.TORCH_AVAILABLE, reason="torch not installed")
+    def test_torch_backend_matches_numpy(self):
+        rng = np.random.default_rng(3)
+        batch = rng.random((2, 40, 56, 3), dtype=np.float32)
+        numpy_metrics = quality_metrics.compute_batch_metrics(batch, backend="numpy")
+        torch_metrics = quality_metrics.compute_batch_metrics(quality_metrics.torch.from_numpy(batch), backend="torch")
+
+        for expected, actual in zip(numpy_metrics, torch_metrics):
+            for section in ("sharpness", "color", "composition", "noise", "exposure"):
+                assert actual[section].keys() == expected[section].keys()
+                for name, value in expected[section].items():
+                    assert actual[section][name] == pytest.approx(value, rel=1e-3, abs=1e-3), name
+
+    def test_torch_threads_are_restored(self):
+        """A thread-limited torch run matches NumPy and leaves torch's global thread count alone"""
+        torch = pytest.importorskip("torch")
+        rng = np.random.default_rng(6)
+        batch = rng.random((3, 32, 48, 3), dtype=np.float32)
+        before = torch.get_num_threads()
+        
+        torch_metrics = quality_metrics.compute_batch_metrics(torch.from_numpy(batch), backend="torch",
+                                                              num_threads=max(1, before - 1) if before > 1 else 2)
+        
+        assert torch.get_num_threads() == before
+        for expected, actual in zip(quality_metrics.compute_batch_metrics(batch, backend="numpy"), torch_metrics):
+            for name in ("brightness", "contrast"):
+                assert actual["technical"][name] == pytest.approx(expected["technical"][name], rel=1e-4, abs=1e-5)
+            for name, value in expected["sharpness"].items():
+                assert actual["sharpness"][name] == pytest.approx(value, rel=1e-3, abs=1e-3), name
+
+    def test_pyramid_metrics_track_full_resolution(self):
+        y, x = np.mgrid[0:512, 0:384].astype(np.float32) / 512
+        img = np.stack([np.sin(9 * x) * 0.3 + 0.5, y, (x + y) / 2], axis=2)
+        img += np.random.default_rng(4).random(img.shape, dtype=np.float32) * 0.05
+        full = quality_metrics.compute_image_metrics(img)
+
+        within_budget = quality_metrics.compute_pyramid_metrics(img, pixel_budget=img.shape[0] * img.shape[1])
+        assert within_budget["sharpness"] == full["sharpness"]
+        assert within_budget["pyramid"]["analyzed_fraction"] == 1.0
+
+        pyramid = quality_metrics.compute_pyramid_metrics(img, pixel_budget=16384)
+        assert pyramid["pyramid"]["global_level"] == 2
+        assert pyramid["pyramid"]["analyzed_fraction"] < 0.25
+        assert pyramid["color"]["red_range"] == pytest.approx(full["color"]["red_range"])
+        for section in ("sharpness", "color", "composition", "noise"):
+            for name, value in full[section].items():
+                assert pyramid[section][name] == pytest.approx(value, abs=0.05), name
+
+    def test_block_artifacts_follow_dct_grid(self):
+        rng = np.random.default_rng(1)
+        blocky = np.kron(rng.random((8, 8)), np.ones((8, 8))).astype(np.float32)
+        noise = rng.random((64, 64), dtype=np.float32)
+        flat = np.full((64, 64), 0.5, dtype=np.float32)
+
+        assert quality_metrics.block_artifact_metrics(blocky)["blocking_artifacts"] > 0.9
+        assert quality_metrics.block_artifact_metrics(noise)["blocking_artifacts"] < 0.2
+        assert quality_metrics.block_artifact_metrics(flat)["blocking_artifacts"] == 0.0
+        # The block-variance diagnostic is opt-in
+        assert "block_variance_uniformity" not in quality_metrics.block_artifact_metrics(noise)
+        assert quality_metrics.block_artifact_metrics(noise, uniformity=True)["block_variance_uniformity"] > 0.5
+
+
+
+class TestQualityMetricsDatatype:
+    """Test the structured QUALITY_METRICS hand-off between quality and sampler nodes."""
+    
+    def _score(self):
+        rng = np.random.default_rng(5)
+        img = rng.random((1, 48, 48, 3), dtype=np.float32)
+        return BrainsXDEV_PromptBrainQualityScore().analyze_quality(img, "a detailed cinematic portrait")
+    
+    def test_quality_score_emits_structured_metrics(self):
+        result = self._score()
+        metrics = result[10]
+        
+        assert isinstance(metrics, QualityMetrics)
+        assert not hasattr(metrics, "__dict__")
+        assert metrics.final_score == result[0]
+        assert metrics.technical_score == result[3]
+        assert metrics.grade == result[2]
+    
+    def test_structured_metrics_match_legacy_text(self):
+        result = self._score()
+        parsed = BrainsXDEV_PromptBrainKSamplerDirect().parse_quality_analysis(result[1])
+        structured = result[10].to_dict()
+        
+        assert structured.keys() == parsed.keys()
+        for key, value in structured.items():
+            if isinstance(value, float):
+                assert parsed[key] == pytest.approx(value, abs=1e-3), key
+    
+    def test_auto_quality_rater_batch_mode(self, monkeypatch):
+        """Without batch_mode only the first image is rated; with it every image gets a score"""
+        import auto_quality_rater
+        monkeypatch.setattr(auto_quality_rater, "BrainsXDEV_PromptBrainQualityScore",
+                            BrainsXDEV_PromptBrainQualityScore)
+        rng = np.random.default_rng(5)
+        batch = rng.random((3, 48, 48, 3), dtype=np.float32)
+        rater = auto_quality_rater.BrainsXDEV_AutoQualityRater()
+        
+        single = rater.rate_image(batch, "a portrait")
+        full = rater.rate_image(batch, "a portrait", batch_mode=True)
+        
+        assert len(single[3]) == 1
+        assert len(full[3]) == 3
+        assert single[3][0] == pytest.approx(full[3][0])
+    
+    def test_auto_quality_rater_parallel_matches_serial(self, monkeypatch):
+        """Batch slices scored on the thread pool give the single-call result"""
+        import auto_quality_rater
+        monkeypatch.setattr(auto_quality_rater, "BrainsXDEV_PromptBrainQualityScore",
+                            BrainsXDEV_PromptBrainQualityScore)
+        monkeypatch.setattr(auto_quality_rater, "_SCORING_POOL", None)
+        rng = np.random.default_rng(9)
+        y, x = np.mgrid[0:48, 0:48].astype(np.float32) / 48
+        textured = np.stack([x, y, (x + y) / 2], axis=2) * 0.6 + rng.random((48, 48, 3), dtype=np.float32) * 0.4
+        flat = np.full((48, 48, 3), 0.5, dtype=np.float32)
+        batch = np.stack([flat, flat * 0.3, flat * 0.8, textured, flat * 0.6])
+        rater = auto_quality_rater.BrainsXDEV_AutoQualityRater()
+        
+        monkeypatch.setattr(auto_quality_rater, "SCORING_WORKERS", 1)
+        serial = rater.rate_image(batch, "a portrait", batch_mode=True)
+        monkeypatch.setattr(auto_quality_rater, "SCORING_WORKERS", 3)
+        parallel = rater.rate_image(batch, "a portrait", batch_mode=True)
+        
+        assert parallel[3] == pytest.approx(serial[3])
+        assert parallel[0] == pytest.approx(serial[0])
+        assert parallel[2] == serial[2]
+        assert "best is #4" in serial[1] and "best is #4" in parallel[1]
+        assert auto_quality_rater._SCORING_POOL is not None
+    
+    def test_optimizer_prefers_structured_metrics(self):
+        metrics = QualityMetrics(final_score=0.3, technical_score=0.3, sharpness=0.1, contrast=0.2)
+        optimizer = BrainsXDEV_PromptBrainParameterOptimizer()
+        _, steps, cfg, sampler, scheduler, report = optimizer.optimize_parameters(
+            BrainData(), quality_analysis="", quality_metrics=metrics
+        )
+        expected = BrainsXDEV_PromptBrainKSamplerDirect().optimize_parameters(metrics.to_dict(), 1.0)
+        
+        assert (steps, cfg, sampler, scheduler) == expected
+        assert steps > 20 and sampler == "dpmpp_2m"
+
+    
+    def test_metrics_cache_skips_known_images(self, tmp_path):
+        rng = np.random.default_rng(6)
+        batch = rng.random((3, 32, 32, 3), dtype=np.float32)
+        options = {"enable_noise": True, "pixel_budget": 0}
+        computed = []
+        
+        def compute(images):
+            computed.append(len(images))
+            return quality_metrics.compute_batch_metrics(images)
+        
+        cache = QualityMetricsCache(db_path=str(tmp_path / "cache.db"))
+        first = cache.batch_metrics(batch[:2], options, compute, persist=True)
+        second = cache.batch_metrics(batch, options, compute, persist=True)
+        
+        assert computed == [2, 1]
+        assert second[:2] == first
+        assert (cache.hits, cache.misses) == (2, 3)
+        
+        # A new process-level cache is served from SQLite
+        restarted = QualityMetricsCache(db_path=str(tmp_path / "cache.db"))
+        assert restarted.batch_metrics(batch, options, compute, persist=True) == second
+        assert computed == [2, 1]
+        
+        # Different options or pixels are different keys
+        cache.batch_metrics(batch[:1], {"enable_noise": False, "pixel_budget": 0}, compute)
+        edited = batch[:1].copy()
+        edited[0, 5, 7, 1] += 0.01
+        cache.batch_metrics(edited, options, compute)
+        assert computed == [2, 1, 1, 1]
+        # Pixels swapped within a row (same row sums, off any sampling grid) change the key
+        large = rng.random((512, 512, 3), dtype=np.float32)
+        swapped = large.copy()
+        swapped[9, [13, 15]] = swapped[9, [15, 13]]
+        assert quality_metrics.image_fingerprint(swapped) != quality_metrics.image_fingerprint(large)
+        
+        # Callers get deep copies: nested sections can't corrupt the cache
+        first[0]["technical"]["resolution"]["width"] = -1
+        assert cache.batch_metrics(batch[:1], options, compute)[0]["technical"]["resolution"]["width"] == 32
+        
+        # The default database lives outside the source tree
+        assert not os.path.abspath(QualityMetricsCache().db_path).startswith(os.path.dirname(quality_metrics.__file__))
+
+    
+    def test_semantic_matcher_matches_substring_counts(self):
+        """Deduplicated term table keeps per-vocabulary substring semantics, shared terms included"""
+        captions = [
+            "Hyperdetailed cinematic photograph, bokeh, 8K HDR, golden hour",
+            "an artistic watercolor sketch with dramatic lighting",
+            "plain text",
+        ]
+        for depth in ("basic", "expert", "unknown"):
+            matcher = get_semantic_matcher(depth)
+            quality_list = QUALITY_VOCABULARY.get(depth, QUALITY_VOCABULARY["standard"])
+            for caption, counts in zip(captions, matcher.count_many(captions)):
+                lowered = caption.lower()
+                assert counts == {
+                    "quality": sum(1 for word in quality_list if word in lowered),
+                    "style": sum(1 for word in STYLE_INDICATORS if word in lowered),
+                    "technical": sum(1 for word in TECHNICAL_TERMS if word in lowered),
+                }
+        assert get_semantic_matcher("unknown") is get_semantic_matcher("standard")
+        
+        node = BrainsXDEV_PromptBrainQualityScore()
+        batch = node.analyze_semantic_quality_batch(captions + [""], "expert")
+        assert batch == [node.analyze_semantic_quality(c, "expert") for c in captions + [""]]
+    
+    def test_semantic_batch_looks_up_matcher_once(self, monkeypatch):
+        import brain_datatype
+        lookups = []
+        
+        def counting_matcher(depth):
+            lookups.append(depth)
+            return get_semantic_matcher(depth)
+        
+        monkeypatch.setattr(brain_datatype, "get_semantic_matcher", counting_matcher)
+        captions = ["cinematic photograph, bokeh", "a watercolor sketch", "masterpiece, 8k"]
+        batch = BrainsXDEV_PromptBrainQualityScore().analyze_semantic_quality_batch(captions, "basic")
+        
+        assert lookups == ["basic"]
+        assert len(batch) == 3
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+Brains-XDEV Quality Metrics Benchmark
+
+Times the PromptBrain quality-scoring kernels on synthetic images:
+- legacy per-block Python loop for blocking artifacts (reference)
+- vectorized block_artifact_metrics
+- full compute_image_metrics pass
+- batched torch backend (when torch is installed)
+- pyramid analysis: accuracy vs speed per pixel budget
+
+Usage:
+    python tools/benchmark_quality_metrics.py
+    python tools/benchmark_quality_metrics.py --sizes 512,1024,2048 --repeat 5
+    python tools/benchmark_quality_metrics.py --batch 8 --threads 4
+    python tools/benchmark_quality_metrics.py --sizes 2048,4096 --budgets 4194304,1048576,262144
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import quality_metrics  # noqa: E402
+from brain_datatype import BrainsXDEV_PromptBrainQualityScore  # noqa: E402
+
+METRIC_SECTIONS = ("technical", "sharpness", "color", "composition", "noise", "exposure")
+
+
+def legacy_block_variance_uniformity(gray: np.ndarray, block_size: int = 8) -> float:
+    """The original nested-loop block scan, kept here as the baseline"""
+    block_variances = []
+    for i in range(0, gray.shape[0] - block_size, block_size):
+        for j in range(0, gray.shape[1] - block_size, block_size):
+            block = gray[i:i + block_size, j:j + block_size]
+            block_variances.append(np.var(block))
+    return 1.0 - np.var(block_variances) / (np.mean(block_variances) + 1e-8)
+
+
+def make_image(size: int, seed: int = 0) -> np.ndarray:
+    """Smooth gradient + texture + mild 8x8 blocking, float32 HxWx3 in [0, 1]"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = 0.5 + 0.3 * np.sin(6 * x) * np.cos(4 * y)
+    blocks = np.kron(rng.random((size // 8 + 1, size // 8 + 1)), np.ones((8, 8)))[:size, :size]
+    gray = base + 0.05 * blocks + 0.02 * rng.standard_normal((size, size))
+    img = np.stack([gray, gray * 0.9 + 0.05, gray * 0.8 + 0.1], axis=2)
+    return np.clip(img, 0, 1).astype(np.float32)
+
+
+def time_call(fn, repeat: int) -> float:
+    """Best-of-N wall time in milliseconds"""
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def max_metric_deviation(reference, candidate):
+    """Largest absolute difference over every scalar metric, with its name"""
+    worst_name, worst = "", 0.0
+    for section in METRIC_SECTIONS:
+        for name, value in reference[section].items():
+            if isinstance(value, (int, float)):
+                delta = abs(candidate[section][name] - value)
+                if delta > worst:
+                    worst_name, worst = f"{section}.{name}", delta
+    return worst_name, worst
+
+
+def pyramid_report(sizes, budgets, repeat):
+    """Accuracy-vs-speed table for pyramid analysis against full resolution"""
+    node = BrainsXDEV_PromptBrainQualityScore()
+    caption = "a detailed cinematic landscape, golden hour"
+    print(f"\nPyramid analysis vs full resolution:")
+    print(f"{'size':>6} | {'budget':>10} | {'metrics':>10} | {'speedup':>8} | {'score delta':>11} | worst metric")
+    print("-" * 86)
+    for size in sizes:
+        img = make_image(size)
+        full_ms = time_call(lambda: quality_metrics.compute_image_metrics(img), repeat)
+        full_metrics = quality_metrics.compute_image_metrics(img)
+        full_score = node.analyze_quality(img[None], caption)[0]
+        print(f"{size:>6} | {'full':>10} | {full_ms:>7.1f} ms | {'1.0x':>8} | {0.0:>11.4f} |")
+        for budget in budgets:
+            pyramid_ms = time_call(lambda: quality_metrics.compute_pyramid_metrics(img, budget), repeat)
+            pyramid_metrics = quality_metrics.compute_pyramid_metrics(img, budget)
+            score = node.analyze_quality(img[None], caption, analysis_resolution="pyramid", pixel_budget=budget)[0]
+            worst_name, worst = max_metric_deviation(full_metrics, pyramid_metrics)
+            print(f"{size:>6} | {budget:>10,} | {pyramid_ms:>7.1f} ms | {full_ms / pyramid_ms:>7.1f}x | "
+                  f"{abs(score - full_score):>11.4f} | {worst_name} {worst:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PromptBrain quality metric kernels")
+    parser.add_argument("--sizes", default="512,1024,2048", help="Comma-separated square image sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement (best is reported)")
+    parser.add_argument("--batch", type=int, default=4, help="Batch size for the batched backends")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = torch default)")
+    parser.add_argument("--budgets", default="1048576,262144", help="Comma-separated pyramid pixel budgets")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    print(f"{'size':>6} | {'legacy blocks':>14} | {'vector blocks':>14} | {'speedup':>8} | {'full kernel':>12}")
+    print("-" * 68)
+    for size in sizes:
+        img = make_image(size)
+        gray = quality_metrics.ImageFeatures(img).gray
+
+        legacy_ms = time_call(lambda: legacy_block_variance_uniformity(gray), args.repeat)
+        vector_ms = time_call(lambda: quality_metrics.block_artifact_metrics(gray, uniformity=True), args.repeat)
+        full_ms = time_call(lambda: quality_metrics.compute_image_metrics(img), args.repeat)
+
+        print(f"{size:>6} | {legacy_ms:>11.1f} ms | {vector_ms:>11.1f} ms | "
+              f"{legacy_ms / vector_ms:>7.1f}x | {full_ms:>9.1f} ms")
+
+    print(f"\nBatched scoring, {args.batch} images per batch:")
+    for size in sizes:
+        batch = np.stack([make_image(size, seed) for seed in range(args.batch)])
+        numpy_ms = time_call(lambda: quality_metrics.compute_batch_metrics(batch, backend="numpy"), args.repeat)
+        line = f"{size:>6} | numpy {numpy_ms:>9.1f} ms"
+        if quality_metrics.TORCH_AVAILABLE:
+            tensor = quality_metrics.torch.from_numpy(batch)
+            torch_ms = time_call(lambda: quality_metrics.compute_batch_metrics(
+                tensor, backend="torch", num_threads=args.threads), args.repeat)
+            line += f" | torch {torch_ms:>9.1f} ms ({numpy_ms / torch_ms:.1f}x)"
+        else:
+            line += " | torch not installed"
+        print(line)
+
+    pyramid_report(sizes, [int(b) for b in args.budgets.split(",") if b.strip()], args.repeat)
+
+    artifacts = quality_metrics.block_artifact_metrics(quality_metrics.ImageFeatures(make_image(sizes[-1])).gray)
+    print(f"\nSample ({sizes[-1]}px): grid_discontinuity={artifacts['grid_discontinuity']:.3f}, "
+          f"blocking_artifacts={artifacts['blocking_artifacts']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
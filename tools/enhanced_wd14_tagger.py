@@ -8,24 +8,18 @@ import numpy as np
 from PIL import Image
 import torch
 
-# Add provider manager to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
-provider_paths = [
-    os.path.join(current_dir, "..", "ComfyUI-ReActor", "rt"),
-    os.path.join(current_dir, "rt"),
-]
 
-for path in provider_paths:
-    if os.path.exists(os.path.join(path, "providers.py")) and path not in sys.path:
-        sys.path.insert(0, path)
-        break
+# Shared WD14 preprocessing and ONNX Runtime session factory (src/promptbrain)
+sys.path.insert(0, os.path.join(current_dir, "..", "src"))
+from promptbrain.wd14_preprocess import get_input_spec, preprocess_batch
+from promptbrain.wd14_postprocess import WD14Labels, select_tags
+from promptbrain.ort_session import EXECUTION_MODES, SessionSettings, create_session, end_profiling
+from promptbrain.resource_cache import ResourceCache, file_nbytes
 
-# Try to import enhanced provider management
-try:
-    from providers import make_session, get_provider_info
-    ENHANCED_PROVIDERS = True
-except ImportError:
-    ENHANCED_PROVIDERS = False
+# Shared by every node instance: bounded by model file size, one load per model
+MODEL_CACHE = ResourceCache("WD14Tagger session", budget_mb=2048)
+LABELS_CACHE = ResourceCache("WD14Tagger labels", budget_mb=64, sizer=lambda labels: labels.nbytes)
 
 class EnhancedWD14TaggerNode:
     """
@@ -70,6 +64,21 @@ class EnhancedWD14TaggerNode:
                     "label_on": "Profiling ON",
                     "label_off": "Profiling OFF"
                 }),
+                "intra_op_threads": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1
+                }),
+                "inter_op_threads": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1
+                }),
+                "execution_mode": (EXECUTION_MODES, {
+                    "default": "sequential"
+                }),
             }
         }
     
@@ -80,7 +89,8 @@ class EnhancedWD14TaggerNode:
     
     def __init__(self):
         self.models_dir = os.path.join(os.path.dirname(__file__), "models")
-        self.model_cache = {}
+        self.model_cache = MODEL_CACHE
+        self.labels_cache = LABELS_CACHE
         self.current_provider = "Unknown"
         
         # Ensure models directory exists
@@ -98,75 +108,17 @@ class EnhancedWD14TaggerNode:
         providers = [p.strip() for p in provider_string.split(",")]
         return [p for p in providers if p] or None
     
-    def _create_enhanced_session(
-        self,
-        model_path: str,
-        provider_override=None,
-        enable_debug: bool = False,
-        enable_profiling: bool = False
-    ):
-        """Create ONNX session with enhanced provider management"""
-        
-        if ENHANCED_PROVIDERS:
-            try:
-                session, provider = make_session(
-                    model_path=model_path,
-                    log=print if enable_debug else None,
-                    override=provider_override,
-                    enable_profiling=enable_profiling
-                )
-                
-                self.current_provider = provider
-                self._log(f"âœ… Enhanced session created with {provider}", enable_debug)
-                return session
-                
-            except Exception as e:
-                self._log(f"Enhanced session failed: {e}, using fallback", enable_debug)
-        
-        # Fallback method
-        return self._create_fallback_session(model_path, provider_override, enable_debug)
-    
-    def _create_fallback_session(
+    def _create_session(
         self,
         model_path: str,
         provider_override=None,
+        settings: SessionSettings = None,
         enable_debug: bool = False
     ):
-        """Fallback session creation"""
-        
-        import onnxruntime as ort
-        
-        available = ort.get_available_providers()
-        
-        if provider_override:
-            providers = [p for p in provider_override if p in available]
-        else:
-            providers = []
-            for pref in ["DmlExecutionProvider", "CUDAExecutionProvider", "CPUExecutionProvider"]:
-                if pref in available:
-                    providers.append(pref)
-        
-        if not providers:
-            providers = ["CPUExecutionProvider"]
-        
-        self._log(f"Fallback mode - Available: {available}", enable_debug)
-        self._log(f"Fallback mode - Using: {providers}", enable_debug)
-        
-        # Try each provider
-        for provider in providers:
-            try:
-                session = ort.InferenceSession(model_path, providers=[provider])
-                self.current_provider = provider
-                self._log(f"âœ… Fallback success with {provider}", enable_debug)
-                return session
-            except Exception as e:
-                self._log(f"âŒ {provider} failed: {e}", enable_debug)
-                continue
-        
-        # Final CPU attempt
-        session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
-        self.current_provider = "CPUExecutionProvider"
-        self._log(f"âš ï¸ Final CPU fallback", enable_debug)
+        """Create a tuned ONNX session with the shared factory (provider preference and fallback)"""
+        session, provider = create_session(model_path, settings, providers=provider_override)
+        self.current_provider = provider
+        self._log(f"Session created with {provider} ({settings})", enable_debug)
         return session
     
     def _get_model_path(self, model_name: str) -> str:
@@ -190,58 +142,51 @@ class EnhancedWD14TaggerNode:
         model_name: str,
         provider_override=None,
         enable_debug: bool = False,
-        enable_profiling: bool = False
+        settings: SessionSettings = None
     ):
-        """Load or get cached model"""
+        """Load or get cached model (profiling sessions are not cached: profiling ends after one run)"""
         
-        cache_key = f"{model_name}_{str(provider_override)}_{enable_profiling}"
-        
-        if cache_key in self.model_cache:
-            self._log(f"Using cached model for {model_name}", enable_debug)
-            return self.model_cache[cache_key]
+        settings = settings or SessionSettings()
+        cache_key = (model_name, tuple(provider_override or ()), settings.key())
         
         # Get model path
         model_path = self._download_model_if_needed(model_name, enable_debug)
         
-        # Create session
-        session = self._create_enhanced_session(
-            model_path=model_path,
-            provider_override=provider_override,
-            enable_debug=enable_debug,
-            enable_profiling=enable_profiling
-        )
+        def create():
+            return self._create_session(
+                model_path=model_path,
+                provider_override=provider_override,
+                settings=settings,
+                enable_debug=enable_debug
+            )
+        
+        if settings.profiling:
+            return create()
         
-        # Cache the session
-        self.model_cache[cache_key] = session
-        self._log(f"Model {model_name} loaded and cached", enable_debug)
+        # Cached sessions are shared between node instances; concurrent runs load once
+        session, info = self.model_cache.get_or_load(cache_key, create, nbytes=file_nbytes(model_path))
+        self.current_provider = session.get_providers()[0]
+        self._log(f"Model {model_name} {'from cache' if info['cache_hit'] else 'loaded and cached'}", enable_debug)
         
         return session
     
-    def _preprocess_image(self, image):
-        """Preprocess image for WD14 tagger"""
-        # Convert ComfyUI image format to PIL
-        if isinstance(image, torch.Tensor):
-            image = image.squeeze().numpy()
-            if image.ndim == 3:
-                image = (image * 255).astype(np.uint8)
-                image = Image.fromarray(image)
-            else:
-                raise ValueError("Unsupported image format")
-        
-        # Resize to model input size (typically 448x448 for WD14)
-        target_size = 448
-        image = image.convert('RGB')
-        image = image.resize((target_size, target_size), Image.LANCZOS)
-        
-        # Convert to numpy array and normalize
-        image_array = np.array(image).astype(np.float32)
-        image_array = image_array / 255.0
-        
-        # Add batch dimension and change to CHW format
-        image_array = np.transpose(image_array, (2, 0, 1))
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        return image_array
+    def _preprocess_image(self, image, session, model_key: str):
+        """Preprocess an IMAGE batch for WD14: layout and size from the model, white pad, area resize"""
+        spec = get_input_spec(session, model_key)
+        return preprocess_batch(image, spec)
+    
+    def _get_labels_path(self, model_name: str) -> str:
+        """Labels next to the model: <model>.csv, else selected_tags.csv"""
+        path = os.path.join(self.models_dir, f"{model_name}.csv")
+        return path if os.path.exists(path) else os.path.join(self.models_dir, "selected_tags.csv")
+    
+    def _load_labels(self, model_name: str) -> WD14Labels:
+        """Load or get cached labels (names + categories) for a model"""
+        path = self._get_labels_path(model_name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Labels for {model_name} not found ({path}). Please download selected_tags.csv.")
+        labels, _ = self.labels_cache.get_or_load(path, lambda: WD14Labels.from_csv(path))
+        return labels
     
     def _postprocess_predictions(
         self,
@@ -250,24 +195,10 @@ class EnhancedWD14TaggerNode:
         threshold: float = 0.35,
         character_threshold: float = 0.85
     ):
-        """Post-process model predictions to get tags"""
-        
-        # This is a placeholder - in a real implementation, you'd need the actual
-        # tag files and processing logic for the specific WD14 model
-        
-        # For demonstration, return placeholder tags
-        tags = [
-            "1girl", "solo", "long_hair", "looking_at_viewer", 
-            "blue_eyes", "blonde_hair", "white_background"
-        ]
-        
-        # In real implementation:
-        # 1. Load tag files (CSV with tag names)
-        # 2. Apply thresholds to predictions
-        # 3. Sort by confidence
-        # 4. Format output string
-        
-        return ", ".join(tags)
+        """Post-process model predictions to tags: one comma-separated line per image, ratings excluded"""
+        labels = self._load_labels(model_name)
+        selected = select_tags(predictions, labels, threshold, character_threshold, len(labels))
+        return "\n".join(", ".join(name for name, _ in tags) for tags, _ in selected)
     
     def tag_image(
         self,
@@ -277,7 +208,10 @@ class EnhancedWD14TaggerNode:
         character_threshold,
         provider_debug=False,
         provider_override="",
-        enable_profiling=False
+        enable_profiling=False,
+        intra_op_threads=0,
+        inter_op_threads=0,
+        execution_mode="sequential"
     ):
         """
         Main tagging function
@@ -296,11 +230,12 @@ class EnhancedWD14TaggerNode:
                 model_name=model,
                 provider_override=parsed_providers,
                 enable_debug=provider_debug,
-                enable_profiling=enable_profiling
+                settings=SessionSettings(intra_op_threads, inter_op_threads, execution_mode,
+                                         profiling=enable_profiling)
             )
             
             # Preprocess image
-            processed_image = self._preprocess_image(image)
+            processed_image = self._preprocess_image(image, session, self._get_model_path(model))
             self._log(f"Image preprocessed to shape: {processed_image.shape}", provider_debug)
             
             # Run inference
@@ -321,7 +256,7 @@ class EnhancedWD14TaggerNode:
             # Create provider info
             provider_info = f"Provider: {self._get_friendly_provider_name(self.current_provider)}"
             if enable_profiling:
-                provider_info += " | Profiling: Enabled"
+                provider_info += f" | Profile: {end_profiling(session)}"
             
             self._log(f"Tagging completed successfully", provider_debug)
             self._log(f"Generated {len(tags.split(','))} tags", provider_debug)
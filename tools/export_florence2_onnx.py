@@ -0,0 +1,217 @@
+"""
+Brains-XDEV Florence-2 ONNX Export
+
+Exports a Hugging Face Florence-2 checkpoint to the graphs used by the
+Florence-2 adapter's backend="onnx" mode (src/promptbrain/florence2_onnx.py):
+
+- vision_encoder.onnx     pixel_values -> image_features
+- embed_tokens.onnx       input_ids -> inputs_embeds
+- encoder.onnx            inputs_embeds, attention_mask -> last_hidden_state
+- decoder.onnx            first decoding step -> logits + self/cross key/value cache
+- decoder_with_past.onnx  later steps -> logits + updated self key/value cache
+
+plus tokenizer.json and florence2_onnx.json (preprocessing, special tokens,
+task prompts). Export needs torch + transformers; running the export does not.
+
+Usage:
+    python tools/export_florence2_onnx.py --model microsoft/Florence-2-base --out models/florence2-onnx/Florence-2-base
+    python tools/export_florence2_onnx.py --model microsoft/Florence-2-large --out models/florence2-onnx/Florence-2-large --verify image.png
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+OPSET = 17
+
+
+def load_model(model_id: str):
+    """float32 CPU processor + model with eager attention (traceable)"""
+    import torch
+    from transformers import AutoModelForCausalLM, AutoProcessor
+
+    processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id, trust_remote_code=True, torch_dtype=torch.float32, attn_implementation="eager"
+    ).eval()
+    return processor, model
+
+
+def build_wrappers(model):
+    """torch modules with flat tensor signatures for each exported graph"""
+    import torch
+
+    language_model = model.language_model
+
+    class VisionEncoder(torch.nn.Module):
+        def forward(self, pixel_values):
+            return model._encode_image(pixel_values)
+
+    class EmbedTokens(torch.nn.Module):
+        def forward(self, input_ids):
+            return model.get_input_embeddings()(input_ids)
+
+    class TextEncoder(torch.nn.Module):
+        def forward(self, inputs_embeds, attention_mask):
+            encoder = language_model.get_encoder()
+            return encoder(inputs_embeds=inputs_embeds, attention_mask=attention_mask, return_dict=True).last_hidden_state
+
+    class Decoder(torch.nn.Module):
+        def __init__(self, with_past: bool):
+            super().__init__()
+            self.with_past = with_past
+
+        def forward(self, input_ids, encoder_hidden_states, encoder_attention_mask, *past):
+            past_key_values = None
+            if past:
+                past_key_values = tuple(tuple(past[4 * i:4 * i + 4]) for i in range(len(past) // 4))
+            out = language_model.get_decoder()(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+            )
+            logits = language_model.lm_head(out.last_hidden_state) + language_model.final_logits_bias
+            presents = out.past_key_values
+            if hasattr(presents, "to_legacy_cache"):
+                presents = presents.to_legacy_cache()
+            flat = [logits]
+            for layer in presents:
+                # (self key, self value, cross key, cross value); cross is fixed after step one
+                flat.extend(layer[:2] if self.with_past else layer)
+            return tuple(flat)
+
+    return VisionEncoder(), EmbedTokens(), TextEncoder(), Decoder(False), Decoder(True)
+
+
+def kv_names(layers: int, prefix: str, parts=("decoder", "encoder")):
+    return [f"{prefix}.{i}.{part}.{kv}" for i in range(layers) for part in parts for kv in ("key", "value")]
+
+
+def export(model_id: str, out_dir: str):
+    import torch
+
+    processor, model = load_model(model_id)
+    language_model = model.language_model
+    layers = int(language_model.config.decoder_layers)
+    vision, embed, encoder, decoder, decoder_with_past = build_wrappers(model)
+    os.makedirs(out_dir, exist_ok=True)
+
+    size = processor.image_processor.size
+    height, width = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+    pixel_values = torch.zeros(1, 3, height, width)
+    input_ids = torch.tensor([processor.tokenizer("What does the image describe?")["input_ids"]])
+
+    def save(module, args, name, inputs, outputs, axes):
+        path = os.path.join(out_dir, f"{name}.onnx")
+        torch.onnx.export(module, args, path, input_names=inputs, output_names=outputs,
+                          dynamic_axes=axes, opset_version=OPSET, do_constant_folding=True)
+        print(f"exported {path}")
+
+    with torch.no_grad():
+        image_features = vision(pixel_values)
+        save(vision, (pixel_values,), "vision_encoder", ["pixel_values"], ["image_features"],
+             {"pixel_values": {0: "batch"}, "image_features": {0: "batch"}})
+
+        inputs_embeds = embed(input_ids)
+        save(embed, (input_ids,), "embed_tokens", ["input_ids"], ["inputs_embeds"],
+             {"input_ids": {0: "batch", 1: "sequence"}, "inputs_embeds": {0: "batch", 1: "sequence"}})
+
+        merged = torch.cat([image_features, inputs_embeds], dim=1)
+        mask = torch.ones(merged.shape[:2], dtype=torch.long)
+        hidden = encoder(merged, mask)
+        save(encoder, (merged, mask), "encoder", ["inputs_embeds", "attention_mask"], ["last_hidden_state"],
+             {"inputs_embeds": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+              "last_hidden_state": {0: "batch", 1: "sequence"}})
+
+        start = torch.full((1, 1), model.generation_config.decoder_start_token_id or 2, dtype=torch.long)
+        first = decoder(start, hidden, mask)
+        present = kv_names(layers, "present")
+        kv_axes = {name: {0: "batch", 2: "past"} for name in present}
+        save(decoder, (start, hidden, mask), "decoder",
+             ["input_ids", "encoder_hidden_states", "encoder_attention_mask"], ["logits"] + present,
+             {"input_ids": {0: "batch"}, "encoder_hidden_states": {0: "batch", 1: "encoder"},
+              "encoder_attention_mask": {0: "batch", 1: "encoder"}, "logits": {0: "batch"}, **kv_axes})
+
+        past = kv_names(layers, "past_key_values")
+        present_self = kv_names(layers, "present", ("decoder",))
+        past_axes = {name: {0: "batch", 2: "past" if ".decoder." in name else "encoder"} for name in past}
+        save(decoder_with_past, (start, hidden, mask, *first[1:]), "decoder_with_past",
+             ["input_ids", "encoder_hidden_states", "encoder_attention_mask"] + past, ["logits"] + present_self,
+             {"input_ids": {0: "batch"}, "encoder_hidden_states": {0: "batch", 1: "encoder"},
+              "encoder_attention_mask": {0: "batch", 1: "encoder"}, "logits": {0: "batch"},
+              **past_axes, **{name: {0: "batch", 2: "past"} for name in present_self}})
+
+    processor.tokenizer.save_pretrained(out_dir)
+    generation = model.generation_config
+    config = {
+        "model_id": model_id,
+        "image_size": [height, width],
+        "image_mean": list(processor.image_processor.image_mean),
+        "image_std": list(processor.image_processor.image_std),
+        "rescale_factor": float(processor.image_processor.rescale_factor),
+        "decoder_start_token_id": int(generation.decoder_start_token_id or 2),
+        "bos_token_id": int(processor.tokenizer.bos_token_id),
+        "eos_token_id": int(processor.tokenizer.eos_token_id),
+        "pad_token_id": int(processor.tokenizer.pad_token_id),
+        "forced_bos_token_id": getattr(generation, "forced_bos_token_id", None),
+        "no_repeat_ngram_size": int(getattr(generation, "no_repeat_ngram_size", 0) or 0),
+        "num_decoder_layers": layers,
+        "task_prompts_without_inputs": dict(getattr(processor, "task_prompts_without_inputs", {})),
+        "task_prompts_with_input": dict(getattr(processor, "task_prompts_with_input", {})),
+        "files": {name: f"{name}.onnx" for name in
+                  ("vision_encoder", "embed_tokens", "encoder", "decoder", "decoder_with_past")},
+    }
+    with open(os.path.join(out_dir, "florence2_onnx.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(f"wrote {out_dir}/florence2_onnx.json")
+    return processor, model
+
+
+def verify(processor, model, out_dir: str, image_path: str, max_new_tokens: int):
+    """Caption one image with transformers and with the export; print both and the ORT speedup"""
+    import time
+
+    import torch
+    from PIL import Image
+
+    from promptbrain.florence2_onnx import Florence2OnnxModel
+
+    image = Image.open(image_path).convert("RGB")
+    began = time.perf_counter()
+    inputs = processor(text="<CAPTION>", images=image, return_tensors="pt")
+    with torch.no_grad():
+        ids = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, num_beams=1)
+    reference = processor.batch_decode(ids, skip_special_tokens=True)[0].strip()
+    torch_seconds = time.perf_counter() - began
+
+    onnx_model = Florence2OnnxModel(out_dir)
+    onnx_model.caption([image], "<CAPTION>", max_new_tokens)
+    began = time.perf_counter()
+    caption = onnx_model.caption([image], "<CAPTION>", max_new_tokens)[0][0]
+    onnx_seconds = time.perf_counter() - began
+
+    print(f"transformers ({torch_seconds:.2f}s): {reference}")
+    print(f"onnxruntime  ({onnx_seconds:.2f}s): {caption}")
+    print("match" if caption == reference else "MISMATCH")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Florence-2 to ONNX for the adapter's onnx backend")
+    parser.add_argument("--model", default="microsoft/Florence-2-base", help="Florence-2 model id or path")
+    parser.add_argument("--out", default="models/florence2-onnx/Florence-2-base", help="Output directory")
+    parser.add_argument("--verify", default="", help="Image to caption with both backends after export")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Caption length for --verify")
+    args = parser.parse_args()
+
+    processor, model = export(args.model, args.out)
+    if args.verify:
+        verify(processor, model, args.out, args.verify, args.max_new_tokens)
+
+
+if __name__ == "__main__":
+    main()